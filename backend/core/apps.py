@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_save
+        from . import authentication
+        # Bump the cached principal of a user when the user or their account changes
+        for signal in (post_save, post_delete):
+            signal.connect(authentication.user_changed, sender=settings.AUTH_USER_MODEL)
+            signal.connect(authentication.account_changed, sender='transactions.Account')
+
+        if settings.METRICS_ENABLED:
+            from django.db.backends.signals import connection_created
+            from . import metrics
+            connection_created.connect(metrics.install_db_wrapper)
+            metrics.instrument_caches()
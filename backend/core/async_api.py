@@ -0,0 +1,111 @@
+"""
+Async counterparts of the DRF view plumbing, for read endpoints.
+
+DRF views are synchronous, so under ASGI every request holds a thread for its
+whole duration. Views wrapped with `async_api_view` run on the event loop
+instead: the wrapper authenticates the JWT (or session), checks the admin
+permission and the rate limit, and the view then awaits Django's async ORM
+and cache API. Error responses have the same JSON bodies and headers as DRF's.
+Like an APIView, a view answers HEAD as GET and OPTIONS with its metadata.
+"""
+import math
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils.formatting import camelcase_to_spaces, dedent
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .ratelimit import alimit
+
+NOT_AUTHENTICATED = 'Authentication credentials were not provided.'
+PERMISSION_DENIED = 'You do not have permission to perform this action.'
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False)
+
+
+def _unauthorized(detail):
+    response = json_response(detail if isinstance(detail, dict) else {'detail': detail}, status=401)
+    response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+def _options(view_func, allowed):
+    """The body DRF's SimpleMetadata gives an OPTIONS request."""
+    response = json_response({
+        'name': camelcase_to_spaces(view_func.__name__.strip('_')),
+        'description': dedent(view_func.__doc__ or ''),
+        'renders': ['application/json'],
+        'parses': [parser.media_type for parser in api_settings.DEFAULT_PARSER_CLASSES],
+    })
+    response['Allow'] = ', '.join(allowed)
+    return response
+
+
+def _throttled(wait):
+    response = json_response({'detail': f'Request was throttled. Expected available in {math.ceil(wait)} seconds.'}, status=429)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+async def aauthenticate(request):
+    """
+    The user a request is authenticated as, or None.
+
+    Tries the JWT in the Authorization header first, resolving it to a cached
+    Principal, then the session, like the DRF authentication classes. Raises
+    AuthenticationFailed for a bad token.
+    """
+    authentication = CachedJWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        user = await sync_to_async(get_user)(request)
+        return user if user.is_authenticated else None
+
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    return await authentication.aget_user(authentication.get_validated_token(raw_token))
+
+
+def async_api_view(methods=('GET',), admin=False):
+    """
+    Decorator for async views, standing in for @api_view, @permission_classes
+    and the rate limit throttle (core.ratelimit).
+
+    The authenticated user is set on `request.user` before the view runs.
+    """
+    allowed = [*methods, *(['HEAD'] if 'GET' in methods else []), 'OPTIONS']
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                response = json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+                response['Allow'] = ', '.join(allowed)
+                return response
+
+            try:
+                user = await aauthenticate(request)
+            except AuthenticationFailed as e:
+                return _unauthorized(e.detail)
+            if user is None:
+                return _unauthorized(NOT_AUTHENTICATED)
+            if admin and not user.is_staff:
+                return json_response({'detail': PERMISSION_DENIED}, status=403)
+            request.user = user
+
+            wait = await alimit(request)
+            if wait is not None:
+                return _throttled(wait)
+
+            if request.method == 'OPTIONS':
+                return _options(view_func, allowed)
+            # HEAD runs the GET view, the server leaves out the body
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
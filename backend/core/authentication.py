@@ -0,0 +1,171 @@
+"""
+JWT authentication from a cached principal.
+
+simplejwt's JWTAuthentication loads the user row on every request.
+CachedJWTAuthentication resolves the token's user id to a `Principal` instead:
+the user id, is_staff, is_active and account id, cached under the user's
+namespace (`user_<id>`). The namespace generation is the principal's version
+stamp; it is bumped once a change to the user, or the creation or deletion of
+their account, commits. A warm principal therefore costs no database query,
+and normally no network round trip either, as its key and the generation are
+kept in the in-process cache.
+
+Updates that bypass model signals (QuerySet.update) are picked up when the
+principal expires after PRINCIPAL_TTL seconds.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db.models import Model
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .tiered_cache import cache
+from .utils import anamespaced_key, bump_namespace_on_commit, namespaced_key
+
+PRINCIPAL_TTL = 300
+
+FIELDS = ('id', 'is_staff', 'is_active', 'account__id')
+
+
+class Principal:
+    """
+    The authenticated user as far as authentication, permissions and
+    ownership checks need it.
+
+    It carries no other user fields: code that needs the model instance loads
+    it explicitly with `load_user()` / `aload_user()` (or the module-level
+    functions of the same name, which also accept a User). Compare ids rather
+    than instances.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, id, is_staff, is_active, account_id):
+        self.id = id
+        self.is_staff = is_staff
+        self.is_active = is_active
+        self.account_id = account_id
+        self._user = None
+
+    @property
+    def pk(self):
+        return self.id
+
+    def load_user(self):
+        """The user row, read once per principal."""
+        if self._user is None:
+            self._user = get_user_model().objects.get(pk=self.id)
+        return self._user
+
+    async def aload_user(self):
+        if self._user is None:
+            self._user = await get_user_model().objects.aget(pk=self.id)
+        return self._user
+
+    def __eq__(self, other):
+        if isinstance(other, Principal):
+            return other.id == self.id
+        if isinstance(other, Model):
+            return other._meta.concrete_model is get_user_model() and other.pk == self.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return f'user {self.id}'
+
+
+def load_user(user):
+    """The model instance of an authenticated user, a Principal or already a User."""
+    return user.load_user() if isinstance(user, Principal) else user
+
+
+async def aload_user(user):
+    return await user.aload_user() if isinstance(user, Principal) else user
+
+
+def user_namespace(user_id):
+    return f'user_{user_id}'
+
+
+def principal_key(user_id):
+    return namespaced_key(f'principal_{user_id}', [user_namespace(user_id)])
+
+
+def _principal(row):
+    return Principal(row['id'], row['is_staff'], row['is_active'], row['account__id'])
+
+
+def _rows(user_id):
+    return get_user_model().objects.filter(pk=user_id).values(*FIELDS)
+
+
+def get_principal(user_id):
+    """The cached principal of a user, None if there is no such user."""
+    key = principal_key(user_id)
+    row = cache.get(key)
+    if row is None:
+        row = _rows(user_id).first()
+        if row is None:
+            return None
+        cache.set(key, row, PRINCIPAL_TTL)
+    return _principal(row)
+
+
+async def aget_principal(user_id):
+    key = await anamespaced_key(f'principal_{user_id}', [user_namespace(user_id)])
+    row = await sync_to_async(cache.get, thread_sensitive=False)(key)
+    if row is None:
+        row = await _rows(user_id).afirst()
+        if row is None:
+            return None
+        await sync_to_async(cache.set, thread_sensitive=False)(key, row, PRINCIPAL_TTL)
+    return _principal(row)
+
+
+def invalidate_principal(user_id):
+    """Bump the user's principal version once the current write commits."""
+    bump_namespace_on_commit(user_namespace(user_id))
+
+
+def user_changed(sender, instance, **kwargs):
+    """post_save / post_delete receiver for the user model."""
+    invalidate_principal(instance.pk)
+
+
+def account_changed(sender, instance, created=True, **kwargs):
+    """post_save / post_delete receiver for accounts; only creation and deletion change a principal."""
+    if created:
+        invalidate_principal(instance.user_id)
+
+
+def _user_id(validated_token):
+    try:
+        return validated_token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+
+
+def _check(principal):
+    if principal is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not principal.is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return principal
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that authenticates requests as a cached `Principal`."""
+
+    def get_user(self, validated_token):
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            # Revocation compares the token with the password hash, which is not cached
+            return super().get_user(validated_token)
+        return _check(get_principal(_user_id(validated_token)))
+
+    async def aget_user(self, validated_token):
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            return await sync_to_async(super().get_user)(validated_token)
+        return _check(await aget_principal(_user_id(validated_token)))
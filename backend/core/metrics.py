@@ -0,0 +1,261 @@
+"""
+Per-request performance instrumentation.
+
+MetricsMiddleware times every request and profiles a sample of them in
+detail (`settings.METRICS_SAMPLE_RATE`). The profile is held in a context
+variable, so it follows the request into sync_to_async threads. It is filled
+in by two hooks that cost one context lookup when no profile is active:
+
+- an execute wrapper on every database connection, which counts queries and
+  their time and adds the time of SELECT ... FOR UPDATE queries to the lock
+  wait, the time the engine's atomic blocks spend waiting for row locks;
+- wrappers around the cache backends' methods, which count calls, hits,
+  misses and their time (this includes the rate limiter's counters).
+
+A request's profile is shared by every thread it runs code in (views
+gather sync_to_async calls concurrently), so it is updated under a lock.
+Every metric below has a lock of its own too.
+
+Profiled requests get a Server-Timing header. Totals are kept per view in
+Prometheus histograms, served in the text format by `/metrics`. The numbers
+belong to the process that serves them, so scrape every worker process.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+from bisect import bisect_left
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Cache methods that are timed; reads also count hits and misses
+CACHE_METHODS = ('get', 'get_many', 'set', 'set_many', 'add', 'delete', 'delete_many', 'incr', 'decr', 'touch', 'has_key')
+
+_MISSING = object()
+
+
+class Profile:
+    __slots__ = ('db_queries', 'db_time', 'lock_time', 'cache_calls', 'cache_hits', 'cache_misses', 'cache_time', '_lock')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.lock_time = 0.0
+        self.cache_calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_time = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, elapsed, locking):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time += elapsed
+            if locking:
+                self.lock_time += elapsed
+
+    def add_cache_call(self, elapsed, hits=0, misses=0):
+        with self._lock:
+            self.cache_calls += 1
+            self.cache_hits += hits
+            self.cache_misses += misses
+            self.cache_time += elapsed
+
+
+_profile = ContextVar('request_profile', default=None)
+# Set while a cache call runs, so backends built on their own get() count once.
+# A context variable rather than a profile field, as each thread has its own.
+_in_cache = ContextVar('in_cache_call', default=False)
+
+
+def start(sampled):
+    """Begin a request. Returns the context token to pass to `finish`."""
+    return _profile.set(Profile() if sampled else None)
+
+
+def current():
+    return _profile.get()
+
+
+def finish(token):
+    _profile.reset(token)
+
+
+def should_sample():
+    return random.random() < settings.METRICS_SAMPLE_RATE
+
+
+def db_wrapper(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(time.perf_counter() - started, 'FOR UPDATE' in sql)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver that adds `db_wrapper` to the connection."""
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+def _timed(method, name):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None or _in_cache.get():
+            return method(*args, **kwargs)
+        token = _in_cache.set(True)
+        hits = misses = 0
+        started = time.perf_counter()
+        try:
+            if name == 'get':
+                key, default = args[0], args[1] if len(args) > 1 else kwargs.pop('default', None)
+                value = method(key, _MISSING, *args[2:], **kwargs)
+                if value is _MISSING:
+                    misses = 1
+                    return default
+                hits = 1
+                return value
+            result = method(*args, **kwargs)
+            if name == 'get_many':
+                hits = len(result)
+                misses = len(args[0]) - len(result)
+            return result
+        finally:
+            profile.add_cache_call(time.perf_counter() - started, hits, misses)
+            _in_cache.reset(token)
+    return wrapper
+
+
+def instrument_cache(backend):
+    for name in CACHE_METHODS:
+        method = getattr(backend, name, None)
+        if method is not None:
+            setattr(backend, name, _timed(method, name))
+    return backend
+
+
+def instrument_caches():
+    """Instrument every cache backend as Django creates it."""
+    create_connection = caches.create_connection
+
+    def create_instrumented(alias):
+        return instrument_cache(create_connection(alias))
+    caches.create_connection = create_instrumented
+
+
+def _labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{{{_labels(zip(self.label_names, labels))}}} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # view -> [count per bucket (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(view)
+            if counts is None:
+                counts = self._values[view] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][index] += 1
+            counts[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((view, list(counts), total) for view, (counts, total) in self._values.items())
+        for view, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+REQUESTS = Counter('nissmart_http_requests_total', 'Requests by view and status code.', ('view', 'status'))
+DURATION = Histogram('nissmart_http_request_duration_seconds', 'Time to the response, all requests.')
+DB_QUERIES = Histogram('nissmart_db_queries_per_request', 'Database queries per profiled request.', QUERY_BUCKETS)
+DB_TIME = Histogram('nissmart_db_duration_seconds', 'Database time per profiled request.')
+LOCK_WAIT = Histogram('nissmart_db_lock_wait_seconds', 'SELECT ... FOR UPDATE time per profiled request.')
+CACHE_TIME = Histogram('nissmart_cache_duration_seconds', 'Cache time per profiled request.')
+CACHE_REQUESTS = Counter('nissmart_cache_requests_total', 'Cache reads of profiled requests by result.', ('view', 'result'))
+CACHED_RESULTS = Counter(
+    'nissmart_cached_results_total',
+    'core.utils.cached_call lookups by key prefix and result (hit, miss, stale, refresh, coalesced).',
+    ('prefix', 'result')
+)
+L1_CACHE = Counter('nissmart_l1_cache_total', 'In-process cache lookups by key prefix and result.', ('prefix', 'result'))
+RATE_LIMITS = Counter(
+    'nissmart_rate_limit_total',
+    'Rate limit decisions by policy, result (allowed, limited) and bucket store (redis, local).',
+    ('policy', 'result', 'store')
+)
+METRICS = (
+    REQUESTS, DURATION, DB_QUERIES, DB_TIME, LOCK_WAIT, CACHE_TIME, CACHE_REQUESTS, CACHED_RESULTS, L1_CACHE, RATE_LIMITS
+)
+
+
+def record(view, status, elapsed, profile=None):
+    REQUESTS.inc((view, str(status)))
+    DURATION.observe(view, elapsed)
+    if profile is not None:
+        DB_QUERIES.observe(view, profile.db_queries)
+        DB_TIME.observe(view, profile.db_time)
+        LOCK_WAIT.observe(view, profile.lock_time)
+        CACHE_TIME.observe(view, profile.cache_time)
+        CACHE_REQUESTS.inc((view, 'hit'), profile.cache_hits)
+        CACHE_REQUESTS.inc((view, 'miss'), profile.cache_misses)
+
+
+def server_timing(profile, elapsed):
+    """Server-Timing header value for a profiled request. Durations are in milliseconds."""
+    other = max(elapsed - profile.db_time - profile.cache_time, 0)
+    return ', '.join([
+        f'db;dur={profile.db_time * 1000:.2f};desc="{profile.db_queries} queries"',
+        f'lock;dur={profile.lock_time * 1000:.2f}',
+        f'cache;dur={profile.cache_time * 1000:.2f};desc="{profile.cache_hits} hits, {profile.cache_misses} misses"',
+        f'app;dur={other * 1000:.2f}',
+        f'total;dur={elapsed * 1000:.2f}',
+    ])
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
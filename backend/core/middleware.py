@@ -0,0 +1,59 @@
+"""
+Request instrumentation middleware.
+"""
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Times every request and profiles a sample of them, see core.metrics.
+
+    Works with sync and async views alike, so async views are not pushed
+    onto a thread to get through it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = metrics.start(metrics.should_sample())
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            metrics.finish(token)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = metrics.start(metrics.should_sample())
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            metrics.finish(token)
+
+    def _finish(self, request, response, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        profile = metrics.current()
+        metrics.record(view, response.status_code, elapsed, profile)
+        if profile is not None:
+            response['Server-Timing'] = metrics.server_timing(profile, elapsed)
+        return response
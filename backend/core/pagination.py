@@ -0,0 +1,157 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Pages are ordered newest first on (created_at, id) and positioned with an
+opaque cursor instead of an OFFSET, so page 1000 costs the same as page 1.
+A page can be assembled from several disjoint querysets (e.g. the source and
+destination side of an account's history) so that each one is served by its
+own (account, created_at) index instead of an OR across two columns.
+Querysets may yield model instances or `.values()` rows that include
+`created_at` and `id`. Rows moved to an archive table can be passed as
+`archive` querysets, which are only read once a page reaches back to them.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+from django.db import connection
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def _position(obj):
+    """(created_at, pk) of a model instance or of a `.values()` row."""
+    if isinstance(obj, dict):
+        return obj['created_at'], obj['id']
+    return obj.created_at, obj.pk
+
+
+def encode_cursor(obj, direction):
+    """Build an opaque cursor pointing just past `obj` in the given direction."""
+    created_at, pk = _position(obj)
+    payload = json.dumps({
+        'c': created_at.isoformat(),
+        'i': str(pk),
+        'd': direction,
+    }, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, created_at, pk) for a cursor produced by encode_cursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = payload['d']
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(payload['c']), payload['i']
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def _fetch(querysets, direction, created_at, pk, page_size):
+    """Up to page_size + 1 rows of each queryset past the cursor position."""
+    fetched = []
+    for queryset in querysets:
+        if direction == 'next':
+            if created_at is not None:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+            queryset = queryset.order_by('-created_at', '-pk')
+        else:
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            ).order_by('created_at', 'pk')
+        fetched.append(list(queryset[:page_size + 1]))
+    return fetched
+
+
+def _merge(fetched, direction, page_size):
+    rows = []
+    for row in heapq.merge(*fetched, key=_position, reverse=direction == 'next'):
+        # A row moved to the archive while the page was read can show up on both sides
+        if rows and _position(rows[-1]) == _position(row):
+            continue
+        rows.append(row)
+        if len(rows) > page_size:
+            break
+    return rows
+
+
+def _reaches(rows, direction, created_at, page_size, archived_until):
+    """Whether a page read from the live querysets may continue into rows archived up to `archived_until`."""
+    if archived_until is None:
+        return False
+    if direction == 'prev':
+        return created_at <= archived_until
+    return len(rows) <= page_size or _position(rows[-1])[0] <= archived_until
+
+
+def paginate(querysets, cursor=None, page_size=50, archive=(), archived_until=None):
+    """
+    Return one page of objects from one or more disjoint querysets.
+
+    The result is a dict with `results` (newest first) and opaque `next` /
+    `previous` cursors (None when there is nothing in that direction).
+
+    `archive` querysets hold rows moved out of `querysets`; `archived_until`
+    is a callable returning the creation time of the newest archived row (None
+    while there is none). It is called after the live rows are read, so a row
+    archived meanwhile is seen on one side or the other, and the archive is
+    only read when the page reaches back to that time.
+    """
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+
+    direction, created_at, pk = ('next', None, None)
+    if cursor:
+        direction, created_at, pk = decode_cursor(cursor)
+
+    fetched = _fetch(querysets, direction, created_at, pk, page_size)
+    rows = _merge(fetched, direction, page_size)
+    if archive and _reaches(rows, direction, created_at, page_size, archived_until()):
+        fetched.extend(_fetch(archive, direction, created_at, pk, page_size))
+        rows = _merge(fetched, direction, page_size)
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'prev':
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if direction == 'next':
+            next_cursor = encode_cursor(rows[-1], 'next') if has_more else None
+            previous_cursor = encode_cursor(rows[0], 'prev') if cursor else None
+        else:
+            next_cursor = encode_cursor(rows[-1], 'next')
+            previous_cursor = encode_cursor(rows[0], 'prev') if has_more else None
+
+    return {
+        'results': rows,
+        'next': next_cursor,
+        'previous': previous_cursor,
+    }
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count estimate for a queryset.
+
+    On PostgreSQL this reads the planner's row estimate from EXPLAIN instead
+    of running COUNT(*). Other backends fall back to an exact count.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
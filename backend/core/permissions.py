@@ -15,9 +15,9 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         
         # Write permissions are only allowed to the owner
         if hasattr(obj, 'user'):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         if hasattr(obj, 'account') and hasattr(obj.account, 'user'):
-            return obj.account.user == request.user
+            return obj.account.user_id == request.user.id
         return False
 
 
@@ -37,8 +37,8 @@ class IsAccountOwner(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         if hasattr(obj, 'user'):
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         if hasattr(obj, 'account') and hasattr(obj.account, 'user'):
-            return obj.account.user == request.user
+            return obj.account.user_id == request.user.id
         return False
 
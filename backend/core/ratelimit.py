@@ -0,0 +1,200 @@
+"""
+Token-bucket rate limiting.
+
+Every request draws one token from two buckets: its client's (per user, or
+per IP for anonymous requests, `RATE_LIMITS['USER']` / `['ANON']`) and its
+endpoint's (`RATE_LIMITS['ENDPOINTS']`, by URL name). A rate of
+'count/period' holds at most `count` tokens and refills `count` of them per
+period, so a client can burst up to the limit and then continues at the rate.
+
+On Redis all buckets of a request are checked and drawn from in one script
+call, a single round trip that is atomic across processes. When the cache is
+not Redis, or Redis cannot be reached, the buckets are kept in process; Redis
+is tried again after REDIS_RETRY seconds.
+
+DRF views are limited by `RateLimitThrottle` (DEFAULT_THROTTLE_CLASSES),
+async views by core.async_api; both answer 429 with a Retry-After header.
+Set RATELIMIT_ENABLE = False to switch limiting off.
+"""
+import logging
+import threading
+import time
+from functools import lru_cache
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .tiered_cache import LocalLRU
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+REDIS_RETRY = 5  # seconds in-process buckets are used after a Redis error
+
+LOCAL_MAX_BUCKETS = 10000
+
+# KEYS are the buckets, ARGV their capacity and refill per millisecond in turn.
+# Returns 0 when a token was drawn from every bucket, else the milliseconds until one can be.
+_TAKE = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local refill = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = capacity
+    if bucket[1] then
+        tokens = math.min(capacity, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * refill)
+    end
+    if tokens < 1 then
+        wait = math.max(wait, math.ceil((1 - tokens) / refill))
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local refill = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'ts', now)
+    -- A bucket that would be full again holds nothing worth keeping
+    redis.call('PEXPIRE', key, math.ceil((capacity - levels[i] + 1) / refill))
+end
+return 0
+"""
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """(capacity, refill per millisecond) of a 'count/period' rate such as '50/h' or '100/hour'."""
+    count, _, period = rate.partition('/')
+    try:
+        count = int(count)
+        seconds = PERIODS[period[:1]]
+    except (ValueError, KeyError):
+        raise ValueError(f'Invalid rate {rate!r}, expected count/period with a period of s, m, h or d')
+    return count, count / (seconds * 1000)
+
+
+def _identity(request, key):
+    user = getattr(request, 'user', None)
+    if key == 'user' and user is not None and user.is_authenticated:
+        return f'user:{user.id}'
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+def buckets(request):
+    """(name, key, capacity, refill) of each bucket the request draws from."""
+    config = settings.RATE_LIMITS
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        client = ('user', _identity(request, 'user'), config['USER'])
+    else:
+        client = ('anon', _identity(request, 'ip'), config['ANON'])
+    policies = [client]
+
+    match = getattr(request, 'resolver_match', None)
+    endpoint = config['ENDPOINTS'].get(match.view_name) if match else None
+    if endpoint:
+        policies.append((match.view_name, _identity(request, endpoint.get('key', 'user')), endpoint['rate']))
+
+    return [(name, f'ratelimit:{name}:{identity}', *parse_rate(rate)) for name, identity, rate in policies]
+
+
+class LocalBuckets:
+    """In-process token buckets with the same semantics as the Redis script."""
+
+    def __init__(self, max_entries=LOCAL_MAX_BUCKETS):
+        self._buckets = LocalLRU(max_entries)
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """Draw a token from every bucket; returns 0, or the milliseconds until that is possible."""
+        now = time.time() * 1000
+        with self._lock:
+            levels = []
+            wait = 0
+            for _, key, capacity, refill in buckets:
+                state = self._buckets.get(key)
+                tokens = capacity
+                if isinstance(state, tuple):
+                    tokens = min(capacity, state[0] + (now - state[1]) * refill)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / refill)
+                levels.append(tokens)
+            if wait > 0:
+                return wait
+            for (_, key, capacity, refill), tokens in zip(buckets, levels):
+                self._buckets.set(key, (tokens - 1, now), (capacity - tokens + 1) / refill / 1000)
+            return 0
+
+
+_local = LocalBuckets()
+_script = None
+_redis_retry_at = 0.0
+
+
+def _redis_script():
+    """The compiled bucket script when the cache is Redis, else None."""
+    global _script
+    if _script is None:
+        try:
+            from django_redis import get_redis_connection
+            _script = get_redis_connection('default').register_script(_TAKE)
+        except (ImportError, NotImplementedError):
+            _script = False
+    return _script or None
+
+
+def _take(buckets):
+    """(milliseconds to wait, store) after drawing from the buckets in Redis, or in process without it."""
+    global _redis_retry_at
+    script = _redis_script()
+    if script is not None and time.monotonic() >= _redis_retry_at:
+        args = []
+        for _, _, capacity, refill in buckets:
+            args += [capacity, refill]
+        try:
+            make_key = caches['default'].make_key
+            return script(keys=[make_key(bucket[1]) for bucket in buckets], args=args), 'redis'
+        except Exception as e:
+            logger.warning(f"Rate limiting in process for {REDIS_RETRY}s, Redis failed: {e}")
+            _redis_retry_at = time.monotonic() + REDIS_RETRY
+    return _local.take(buckets), 'local'
+
+
+def limit(request):
+    """
+    Draw the request's tokens. Returns None when it may proceed, else the
+    seconds until it would be allowed.
+    """
+    if not settings.RATELIMIT_ENABLE:
+        return None
+    request_buckets = buckets(request)
+    wait, store = _take(request_buckets)
+    # Labelled with the most specific policy, the endpoint's when there is one
+    metrics.RATE_LIMITS.inc((request_buckets[-1][0], 'limited' if wait else 'allowed', store))
+    return wait / 1000 if wait else None
+
+
+async def alimit(request):
+    if not settings.RATELIMIT_ENABLE:
+        return None
+    return await sync_to_async(limit, thread_sensitive=False)(request)
+
+
+class RateLimitThrottle(BaseThrottle):
+    """DRF throttle backed by `limit`, replacing the anon and user rate throttles."""
+
+    def allow_request(self, request, view):
+        self._wait = limit(request)
+        return self._wait is None
+
+    def wait(self):
+        return self._wait
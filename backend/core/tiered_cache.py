@@ -0,0 +1,257 @@
+"""
+Two-tier cache: an in-process LRU in front of CACHES['default'].
+
+`cache` is used like django.core.cache.cache. Reads of keys whose prefix is
+listed in `settings.L1_CACHE['PREFIXES']` are answered from a bounded
+in-process LRU, which saves the round trip to Redis and unpickling and
+decompressing the value. Writes go to the shared cache and update or evict
+the local copy. Keys with other prefixes go straight to the shared cache.
+
+Each prefix sets how long a value may be kept in process (`ttl`; 0 opts the
+prefix out) and whether changes are broadcast (`broadcast`). Broadcast
+changes are published over Redis pub/sub, and every process drops its local
+copy of those keys. Keys that are never overwritten, such as keys carrying a
+namespace generation, do not need broadcasts. The TTL bounds how long a
+process can serve a value that a missed or raced invalidation left behind.
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of (value, expires_at) bounded by entry count."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.origin = uuid.uuid4().hex
+        self._local = None
+        self._policies = None
+        self._has_redis = None
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        # Django keeps a cache backend per thread, so look it up on every use
+        return caches[self.alias]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalLRU(settings.L1_CACHE['MAX_ENTRIES'])
+        return self._local
+
+    def policy(self, key):
+        """(prefix, ttl, broadcast) of a key, or None when it bypasses the local tier."""
+        if self._policies is None:
+            config = settings.L1_CACHE
+            prefixes = config['PREFIXES'] if config['ENABLED'] else {}
+            # Longest prefix first, so a specific prefix can override a general one
+            self._policies = sorted(
+                ((prefix, policy.get('ttl', 0), policy.get('broadcast', False)) for prefix, policy in prefixes.items()),
+                key=lambda policy: -len(policy[0])
+            )
+        for policy in self._policies:
+            if key.startswith(policy[0]):
+                return policy if policy[1] > 0 else None
+        return None
+
+    def _keep(self, key, value, ttl, timeout=DEFAULT_TIMEOUT):
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl > 0:
+            self.local.set(key, value, ttl)
+            self._listen()
+
+    def get(self, key, default=None, version=None):
+        policy = self.policy(key)
+        if policy is None:
+            return self.shared.get(key, default, version=version)
+        value = self.local.get(key)
+        if value is not _MISSING:
+            metrics.L1_CACHE.inc((policy[0], 'hit'))
+            return value
+        metrics.L1_CACHE.inc((policy[0], 'miss'))
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._keep(key, value, policy[1])
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            policy = self.policy(key)
+            value = self.local.get(key) if policy is not None else _MISSING
+            if value is not _MISSING:
+                metrics.L1_CACHE.inc((policy[0], 'hit'))
+                found[key] = value
+            else:
+                if policy is not None:
+                    metrics.L1_CACHE.inc((policy[0], 'miss'))
+                remote.append(key)
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                policy = self.policy(key)
+                if policy is not None:
+                    self._keep(key, value, policy[1])
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        policy = self.policy(key)
+        if policy is not None:
+            self._keep(key, value, policy[1], timeout)
+            if policy[2]:
+                self.broadcast(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._changed(key)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            return self.shared.incr(key, delta, version=version)
+        finally:
+            self._changed(key)
+
+    def delete(self, key, version=None):
+        try:
+            return self.shared.delete(key, version=version)
+        finally:
+            self._changed(key)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        try:
+            return self.shared.delete_many(keys, version=version)
+        finally:
+            self._changed(*keys)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def _changed(self, *keys):
+        tracked = [key for key in keys if self.policy(key) is not None]
+        if not tracked:
+            return
+        self.local.delete(*tracked)
+        broadcast = [key for key in tracked if self.policy(key)[2]]
+        if broadcast:
+            self.broadcast(*broadcast)
+
+    def __getattr__(self, name):
+        # Everything else (make_key, touch, async methods, ...) is served by the shared tier
+        return getattr(self.shared, name)
+
+    @property
+    def _redis(self):
+        """Redis client of the shared tier, None when it is not django-redis."""
+        if self._has_redis is False:
+            return None
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection(self.alias)
+        except (ImportError, NotImplementedError):
+            client = None
+        self._has_redis = client is not None
+        return client
+
+    def broadcast(self, *keys):
+        """Tell every process to drop its local copy of these keys."""
+        client = self._redis
+        if client is None:
+            return
+        try:
+            client.publish(settings.L1_CACHE['CHANNEL'], json.dumps({'origin': self.origin, 'keys': keys}))
+        except Exception as e:
+            logger.warning(f"L1 cache invalidation of {len(keys)} keys not published: {e}")
+
+    def _listen(self):
+        """Start the invalidation listener of this process, once there is something to invalidate."""
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                if self._redis is None:
+                    # Nothing to listen to, a single process has nothing to hear about
+                    self._listener = False
+                    return
+                self._listener = threading.Thread(target=self._receive, name='l1-cache-invalidation', daemon=True)
+                self._listener.start()
+
+    def _receive(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(settings.L1_CACHE['CHANNEL'])
+                # Anything may have changed while nobody was listening
+                self.local.clear()
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    if payload['origin'] != self.origin:
+                        self.local.delete(*payload['keys'])
+            except Exception as e:
+                logger.warning(f"L1 cache invalidation subscription lost, reconnecting: {e}")
+                self.local.clear()
+                time.sleep(1)
+
+
+cache = TieredCache()
@@ -1,59 +1,250 @@
 """
 Core utility functions and helpers.
 """
-from functools import wraps
-from django.core.cache import cache
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time as time_module
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import partial, wraps
+from uuid import UUID
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
 from rest_framework.response import Response
 from rest_framework import status
 
+from . import metrics
+from .tiered_cache import cache
 
-def cache_result(timeout=300, key_prefix=''):
+logger = logging.getLogger(__name__)
+
+
+GLOBAL_NAMESPACE = 'global'
+
+# Marks a cache miss, so cached falsy values are told apart from missing ones
+_MISSING = object()
+
+
+def _namespace_key(namespace):
+    return f'ns_{namespace}'
+
+
+def get_namespace_versions(namespaces):
+    """
+    Current generation of each namespace, fetched in one cache round trip.
+
+    A namespace without a generation (never used, evicted or bumped in bulk)
+    starts at a random one, so entries written under an older generation can
+    never become visible again.
+    """
+    keys = {namespace: _namespace_key(namespace) for namespace in namespaces}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    for namespace, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, random.getrandbits(48), timeout=None)
+            version = cache.get(key)
+        versions[namespace] = version
+    return versions
+
+
+def namespaced_key(key, namespaces=()):
+    """
+    Build a cache key tagged with the generation of each namespace.
+
+    Every key also carries the global generation, so bump_namespace('global')
+    invalidates the whole cache.
+    """
+    namespaces = [GLOBAL_NAMESPACE, *namespaces]
+    versions = get_namespace_versions(namespaces)
+    tag = '.'.join(f'{versions[namespace]}' for namespace in namespaces)
+    return f'{key}:v{tag}'
+
+
+def bump_namespace(*namespaces):
+    """
+    Invalidate every key in the given namespaces.
+
+    A single namespace is bumped with one INCR. Several namespaces are dropped
+    with one DELETE_MANY; their next reader starts a fresh random generation.
+    """
+    if not namespaces:
+        return
+    if len(namespaces) == 1:
+        try:
+            cache.incr(_namespace_key(namespaces[0]))
+        except ValueError:
+            # No generation stored, the next reader starts a fresh one anyway
+            pass
+        return
+    cache.delete_many([_namespace_key(namespace) for namespace in namespaces])
+
+
+def bump_namespace_on_commit(*namespaces):
+    """
+    Bump namespaces once the current database transaction commits.
+
+    Bumping before commit would let a concurrent reader cache pre-commit data
+    under the new generation.
+    """
+    transaction.on_commit(partial(bump_namespace, *namespaces))
+
+
+def _resolve_namespaces(namespaces, *args, **kwargs):
+    if namespaces is None:
+        return ()
+    if callable(namespaces):
+        namespaces = namespaces(*args, **kwargs)
+    if isinstance(namespaces, str):
+        return (namespaces,)
+    return tuple(namespaces)
+
+
+def _key_part(value):
+    """JSON representation of values json.dumps does not handle itself."""
+    if hasattr(value, '_meta') and hasattr(value, 'pk'):
+        return f'{value._meta.label}:{value.pk}'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=repr)
+    raise TypeError(f'{type(value).__name__} cannot be part of a cache key')
+
+
+def make_key(prefix, *args, **kwargs):
+    """
+    Cache key for a call with these arguments.
+
+    The arguments are serialised canonically and hashed, so keys have a
+    bounded length and do not depend on reprs. Model instances stand for
+    their primary key.
+    """
+    payload = json.dumps([args, kwargs], default=_key_part, sort_keys=True, separators=(',', ':'))
+    return f'{prefix}:{hashlib.sha256(payload.encode()).hexdigest()[:32]}'
+
+
+def _count(prefix, result):
+    metrics.CACHED_RESULTS.inc((prefix, result))
+
+
+def cached_call(key, compute, timeout=300, stale_ttl=0, lock_timeout=10, beta=1.0, prefix=None):
+    """
+    Cached result of `compute()` under `key`, computed at most once at a time.
+
+    Values are stored with their expiry and the time they took to compute,
+    so a cached None or other falsy result is a hit like any other. On a
+    miss one caller takes a short lock (`cache.add`) and computes the value
+    while the others wait for it, then compute it themselves only if it
+    does not arrive within `lock_timeout` seconds.
+
+    Before a value expires it is refreshed early with a probability that
+    grows as expiry approaches and with its compute time ("XFetch", tuned by
+    `beta`). With `stale_ttl`, an expired value is kept that much longer and
+    served to everyone except the one caller refreshing it. Lookups are
+    counted per `prefix` (the key up to its first colon by default) on
+    /metrics.
+    """
+    prefix = prefix or key.split(':', 1)[0]
+    entry = cache.get(key, _MISSING)
+    if entry is not _MISSING:
+        value, expires_at, delta = entry
+        now = time_module.time()
+        if expires_at is None or now - delta * beta * math.log(random.random() or 1e-12) < expires_at:
+            _count(prefix, 'hit')
+            return value
+        # Expired, or chosen for early refresh: one caller recomputes, the rest keep using the value
+        acquired = cache.add(f'{key}:lock', 1, lock_timeout)
+        if acquired is False:
+            _count(prefix, 'stale' if now >= expires_at else 'hit')
+            return value
+        _count(prefix, 'refresh')
+        return _compute(key, compute, timeout, stale_ttl, release=acquired is not None)
+
+    acquired = cache.add(f'{key}:lock', 1, lock_timeout)
+    if acquired is False:
+        # Someone else is computing it, wait for their result
+        deadline = time_module.monotonic() + lock_timeout
+        while time_module.monotonic() < deadline:
+            time_module.sleep(0.05)
+            entry = cache.get(key, _MISSING)
+            if entry is not _MISSING:
+                _count(prefix, 'coalesced')
+                return entry[0]
+    _count(prefix, 'miss')
+    # A None from add() means the cache is unreachable (IGNORE_EXCEPTIONS); there is no lock to release
+    return _compute(key, compute, timeout, stale_ttl, release=bool(acquired))
+
+
+def _compute(key, compute, timeout, stale_ttl, release):
+    started = time_module.monotonic()
+    try:
+        value = compute()
+        delta = time_module.monotonic() - started
+        expires_at = None if timeout is None else time_module.time() + timeout
+        cache.set(key, (value, expires_at, delta), None if timeout is None else timeout + stale_ttl)
+        return value
+    finally:
+        if release:
+            cache.delete(f'{key}:lock')
+
+
+def cache_result(timeout=300, key_prefix='', namespaces=None, stale_ttl=0):
     """
     Decorator to cache function results.
-    
+
     Args:
         timeout: Cache timeout in seconds (default: 5 minutes)
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key, and the label of its hit/miss counters
+            (default: the function's qualified name)
+        namespaces: Namespace name(s), or a callable taking the function's
+            arguments and returning them; bumping one invalidates the result
+        stale_ttl: Seconds an expired result may still be served while it is
+            recomputed, see cached_call
     """
     def decorator(func):
+        prefix = key_prefix or f'{func.__module__}.{func.__qualname__}'
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key
-            cache_key = f"{key_prefix}_{func.__name__}_{str(args)}_{str(kwargs)}"
-            
-            # Try to get from cache
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            return result
+            cache_key = namespaced_key(
+                make_key(prefix, *args, **kwargs),
+                _resolve_namespaces(namespaces, *args, **kwargs)
+            )
+            return cached_call(
+                cache_key, partial(func, *args, **kwargs), timeout=timeout, stale_ttl=stale_ttl, prefix=prefix
+            )
         return wrapper
     return decorator
 
 
-def method_cache_result(timeout=300, key_prefix=''):
+def method_cache_result(timeout=300, key_prefix='', namespaces=None, stale_ttl=0):
     """
     Method decorator for caching class method results.
+
+    Results are shared by every instance of the class. `namespaces` works as
+    in cache_result; a callable also receives `self`.
     """
     def decorator(func):
         @wraps(func)
         def wrapper(self, *args, **kwargs):
-            # Generate cache key including instance
-            cache_key = f"{key_prefix}_{self.__class__.__name__}_{func.__name__}_{str(args)}_{str(kwargs)}"
-            
-            # Try to get from cache
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute method and cache result
-            result = func(self, *args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            return result
+            prefix = key_prefix or f'{func.__module__}.{self.__class__.__qualname__}.{func.__name__}'
+            cache_key = namespaced_key(
+                make_key(prefix, *args, **kwargs),
+                _resolve_namespaces(namespaces, self, *args, **kwargs)
+            )
+            return cached_call(
+                cache_key, partial(func, self, *args, **kwargs), timeout=timeout, stale_ttl=stale_ttl, prefix=prefix
+            )
         return wrapper
     return decorator
 
@@ -62,6 +253,7 @@ def invalidate_cache_pattern(pattern):
     """
     Invalidate all cache keys matching a pattern.
     Note: This requires Redis with keys() support or a custom cache backend.
+    Deprecated: it scans the keyspace; use namespaces and bump_namespace instead.
     """
     try:
         # This works with Redis backend
@@ -80,6 +272,78 @@ def invalidate_cache_pattern(pattern):
         logger.warning(f"Cache invalidation failed: {e}")
 
 
+# Keep the stored value only if it is newer than what the cache already holds
+_SET_IF_NEWER = """
+local current = redis.call('HGET', KEYS[1], 'version')
+if current and tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'version', ARGV[1], 'value', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+_versioned_lock = threading.Lock()
+_set_if_newer_script = None
+
+
+def _redis_script():
+    """The compiled set-if-newer script when the cache is Redis, else None."""
+    global _set_if_newer_script
+    if _set_if_newer_script is None:
+        try:
+            from django_redis import get_redis_connection
+            _set_if_newer_script = get_redis_connection('default').register_script(_SET_IF_NEWER)
+        except (ImportError, NotImplementedError):
+            _set_if_newer_script = False
+    return _set_if_newer_script or None
+
+
+def set_if_newer(key, value, version, timeout):
+    """
+    Cache a JSON-serializable value unless a newer version is already cached.
+
+    On Redis the compare and set is a single script call, so concurrent
+    writers can never replace a value with an older one. Other backends
+    compare under a process-wide lock, which is exact for the local memory
+    cache. Returns True when the value was stored.
+    """
+    script = _redis_script()
+    try:
+        if script is not None:
+            return bool(script(keys=[cache.make_key(key)], args=[version, json.dumps(value), timeout]))
+        with _versioned_lock:
+            current = cache.get(key)
+            if current is not None and current['version'] >= version:
+                return False
+            cache.set(key, {'version': version, 'value': value}, timeout)
+            return True
+    except Exception as e:
+        logger.warning(f"Versioned cache write failed for {key}: {e}")
+        return False
+
+
+def get_versioned(key):
+    """Value stored with set_if_newer, or None."""
+    script = _redis_script()
+    try:
+        if script is not None:
+            value = script.registered_client.hget(cache.make_key(key), 'value')
+            return json.loads(value) if value is not None else None
+        current = cache.get(key)
+        return current['value'] if current is not None else None
+    except Exception as e:
+        logger.warning(f"Versioned cache read failed for {key}: {e}")
+        return None
+
+
+# Async variants for views on the ASGI stack. Cache clients are thread-safe, so
+# these run outside the request's thread and can overlap its database queries.
+anamespaced_key = sync_to_async(namespaced_key, thread_sensitive=False)
+aset_if_newer = sync_to_async(set_if_newer, thread_sensitive=False)
+aget_versioned = sync_to_async(get_versioned, thread_sensitive=False)
+
+
 def delete_cache_keys(keys):
     """
     Delete multiple cache keys.
@@ -88,22 +352,43 @@ def delete_cache_keys(keys):
         cache.delete(key)
 
 
+def parse_datetime_param(value, name):
+    """Parse an ISO date or datetime parameter, None when absent."""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError(f'{name} must be an ISO date or datetime')
+        parsed = datetime.combine(parsed_date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class CacheMixin:
     """
     Mixin class for views that need caching functionality.
     """
     cache_timeout = 300
     cache_key_prefix = ''
-    
+    cache_namespaces = ()
+
+    def get_cache_namespaces(self, *args, **kwargs):
+        """Namespaces whose generation is part of this view's cache keys."""
+        return self.cache_namespaces
+
+    def get_cache_prefix(self):
+        return self.cache_key_prefix or f'{self.__class__.__module__}.{self.__class__.__qualname__}'
+
     def get_cache_key(self, *args, **kwargs):
         """Generate cache key for this view."""
-        return f"{self.cache_key_prefix}_{self.__class__.__name__}_{str(args)}_{str(kwargs)}"
-    
-    def get_cached_response(self, cache_key):
-        """Get cached response if available."""
-        return cache.get(cache_key)
-    
-    def set_cached_response(self, cache_key, response_data):
-        """Cache response data."""
-        cache.set(cache_key, response_data, self.cache_timeout)
+        return namespaced_key(
+            make_key(self.get_cache_prefix(), *args, **kwargs),
+            _resolve_namespaces(self.get_cache_namespaces(*args, **kwargs))
+        )
 
+    def get_cached_response(self, cache_key, compute):
+        """Cached response data, computed with `compute()` by one request at a time."""
+        return cached_call(cache_key, compute, timeout=self.cache_timeout, prefix=self.get_cache_prefix())
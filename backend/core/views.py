@@ -1,3 +1,34 @@
-from django.shortcuts import render
+"""
+Operational endpoints.
+"""
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
 
-# Create your views here.
+from . import metrics as request_metrics
+from .authentication import CachedJWTAuthentication
+
+
+def _may_read_metrics(request):
+    """METRICS_TOKEN as a bearer token, or a staff user by session or JWT."""
+    if settings.METRICS_TOKEN:
+        header = request.headers.get('Authorization', '')
+        if constant_time_compare(header, f'Bearer {settings.METRICS_TOKEN}'):
+            return True
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+@require_GET
+def metrics(request):
+    """Request metrics in the Prometheus text format, for the metrics token or staff only."""
+    if not _may_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -149,20 +150,15 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # Override per view
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'core.ratelimit.RateLimitThrottle',
     ],
-    'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/hour',
-        'user': '1000/hour',
-    },
 }
 
 # CORS settings
@@ -220,6 +216,81 @@ if DEBUG and not config('USE_REDIS', default=False, cast=bool):
         }
     }
 
+# In-process cache in front of CACHES['default'], see core.tiered_cache. Per key prefix:
+# `ttl` is how long a process may keep a value (0 opts out), `broadcast` publishes changes to other processes
+L1_CACHE = {
+    'ENABLED': config('L1_CACHE_ENABLED', default=True, cast=bool),
+    'MAX_ENTRIES': config('L1_CACHE_MAX_ENTRIES', default=10000, cast=int),
+    'CHANNEL': 'nissmart:l1:invalidate',
+    'PREFIXES': {
+        # Namespace generations, bumped by every write to an account
+        'ns_': {'ttl': 5, 'broadcast': True},
+        # History pages; their keys carry the account's namespace generation, so they are never overwritten
+        'transactions_': {'ttl': 30},
+        # Dashboard payloads; their keys carry the account's and the user's namespace generations
+        'dashboard_': {'ttl': 30},
+        # Balances are published with a version by every write and are not kept in process
+        'balance_': {'ttl': 0},
+        # Authenticated principals; their keys carry the user's namespace generation
+        'principal_': {'ttl': 60},
+        # Directory lookups of short, popular prefixes; they expire after 30 seconds anyway
+        'directory:': {'ttl': 10},
+    },
+}
+
+# Server-sent events: 'redis' reaches subscribers in every process, 'local' only in this one
+EVENT_BUS = config('EVENT_BUS', default='redis' if CACHES['default']['BACKEND'].startswith('django_redis') else 'local')
+EVENT_BUS_REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1')
+EVENT_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+EVENT_STREAM_MAX_AGE = 300  # seconds before a stream is closed and the client reconnects
+EVENT_STREAM_RETRY = 3000  # milliseconds clients wait before reconnecting
+
+# Request Metrics
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=1.0 if DEBUG else 0.05, cast=float)  # share of requests profiled in detail
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # bearer token for scrapers; without it /metrics is staff only
+
+# Idempotency Settings
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=86400, cast=int)  # how long keys and responses are kept
+IDEMPOTENCY_LOCK_TIMEOUT = 30  # seconds before an unfinished reservation can be taken over
+IDEMPOTENCY_WAIT = 5  # seconds a duplicate request waits for the first one to finish
+
+# Payout Settings
+PAYOUT_GATEWAY = config('PAYOUT_GATEWAY', default='transactions.payouts.StubGateway')
+PAYOUT_STUB_SUCCESS_RATE = config('PAYOUT_STUB_SUCCESS_RATE', default=0.9, cast=float)
+PAYOUT_STUB_LATENCY = config('PAYOUT_STUB_LATENCY', default=0, cast=float)  # seconds per simulated payout
+PAYOUT_LEASE = 60  # seconds before a claimed payout can be claimed by another worker
+PAYOUT_MAX_ATTEMPTS = 5  # gateway errors before the payout is parked for review
+PAYOUT_RETRY_DELAY = 5  # seconds before the first retry, doubled on every attempt
+
+# Archive Settings
+# Settled transactions older than this are moved to transactions_archive by archive_transactions;
+# must be longer than IDEMPOTENCY_TTL, duplicates of archived transactions are not detected
+TRANSACTION_ARCHIVE_AFTER_DAYS = config('TRANSACTION_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
 # Rate Limiting Settings
+# Token buckets, see core.ratelimit. 'count/period' (s, m, h or d) allows bursts of up to count
+# requests and refills count per period. Every request draws from its client's bucket and from its endpoint's
 RATELIMIT_ENABLE = config('RATELIMIT_ENABLE', default=True, cast=bool)
-RATELIMIT_USE_CACHE = 'default'
+RATE_LIMITS = {
+    'USER': '1000/h',  # per authenticated user, all endpoints
+    'ANON': '100/h',  # per IP of anonymous requests, all endpoints
+    # By URL name; per user, or per IP with 'key': 'ip'
+    'ENDPOINTS': {
+        'register': {'rate': '5/m', 'key': 'ip'},
+        'login': {'rate': '10/m', 'key': 'ip'},
+        # Typeahead, one lookup per keystroke
+        'user-directory': {'rate': '30/m'},
+        'deposit': {'rate': '50/h'},
+        'transfer': {'rate': '30/h'},
+        'batch_transfer': {'rate': '10/h'},
+        'withdraw': {'rate': '20/h'},
+        'balance': {'rate': '100/h'},
+        'transaction_history': {'rate': '200/h'},
+        'statement': {'rate': '200/h'},
+        'dashboard': {'rate': '200/h'},
+        'admin_stats': {'rate': '200/h'},
+        'admin_transactions': {'rate': '200/h'},
+        'admin_export_transactions': {'rate': '10/h'},
+    },
+}
@@ -3,10 +3,12 @@ URL configuration for nissmart project.
 """
 from django.contrib import admin
 from django.urls import path, include
+from core import views as core_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('users.urls')),
     path('api/', include('transactions.urls')),
+    path('metrics', core_views.metrics, name='metrics'),
 ]
 
@@ -29,5 +29,5 @@ echo Running migrations...
 python manage.py migrate
 
 echo Setup complete!
-echo To start the server, run: python manage.py runserver
+echo To start the server, run: uvicorn nissmart.asgi:application --reload --port 8000
 
@@ -1,13 +1,21 @@
 from django.contrib import admin
-from .models import Account, Transaction, TransferRequest, Withdrawal
+from .models import (
+    Account, AccountShard, ArchivedTransaction, LedgerEntry, Transaction, TransferRequest, Withdrawal, WithdrawalOutbox
+)
 
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'balance', 'currency', 'created_at']
+    list_display = ['id', 'user', 'balance', 'currency', 'is_hot', 'shard_count', 'created_at']
+    list_filter = ['is_hot']
     search_fields = ['user__email']
 
 
+@admin.register(AccountShard)
+class AccountShardAdmin(admin.ModelAdmin):
+    list_display = ['id', 'account', 'index', 'balance', 'updated_at']
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ['id', 'transaction_type', 'amount', 'source_account', 'destination_account', 'status', 'created_at']
@@ -15,6 +23,13 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ['id', 'idempotency_key']
 
 
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'transaction_type', 'amount', 'source_account', 'destination_account', 'status', 'created_at', 'archived_at']
+    list_filter = ['transaction_type', 'status', 'created_at']
+    search_fields = ['id', 'idempotency_key']
+
+
 @admin.register(TransferRequest)
 class TransferRequestAdmin(admin.ModelAdmin):
     list_display = ['id', 'source_account', 'destination_account', 'amount', 'status', 'created_at']
@@ -26,3 +41,14 @@ class WithdrawalAdmin(admin.ModelAdmin):
     list_display = ['id', 'account', 'amount', 'status', 'external_reference', 'created_at']
     list_filter = ['status', 'created_at']
 
+
+@admin.register(WithdrawalOutbox)
+class WithdrawalOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'withdrawal', 'attempts', 'available_at', 'processed_at', 'last_error']
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    # The id only, the transaction may have been archived
+    list_display = ['id', 'transaction_id', 'account', 'entry_type', 'amount', 'balance_after', 'created_at']
+    list_filter = ['entry_type', 'created_at']
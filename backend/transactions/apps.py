@@ -5,3 +5,11 @@ class TransactionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transactions'
 
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_save
+        from . import stats
+        # Keep total_users exact however users are created or deleted
+        post_save.connect(stats.user_saved, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(stats.user_deleted, sender=settings.AUTH_USER_MODEL)
@@ -0,0 +1,63 @@
+"""
+Hot/cold storage of transactions.
+
+`archive_transactions` moves settled transactions older than
+settings.TRANSACTION_ARCHIVE_AFTER_DAYS from `transactions` to
+`transactions_archive` in batches, so the live table and its indexes
+(idempotency keys, per-account and per-status history) are sized by recent
+traffic rather than by all time. Pending transactions stay until their payout
+settles.
+
+Transaction history and the admin listing page into the archive once a
+cursor goes past the live rows; exports, ledger statistics and reconciliation
+read both tables. Ledger entries, transfer requests and withdrawals stay
+where they are and keep pointing at archived transactions.
+"""
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import ArchivedTransaction, Transaction
+
+SETTLED = ('COMPLETED', 'FAILED')
+
+COLUMNS = [field.attname for field in Transaction._meta.concrete_fields]
+
+
+def eligible(before):
+    """Live transactions that may be archived: settled and created before `before`."""
+    return Transaction.objects.filter(created_at__lt=before, status__in=SETTLED)
+
+
+def archive(before, batch_size=1000, max_batches=None):
+    """
+    Move eligible transactions to the archive, one batch per database transaction.
+
+    Rows locked by a concurrent mover are skipped, so several can run at once.
+    Returns the number of transactions moved.
+    """
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            rows = list(eligible(before).select_for_update(skip_locked=True).values(*COLUMNS)[:batch_size])
+            if not rows:
+                break
+            ArchivedTransaction.objects.bulk_create([ArchivedTransaction(**row) for row in rows])
+            Transaction.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        moved += len(rows)
+        batches += 1
+    return moved
+
+
+def archived_until():
+    """Creation time of the newest archived transaction, None while the archive is empty."""
+    return ArchivedTransaction.objects.aggregate(newest=Max('created_at'))['newest']
+
+
+def transaction_column(column, ref='transaction_id'):
+    """Expression for a column of the referenced transaction, wherever it is stored."""
+    return Coalesce(
+        Subquery(Transaction.objects.filter(id=OuterRef(ref)).values(column)[:1]),
+        Subquery(ArchivedTransaction.objects.filter(id=OuterRef(ref)).values(column)[:1]),
+    )
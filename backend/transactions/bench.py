@@ -0,0 +1,351 @@
+"""
+Load and latency benchmark for the transaction engine.
+
+`seed` creates funded benchmark users; `plan` builds a reproducible list of
+operations (deposit, transfer, withdraw, balance, history) for a contention
+pattern, and `run` drives them from a thread or process pool, either through
+Django's test client in this process or over HTTP against a running server.
+`report` turns the samples into the JSON that bench_engine prints, so runs
+of different releases can be compared.
+
+In-process runs also time the SELECT ... FOR UPDATE queries each request
+issues, which is the time spent waiting for (and taking) row locks.
+"""
+import json
+import math
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import ledger
+from . import stats as ledger_stats
+from .models import Account, LedgerEntry, Transaction
+
+OPERATIONS = ('deposit', 'transfer', 'withdraw', 'balance', 'history')
+DEFAULT_MIX = 'deposit=20,transfer=40,withdraw=10,balance=20,history=10'
+CONTENTION = ('uniform', 'hot')
+
+# Response bodies of writes that lost a lock conflict
+LOCK_ERRORS = ('deadlock', 'could not serialize', 'lock timeout', 'database is locked')
+
+Operation = namedtuple('Operation', ['name', 'user_id', 'method', 'path', 'body'])
+Sample = namedtuple('Sample', ['name', 'status', 'seconds', 'lock_wait', 'outcome'])
+
+
+def parse_mix(value):
+    """Parse 'deposit=20,transfer=40' into {'deposit': 20, 'transfer': 40}."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"Weight of '{name}' must be a number")
+        if mix[name] < 0:
+            raise ValueError(f"Weight of '{name}' must not be negative")
+    if not any(mix.values()):
+        raise ValueError('The operation mix needs at least one positive weight')
+    return mix
+
+
+def seed(count, prefix='bench', opening_balance=Decimal('1000000.00'), batch_size=1000):
+    """
+    Make sure `count` benchmark users exist, each with a funded account.
+
+    Users are named `{prefix}_{n}` and share one password hash. Opening
+    balances are posted as DEPOSIT transactions with ledger entries, so the
+    ledger still reconciles after a run. Returns [(user_id, account_id)].
+    """
+    User = get_user_model()
+    usernames = [f'{prefix}_{n}' for n in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    missing = [username for username in usernames if username not in existing]
+
+    password = make_password(None)  # Benchmark users authenticate with minted tokens only
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(username=username, email=f'{username}@bench.nissmart.local', password=password)
+                for username in batch
+            ])
+            if not all(user.pk for user in users):
+                users = list(User.objects.filter(username__in=batch))
+            accounts = Account.objects.bulk_create([
+                Account(user=user, balance=opening_balance, balance_version=1) for user in users
+            ])
+            if not all(account.pk for account in accounts):
+                accounts = list(Account.objects.filter(user__in=users))
+            deposits = Transaction.objects.bulk_create([
+                Transaction(
+                    transaction_type='DEPOSIT',
+                    amount=opening_balance,
+                    destination_account=account,
+                    status='COMPLETED',
+                    idempotency_key=f'{prefix}-seed-{account.user_id}',
+                    metadata={'simulated': True, 'bench': True}
+                )
+                for account in accounts
+            ])
+            entries = []
+            for account, deposit in zip(accounts, deposits):
+                entries.append(ledger.entry(deposit, 'DEBIT'))
+                entries.append(ledger.entry(deposit, 'CREDIT', account, opening_balance))
+            LedgerEntry.objects.bulk_create(entries)
+            ledger_stats.bump(total_users=len(users))
+            ledger_stats.record_transaction('DEPOSIT', count=len(deposits), wallets_delta=opening_balance * len(deposits))
+
+    return list(
+        Account.objects.filter(user__username__in=usernames).order_by('user_id').values_list('user_id', 'id')
+    )
+
+
+def plan(accounts, requests, mix, contention='uniform', hot_accounts=1, hot_share=0.9, seed=None):
+    """
+    Build `requests` operations drawn from `mix`.
+
+    With 'hot' contention, a `hot_share` of deposits, withdrawals, reads and
+    transfer destinations go to the first `hot_accounts` accounts, the way a
+    merchant or payout account collects most of the traffic.
+    """
+    if contention not in CONTENTION:
+        raise ValueError(f"contention must be one of {', '.join(CONTENTION)}")
+    if len(accounts) < 2:
+        raise ValueError('At least two accounts are needed')
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:12]
+    names, weights = zip(*mix.items())
+    hot = accounts[:max(1, min(hot_accounts, len(accounts)))]
+
+    def target():
+        if contention == 'hot' and rng.random() < hot_share:
+            return rng.choice(hot)
+        return rng.choice(accounts)
+
+    def amount(low, high):
+        return str(Decimal(rng.randint(low * 100, high * 100)) / 100)
+
+    operations = []
+    for i, name in enumerate(rng.choices(names, weights=weights, k=requests)):
+        key = f'bench-{run_id}-{i}'
+        if name == 'transfer':
+            user_id, account_id = rng.choice(accounts)
+            destination = target()
+            if destination[1] == account_id:
+                destination = accounts[(accounts.index(destination) + 1) % len(accounts)]
+            operations.append(Operation(name, user_id, 'POST', 'transfer/', {
+                'source_account_id': account_id,
+                'destination_account_id': destination[1],
+                'amount': amount(1, 20),
+                'idempotency_key': key,
+            }))
+            continue
+
+        user_id, account_id = target()
+        if name == 'deposit':
+            operations.append(Operation(name, user_id, 'POST', 'deposit/', {
+                'account_id': account_id, 'amount': amount(1, 100), 'idempotency_key': key
+            }))
+        elif name == 'withdraw':
+            operations.append(Operation(name, user_id, 'POST', 'withdraw/', {
+                'account_id': account_id, 'amount': amount(1, 20), 'idempotency_key': key
+            }))
+        elif name == 'balance':
+            operations.append(Operation(name, user_id, 'GET', f'balance/{user_id}/', None))
+        else:
+            operations.append(Operation(name, user_id, 'GET', f'transactions/{user_id}/', None))
+    return operations
+
+
+def tokens(user_ids):
+    """Access tokens for the benchmark users, minted locally."""
+    User = get_user_model()
+    return {user.id: str(AccessToken.for_user(user)) for user in User.objects.filter(id__in=set(user_ids))}
+
+
+def _outcome(status, body):
+    if status is None:
+        return 'exception'
+    if status < 400:
+        return 'ok'
+    if status == 429:
+        return 'throttled'
+    if any(error in body.lower() for error in LOCK_ERRORS):
+        return 'lock_conflict'
+    return 'client_error' if status < 500 else 'server_error'
+
+
+class _LockTimer:
+    """Database execute wrapper that adds up the time of SELECT ... FOR UPDATE queries."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+def _run_in_process(operations, tokens):
+    client = Client(raise_request_exception=False)
+    samples = []
+    for operation in operations:
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {tokens[operation.user_id]}'}
+        path = f'/api/{operation.path}'
+        timer = _LockTimer()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(timer):
+                if operation.method == 'POST':
+                    response = client.post(path, json.dumps(operation.body), content_type='application/json', **headers)
+                else:
+                    response = client.get(path, **headers)
+            status, body = response.status_code, response.content.decode(errors='replace')
+        except Exception as e:
+            status, body = None, str(e)
+        seconds = time.perf_counter() - started
+        # Row locks are not taken on databases without SELECT ... FOR UPDATE (SQLite)
+        lock_wait = timer.seconds if connection.features.has_select_for_update else None
+        samples.append(Sample(operation.name, status, seconds, lock_wait, _outcome(status, body)))
+    # Pool threads and processes open their own connections
+    connections.close_all()
+    return samples
+
+
+def _run_over_http(operations, tokens, url):
+    samples = []
+    for operation in operations:
+        data = json.dumps(operation.body).encode() if operation.body is not None else None
+        request = urllib.request.Request(f'{url}/{operation.path}', data=data, method=operation.method, headers={
+            'Authorization': f'Bearer {tokens[operation.user_id]}',
+            'Content-Type': 'application/json',
+        })
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, body = response.status, response.read().decode(errors='replace')
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read().decode(errors='replace')
+        except Exception as e:
+            status, body = None, str(e)
+        seconds = time.perf_counter() - started
+        samples.append(Sample(operation.name, status, seconds, None, _outcome(status, body)))
+    return samples
+
+
+def _run_chunk(operations, tokens, url=None):
+    if url:
+        return _run_over_http(operations, tokens, url)
+    return _run_in_process(operations, tokens)
+
+
+def _init_process():
+    import django
+    django.setup()
+    override_settings(RATELIMIT_ENABLE=False).enable()
+
+
+def run(operations, tokens, concurrency=8, pool='thread', url=None):
+    """
+    Run the operations from `concurrency` closed-loop workers.
+
+    Returns (samples, wall clock seconds). Without `url`, requests go through
+    the test client with rate limiting switched off; against a server, start
+    it with RATELIMIT_ENABLE=False for the same effect.
+    """
+    chunks = [operations[i::concurrency] for i in range(concurrency)]
+    chunks = [chunk for chunk in chunks if chunk]
+    url = url.rstrip('/') if url else None
+
+    with override_settings(RATELIMIT_ENABLE=False):
+        if pool == 'process':
+            # Forked workers must not share the parent's connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_process)
+        else:
+            executor = ThreadPoolExecutor(max_workers=len(chunks))
+        with executor:
+            started = time.perf_counter()
+            futures = [executor.submit(_run_chunk, chunk, tokens, url) for chunk in chunks]
+            samples = [sample for future in futures for sample in future.result()]
+            elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    # Nearest rank
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _latency(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return None
+    return {
+        'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50': round(_percentile(ordered, 50) * 1000, 3),
+        'p95': round(_percentile(ordered, 95) * 1000, 3),
+        'p99': round(_percentile(ordered, 99) * 1000, 3),
+        'max': round(ordered[-1] * 1000, 3),
+    }
+
+
+def _summary(samples, elapsed):
+    outcomes = Counter(sample.outcome for sample in samples)
+    lock_waits = [sample.lock_wait for sample in samples if sample.lock_wait is not None]
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'latency_ms': _latency([sample.seconds for sample in samples]),
+        'lock_wait_ms': {
+            'total': round(sum(lock_waits) * 1000, 3),
+            **_latency(lock_waits),
+        } if lock_waits else None,
+        'errors': {
+            'total': len(samples) - outcomes['ok'],
+            'lock_conflicts': outcomes['lock_conflict'],
+            'throttled': outcomes['throttled'],
+            'client_errors': outcomes['client_error'],
+            'server_errors': outcomes['server_error'],
+            'exceptions': outcomes['exception'],
+        },
+        'status_codes': dict(sorted(Counter(str(sample.status) for sample in samples).items())),
+    }
+
+
+def report(samples, elapsed, config=None):
+    """Summarise a run overall and per operation."""
+    by_operation = defaultdict(list)
+    for sample in samples:
+        by_operation[sample.name].append(sample)
+    return {
+        'config': config or {},
+        'database': connection.vendor,
+        'cache': settings.CACHES['default']['BACKEND'],
+        'duration_s': round(elapsed, 3),
+        **_summary(samples, elapsed),
+        'operations': {
+            name: _summary(by_operation[name], elapsed) for name in OPERATIONS if by_operation[name]
+        },
+    }
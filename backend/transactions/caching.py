@@ -0,0 +1,98 @@
+"""
+Cache keys and invalidation for account data.
+
+Everything cached about an account (history pages, statements, ...) lives in
+the account's cache namespace, so a write invalidates it with a single
+generation bump instead of a keyspace scan.
+
+Balances are written through instead: once a write commits, the engine
+publishes the account's new balance tagged with `Account.balance_version`, and
+the cache only accepts a version newer than the one it holds. A reader that
+loaded the balance before the commit can therefore never overwrite the
+published value. Shard credits to hot accounts do not bump the version, so
+their balances are dropped on commit and only cached for a few seconds.
+"""
+from decimal import Decimal
+from functools import partial
+from django.core.cache import cache
+from django.db import transaction
+
+from core.utils import (
+    aget_versioned, anamespaced_key, aset_if_newer, bump_namespace_on_commit, get_versioned, namespaced_key,
+    set_if_newer
+)
+
+from . import events
+
+BALANCE_TTL = 3600
+HOT_BALANCE_TTL = 5
+
+
+def account_namespace(account_id):
+    return f'account_{account_id}'
+
+
+def account_key(account_id, key):
+    """Cache key for `key` in the namespace of an account."""
+    return namespaced_key(key, [account_namespace(account_id)])
+
+
+async def aaccount_key(account_id, key):
+    return await anamespaced_key(key, [account_namespace(account_id)])
+
+
+def invalidate_accounts(*account_ids):
+    """Invalidate the cached data of the given accounts once the write commits."""
+    bump_namespace_on_commit(*[account_namespace(account_id) for account_id in account_ids])
+
+
+def balance_key(user_id):
+    return f'balance_{user_id}'
+
+
+def balance_payload(account, balance=None):
+    """The account part of a balance response, as it is cached."""
+    balance = account.balance if balance is None else balance
+    return {
+        'account_id': account.id,
+        'balance': str(Decimal(balance).quantize(Decimal('0.01'))),
+        'currency': account.currency,
+        'user_id': account.user_id,
+    }
+
+
+def get_cached_balance(user_id):
+    return get_versioned(balance_key(user_id))
+
+
+async def aget_cached_balance(user_id):
+    return await aget_versioned(balance_key(user_id))
+
+
+def cache_balance(account, balance):
+    """Cache a balance read from the database, unless a newer one was published."""
+    ttl = HOT_BALANCE_TTL if account.is_hot else BALANCE_TTL
+    set_if_newer(balance_key(account.user_id), balance_payload(account, balance), account.balance_version, ttl)
+
+
+async def acache_balance(account, balance):
+    ttl = HOT_BALANCE_TTL if account.is_hot else BALANCE_TTL
+    await aset_if_newer(balance_key(account.user_id), balance_payload(account, balance), account.balance_version, ttl)
+
+
+def publish_balance(*accounts):
+    """
+    Publish the balances of accounts changed by the current transaction once it commits.
+
+    The balance goes to the cache and to the owner's event stream. Call after
+    saving the account with an incremented `balance_version`.
+    """
+    for account in accounts:
+        key = balance_key(account.user_id)
+        if account.is_hot:
+            transaction.on_commit(partial(cache.delete, key))
+            events.balance_changed(account)
+        else:
+            payload = balance_payload(account)
+            transaction.on_commit(partial(set_if_newer, key, payload, account.balance_version, BALANCE_TTL))
+            events.balance_changed(account, payload)
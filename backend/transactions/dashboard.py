@@ -0,0 +1,38 @@
+"""
+Composite payload of the customer dashboard.
+
+One response carries what the dashboard used to fetch from the profile,
+balance and history endpoints, plus monthly totals. It is built from a single
+account lookup (with the user joined in for the profile) and cached in the
+account's namespace and the user's: every engine write to the account
+(deposits, transfers, withdrawals, payout settlements) and every change to
+the user bumps one of them, so a cached payload is never served after a
+change has committed.
+"""
+from core.authentication import user_namespace
+from core.utils import anamespaced_key
+from users.serializers import UserSerializer
+
+from . import history, ledger
+from .caching import account_namespace, balance_payload
+from .models import Account
+from .shards import total_balance
+
+MONTHS = 6
+CACHE_TTL = 60
+
+
+def build(account_id, page_size):
+    account = Account.objects.select_related('user').get(id=account_id)
+    return {
+        'profile': UserSerializer(account.user).data,
+        'balance': balance_payload(account, total_balance(account)),
+        'transactions': history.page(account_id, page_size=page_size),
+        'monthly_totals': ledger.monthly_totals(account_id, MONTHS),
+    }
+
+
+async def acache_key(account_id, user_id, page_size):
+    return await anamespaced_key(
+        f'dashboard_{account_id}_{page_size}', [account_namespace(account_id), user_namespace(user_id)]
+    )
@@ -0,0 +1,321 @@
+"""
+High-volume synthetic dataset generation.
+
+The users are split into shards of consecutive ids. Each shard is simulated
+on its own, in a process pool. Users join over the simulated period,
+transactions follow a growth trend and a daily cycle, and every debit is
+checked against the running balance. Balances, ledger running balances and
+the account balance_version are therefore consistent, and reconcile_ledger
+passes on the result.
+
+Rows are generated as plain tuples and written in batches, with COPY on
+PostgreSQL and executemany elsewhere. The generated created_at values are
+kept as they are, which bulk_create would not do (it stamps auto_now_add
+fields with the current time). User and account ids are assigned up front,
+so shards never need a round trip to learn them. Run it against an idle
+database.
+"""
+import csv
+import io
+import json
+import random
+import uuid
+from bisect import bisect_right
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import stats as ledger_stats
+from .models import Account, LedgerEntry, Transaction, Withdrawal
+
+# Relative share of each transaction type
+MIX = {'DEPOSIT': 35, 'TRANSFER': 45, 'WITHDRAWAL': 20}
+# Share of withdrawals whose payout failed and was refunded
+FAILED_WITHDRAWALS = 0.03
+# Relative activity per hour of the day
+HOURLY = [1, 1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 11, 12, 11, 10, 10, 10, 11, 12, 12, 10, 7, 4, 2]
+# Amounts are log-normal in KES: (mu, sigma) of the natural log
+DEPOSIT_AMOUNT = (7.0, 1.0)
+DEBIT_AMOUNT = (6.0, 1.1)
+MAX_AMOUNT_CENTS = 100_000_000
+
+FIRST_NAMES = [
+    'Amina', 'Brian', 'Cynthia', 'David', 'Esther', 'Faith', 'George', 'Halima', 'Ian', 'Joy',
+    'Kevin', 'Lucy', 'Mercy', 'Njeri', 'Otieno', 'Peter', 'Quincy', 'Rose', 'Samuel', 'Wanjiku',
+]
+LAST_NAMES = [
+    'Achieng', 'Barasa', 'Chebet', 'Kamau', 'Kariuki', 'Kiprop', 'Mutua', 'Mwangi', 'Njoroge', 'Ochieng',
+    'Odhiambo', 'Omondi', 'Otieno', 'Wafula', 'Wambui', 'Wanjala',
+]
+
+Shard = namedtuple('Shard', ['index', 'first_user_id', 'first_account_id', 'users', 'transactions'])
+
+USER_COLUMNS = [
+    'id', 'password', 'last_login', 'is_superuser', 'username', 'first_name', 'last_name', 'email',
+    'is_staff', 'is_active', 'date_joined', 'created_at', 'updated_at', 'phone_number', 'role',
+]
+ACCOUNT_COLUMNS = [
+    'id', 'user_id', 'balance', 'currency', 'is_hot', 'shard_count', 'balance_version', 'created_at', 'updated_at',
+]
+TRANSACTION_COLUMNS = [
+    'id', 'transaction_type', 'amount', 'source_account_id', 'destination_account_id', 'status',
+    'idempotency_key', 'metadata', 'created_at', 'updated_at',
+]
+LEDGER_COLUMNS = ['transaction_id', 'account_id', 'entry_type', 'amount', 'balance_after', 'created_at', 'updated_at']
+WITHDRAWAL_COLUMNS = ['account_id', 'amount', 'status', 'transaction_id', 'external_reference', 'created_at', 'updated_at']
+
+
+def plan_shards(users, transactions, shard_size):
+    """Split the dataset into shards, with ids following the current maximum."""
+    User = get_user_model()
+    first_user_id = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    first_account_id = (Account.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    shards = []
+    for index, offset in enumerate(range(0, users, shard_size)):
+        shard_users = min(shard_size, users - offset)
+        # Transactions are spread in proportion to the shard's users
+        shard_transactions = transactions * (offset + shard_users) // users - transactions * offset // users
+        shards.append(Shard(index, first_user_id + offset, first_account_id + offset, shard_users, shard_transactions))
+    return shards
+
+
+def _money(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _timestamps(rng, count, days, skew):
+    """
+    `count` sorted offsets in seconds within `days` days.
+
+    Days are drawn from a triangular distribution peaking at `skew` of the
+    period (1 is a steady growth trend), hours from the daily cycle.
+    """
+    hours = rng.choices(range(24), cum_weights=list(accumulate(HOURLY)), k=count)
+    return sorted(
+        int(rng.triangular(0, days, days * skew)) * 86400 + hour * 3600 + rng.random() * 3600
+        for hour in hours
+    )
+
+
+def generate(shard, start, days, password, seed=None):
+    """
+    Simulate one shard.
+
+    Returns the rows of each table, keyed by model, and the totals to add to
+    the ledger counters.
+    """
+    rng = random.Random(None if seed is None else f'{seed}-{shard.index}')
+    count = shard.users
+    joined_at = _timestamps(rng, count, days, skew=0.6)
+    # Two users are around from the start, so every transfer has a counterparty
+    joined_at[:2] = [0.0] * min(2, count)
+    moments = _timestamps(rng, shard.transactions, days, skew=1.0)
+
+    balances = [0] * count
+    versions = [0] * count
+    changed_at = [None] * count
+    transactions, entries, withdrawals = [], [], []
+    totals = Counter()
+    kinds = rng.choices(list(MIX), weights=list(MIX.values()), k=shard.transactions)
+
+    for kind, offset in zip(kinds, moments):
+        at = start + timedelta(seconds=offset)
+        members = max(bisect_right(joined_at, offset), 1)
+        account = rng.randrange(members)
+        if kind != 'DEPOSIT' and (balances[account] < 100 or (kind == 'TRANSFER' and members < 2)):
+            kind = 'DEPOSIT'
+
+        trans_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+        account_id = shard.first_account_id + account
+        if kind == 'DEPOSIT':
+            cents = min(max(int(rng.lognormvariate(*DEPOSIT_AMOUNT) * 100), 100), MAX_AMOUNT_CENTS)
+        else:
+            cents = min(max(int(rng.lognormvariate(*DEBIT_AMOUNT) * 100), 100), balances[account])
+        amount = _money(cents)
+        status = 'COMPLETED'
+        metadata = {'simulated': True, 'seeded': True}
+
+        if kind == 'DEPOSIT':
+            balances[account] += cents
+            versions[account] += 1
+            changed_at[account] = at
+            entries.append((trans_id, None, 'DEBIT', amount, None, at, at))
+            entries.append((trans_id, account_id, 'CREDIT', amount, _money(balances[account]), at, at))
+            transactions.append((trans_id, kind, amount, None, account_id, status, f'seed-{trans_id.hex}', metadata, at, at))
+            totals['wallets_value'] += cents
+
+        elif kind == 'TRANSFER':
+            destination = rng.randrange(members - 1)
+            destination += destination >= account
+            balances[account] -= cents
+            balances[destination] += cents
+            for side in (account, destination):
+                versions[side] += 1
+                changed_at[side] = at
+            destination_id = shard.first_account_id + destination
+            entries.append((trans_id, account_id, 'DEBIT', amount, _money(balances[account]), at, at))
+            entries.append((trans_id, destination_id, 'CREDIT', amount, _money(balances[destination]), at, at))
+            transactions.append((trans_id, kind, amount, account_id, destination_id, status, f'seed-{trans_id.hex}', metadata, at, at))
+
+        else:
+            balances[account] -= cents
+            versions[account] += 1
+            changed_at[account] = at
+            entries.append((trans_id, account_id, 'DEBIT', amount, _money(balances[account]), at, at))
+            entries.append((trans_id, None, 'CREDIT', amount, None, at, at))
+            settled_at = at + timedelta(seconds=rng.randint(5, 600))
+            reference = None
+            if rng.random() < FAILED_WITHDRAWALS:
+                # The payout failed and the reserved funds went back to the account
+                status = 'FAILED'
+                metadata = {**metadata, 'external_success': False, 'reason': 'External system failure'}
+                balances[account] += cents
+                versions[account] += 1
+                changed_at[account] = settled_at
+                entries.append((trans_id, None, 'DEBIT', amount, None, settled_at, settled_at))
+                entries.append((trans_id, account_id, 'CREDIT', amount, _money(balances[account]), settled_at, settled_at))
+            else:
+                metadata = {**metadata, 'external_success': True}
+                reference = f'EXT-SEED-{trans_id.hex[:12].upper()}'
+                totals['wallets_value'] -= cents
+            transactions.append((trans_id, kind, amount, account_id, None, status, f'seed-{trans_id.hex}', metadata, at, settled_at))
+            withdrawals.append((account_id, amount, status, trans_id, reference, at, settled_at))
+        totals[kind] += 1
+
+    users, accounts = [], []
+    for n in range(count):
+        user_id = shard.first_user_id + n
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        username = f'user_{user_id}'
+        joined = start + timedelta(seconds=joined_at[n])
+        users.append((
+            user_id, password, None, False, username, first_name, last_name,
+            f'{first_name}.{last_name}.{user_id}@example.com'.lower(), False, True, joined, joined, joined,
+            f'07{rng.randrange(10 ** 8):08d}', 'Customer',
+        ))
+        accounts.append((
+            shard.first_account_id + n, user_id, _money(balances[n]), 'KES', False, 0, versions[n],
+            joined, changed_at[n] or joined,
+        ))
+    totals['users'] = count
+
+    rows = {
+        get_user_model(): (USER_COLUMNS, users),
+        Account: (ACCOUNT_COLUMNS, accounts),
+        Transaction: (TRANSACTION_COLUMNS, transactions),
+        LedgerEntry: (LEDGER_COLUMNS, entries),
+        Withdrawal: (WITHDRAWAL_COLUMNS, withdrawals),
+    }
+    return rows, totals
+
+
+def _copy_value(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _copy(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    # Strings are quoted and None is left bare, which COPY reads as NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerows([_copy_value(value) for value in row] for row in rows)
+    buffer.seek(0)
+    cursor.copy_expert(f'COPY {table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def _insert(db, cursor, table, fields, columns, rows):
+    placeholders = ', '.join(['%s'] * len(columns))
+    cursor.executemany(
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})',
+        [[field.get_db_prep_save(value, db) for field, value in zip(fields, row)] for row in rows]
+    )
+
+
+def write(rows, batch_size=50000):
+    """Write the rows of each table, in batches, in the order given."""
+    # The connection itself rather than the thread-local proxy, which is slow per value
+    db = connections[DEFAULT_DB_ALIAS]
+    with db.cursor() as cursor:
+        for model, (attnames, table_rows) in rows.items():
+            fields = [model._meta.get_field(attname) for attname in attnames]
+            columns = [db.ops.quote_name(field.column) for field in fields]
+            table = db.ops.quote_name(model._meta.db_table)
+            for offset in range(0, len(table_rows), batch_size):
+                batch = table_rows[offset:offset + batch_size]
+                if db.vendor == 'postgresql':
+                    _copy(cursor, table, columns, batch)
+                else:
+                    _insert(db, cursor, table, fields, columns, batch)
+
+
+def seed_shard(shard, start, days, password, seed=None, batch_size=50000):
+    """Generate and write one shard in a single transaction. Returns its totals."""
+    rows, totals = generate(shard, start, days, password, seed)
+    try:
+        with transaction.atomic():
+            write(rows, batch_size)
+    finally:
+        # Pool processes open their own connections
+        connections.close_all()
+    return shard, totals
+
+
+def _init_process():
+    import django
+    django.setup()
+
+
+def run(shards, days, password, processes=1, seed=None, batch_size=50000, progress=None):
+    """
+    Seed every shard and update the ledger counters and id sequences.
+
+    `password` is an already hashed password shared by all generated users.
+    `progress(shard, totals)` is called as each shard is written.
+    """
+    start = timezone.now() - timedelta(days=days)
+    totals = Counter()
+    if processes > 1:
+        # Forked workers must not share the parent's connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_process) as executor:
+            futures = [executor.submit(seed_shard, shard, start, days, password, seed, batch_size) for shard in shards]
+            for future in futures:
+                shard, shard_totals = future.result()
+                totals.update(shard_totals)
+                if progress:
+                    progress(shard, shard_totals)
+    else:
+        for shard in shards:
+            shard, shard_totals = seed_shard(shard, start, days, password, seed, batch_size)
+            totals.update(shard_totals)
+            if progress:
+                progress(shard, shard_totals)
+
+    with transaction.atomic():
+        # Explicit ids leave PostgreSQL's sequences behind
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [get_user_model(), Account]):
+                cursor.execute(sql)
+        ledger_stats.bump(
+            total_users=totals['users'],
+            total_transactions=totals['DEPOSIT'] + totals['TRANSFER'] + totals['WITHDRAWAL'],
+            total_deposits=totals['DEPOSIT'],
+            total_transfers=totals['TRANSFER'],
+            total_withdrawals=totals['WITHDRAWAL'],
+            total_wallets_value=_money(totals['wallets_value']),
+        )
+    return totals
@@ -0,0 +1,277 @@
+"""
+Server-sent events for balance and transaction updates.
+
+The engine publishes events once a write commits: a `balance` event to the
+account owner, a `transaction` event to the owners of both accounts, and an
+`activity` summary of every commit to the admin channel. Events travel over
+an in-process bus or, with `settings.EVENT_BUS = 'redis'`, over Redis pub/sub
+so every server process sees every event.
+
+Streams are async generators when the app is served through ASGI
+(nissmart/asgi.py), so an open connection costs a coroutine rather than a
+thread. Under WSGI they fall back to a blocking generator. Either way a
+stream ends after `settings.EVENT_STREAM_MAX_AGE` seconds and the browser's
+EventSource reconnects, which bounds connections left by clients that went
+away.
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+from functools import partial
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Transaction
+from .serializers import TransactionRowSerializer
+
+logger = logging.getLogger(__name__)
+
+ADMIN_CHANNEL = 'admin'
+# Events a slow subscriber may fall behind by before new ones are dropped
+QUEUE_SIZE = 1000
+
+
+def user_channel(user_id):
+    return f'user_{user_id}'
+
+
+def _encode(event, data):
+    return json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+
+
+class _ThreadSubscription:
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = channels
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class _AsyncSubscription:
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, message):
+        # Called from publishing threads, the queue belongs to the subscriber's loop
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.bus.unsubscribe(self)
+
+
+class LocalBus:
+    """Delivers events to subscribers in this process only."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish_many(self, messages):
+        self._deliver(messages)
+
+    def _deliver(self, messages):
+        for channel, message in messages:
+            with self._lock:
+                subscribers = list(self._subscribers.get(channel, ()))
+            for subscriber in subscribers:
+                subscriber.put(message)
+
+    def _register(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def subscribe(self, channels):
+        return self._register(_ThreadSubscription(self, channels))
+
+    async def asubscribe(self, channels):
+        return self._register(_AsyncSubscription(self, channels))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBus(LocalBus):
+    """
+    Delivers events to subscribers in every process through Redis pub/sub.
+
+    Each process holds a single pattern subscription, read by a background
+    thread that hands messages to the local subscribers, so open streams do
+    not each need a Redis connection.
+    """
+
+    prefix = 'nissmart:events:'
+
+    def __init__(self, url):
+        import redis
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish_many(self, messages):
+        pipeline = self.client.pipeline(transaction=False)
+        for channel, message in messages:
+            pipeline.publish(self.prefix + channel, message)
+        pipeline.execute()
+
+    def _register(self, subscription):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='event-bus', daemon=True)
+                self._listener.start()
+        return super()._register(subscription)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.prefix}*')
+                for message in pubsub.listen():
+                    channel = message['channel'].decode()[len(self.prefix):]
+                    self._deliver([(channel, message['data'].decode())])
+            except Exception as e:
+                logger.warning(f"Event bus subscription lost, reconnecting: {e}")
+                time.sleep(1)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = RedisBus(settings.EVENT_BUS_REDIS_URL) if settings.EVENT_BUS == 'redis' else LocalBus()
+    return _bus
+
+
+def publish_many(events):
+    """
+    Publish (channel, event, data) triples.
+
+    Runs from on_commit callbacks, so failures are logged and never reach the
+    write that produced the events.
+    """
+    if not events:
+        return
+    try:
+        get_bus().publish_many([(channel, _encode(event, data)) for channel, event, data in events])
+    except Exception as e:
+        logger.warning(f"Publishing {len(events)} events failed: {e}")
+
+
+def publish(channel, event, data):
+    publish_many([(channel, event, data)])
+
+
+def balance_changed(account, payload=None):
+    """
+    Send the owner of an account its new balance once the write commits.
+
+    `payload` is the account's cached balance; without one (hot accounts)
+    the event carries a null balance and clients fetch it again.
+    """
+    if payload is None:
+        payload = {'account_id': account.id, 'balance': None, 'currency': account.currency, 'user_id': account.user_id}
+    transaction.on_commit(partial(publish, user_channel(account.user_id), 'balance', payload))
+
+
+def transactions_changed(*transaction_ids):
+    """Send new or updated transactions to their account owners and a summary to admins once the write commits."""
+    transaction.on_commit(partial(_publish_transactions, transaction_ids))
+
+
+def _publish_transactions(transaction_ids):
+    try:
+        rows = Transaction.objects.filter(id__in=transaction_ids).order_by('created_at', 'id').values(
+            *TransactionRowSerializer.COLUMNS, 'source_account__user_id', 'destination_account__user_id'
+        )
+        events = []
+        activity = {'transactions': 0, 'amount': Decimal('0.00'), 'by_type': {}, 'by_status': {}}
+        for row in rows.iterator():
+            item = TransactionRowSerializer.serialize_row(row)
+            owners = {row['source_account__user_id'], row['destination_account__user_id']} - {None}
+            events.extend((user_channel(owner), 'transaction', item) for owner in owners)
+            activity['transactions'] += 1
+            activity['amount'] += row['amount']
+            activity['by_type'][row['transaction_type']] = activity['by_type'].get(row['transaction_type'], 0) + 1
+            activity['by_status'][row['status']] = activity['by_status'].get(row['status'], 0) + 1
+        if activity['transactions']:
+            events.append((ADMIN_CHANNEL, 'activity', activity))
+        publish_many(events)
+    except Exception as e:
+        logger.warning(f"Publishing transaction events failed: {e}")
+
+
+def _sse(message):
+    """Format a bus message as a server-sent event."""
+    payload = json.loads(message)
+    return f"event: {payload['event']}\ndata: {json.dumps(payload['data'])}\n\n"
+
+
+def stream(channels):
+    """Blocking SSE stream, for WSGI servers."""
+    subscription = get_bus().subscribe(channels)
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        yield f"retry: {settings.EVENT_STREAM_RETRY}\n\n"
+        while time.monotonic() < deadline:
+            message = subscription.get(timeout=settings.EVENT_STREAM_HEARTBEAT)
+            yield _sse(message) if message is not None else ": ping\n\n"
+    finally:
+        subscription.close()
+
+
+async def astream(channels):
+    """Non-blocking SSE stream, for ASGI servers."""
+    subscription = await get_bus().asubscribe(channels)
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        yield f"retry: {settings.EVENT_STREAM_RETRY}\n\n"
+        while time.monotonic() < deadline:
+            message = await subscription.get(timeout=settings.EVENT_STREAM_HEARTBEAT)
+            yield _sse(message) if message is not None else ": ping\n\n"
+    finally:
+        await subscription.close()
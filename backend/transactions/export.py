@@ -0,0 +1,152 @@
+"""
+Streaming export of the transaction ledger.
+
+Rows are read with `.iterator(chunk_size=...)`, which uses a server-side
+cursor on PostgreSQL, and each one is encoded and handed on as soon as it is
+read. Nothing is accumulated per row, so memory stays flat however many
+transactions are exported. Live and archived transactions are read side by
+side and merged in creation order. Output is CSV or NDJSON with the fields of
+TransactionSerializer, optionally gzip compressed.
+
+Under ASGI, Django consumes a synchronous streaming body by reading all of it
+into a list first, so `astream` wraps the same generator in an async one that
+reads each piece on the request's worker thread as it is sent.
+"""
+import csv
+import heapq
+import json
+import zlib
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedTransaction, Transaction
+from .serializers import TransactionRowSerializer
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+FIELDS = [field for field, _, _ in TransactionRowSerializer.FIELDS]
+
+# Encoded output is handed on in pieces of about this size
+BUFFER_SIZE = 64 * 1024
+
+
+def export_querysets(date_from=None, date_to=None, transaction_type=None, status=None):
+    """Live and archived transactions to export, each oldest first."""
+    querysets = []
+    for model in (Transaction, ArchivedTransaction):
+        transactions = model.objects.all()
+        if date_from:
+            transactions = transactions.filter(created_at__gte=date_from)
+        if date_to:
+            transactions = transactions.filter(created_at__lt=date_to)
+        if transaction_type:
+            transactions = transactions.filter(transaction_type=transaction_type)
+        if status:
+            transactions = transactions.filter(status=status)
+        querysets.append(transactions.order_by('created_at', 'id'))
+    return querysets
+
+
+def _merged(querysets, chunk_size):
+    """Rows of the querysets in (created_at, id) order."""
+    previous = None
+    rows = [TransactionRowSerializer.rows(queryset).iterator(chunk_size=chunk_size) for queryset in querysets]
+    for row in heapq.merge(*rows, key=lambda row: (row['created_at'], row['id'])):
+        # A row archived during the export can be read from both tables
+        if row['id'] != previous:
+            yield row
+        previous = row['id']
+
+
+class _Echo:
+    """File-like object whose write() returns the line the csv writer produced."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(items):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for item in items:
+        yield writer.writerow([_csv_value(item.get(field)) for field in FIELDS])
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def _ndjson_lines(items):
+    for item in items:
+        yield json.dumps(item, cls=DjangoJSONEncoder) + '\n'
+
+
+def _buffered(lines):
+    """Join encoded lines into pieces of about BUFFER_SIZE bytes."""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(pieces):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream(querysets, file_format='csv', gzip=False, chunk_size=2000):
+    """Yield the export of one or more querysets as bytes."""
+    if file_format not in FORMATS:
+        raise ValueError(f"file_format must be one of {', '.join(FORMATS)}")
+    if not isinstance(querysets, (list, tuple)):
+        querysets = [querysets]
+    items = (TransactionRowSerializer.serialize_row(row) for row in _merged(querysets, chunk_size))
+    lines = _csv_lines(items) if file_format == 'csv' else _ndjson_lines(items)
+    pieces = _buffered(lines)
+    return _gzipped(pieces) if gzip else pieces
+
+
+def astream(querysets, file_format='csv', gzip=False, chunk_size=2000):
+    """`stream` as an async iterator, for ASGI servers."""
+    return _apieces(stream(querysets, file_format=file_format, gzip=gzip, chunk_size=chunk_size))
+
+
+async def _apieces(pieces):
+    # Thread sensitive, so every piece is read on the thread (and database
+    # connection) that opened the cursors
+    read = sync_to_async(next)
+    try:
+        while True:
+            piece = await read(pieces, None)
+            if piece is None:
+                return
+            yield piece
+    finally:
+        await sync_to_async(pieces.close)()
+
+
+def filename(file_format, gzip=False):
+    extension = FORMATS[file_format][1]
+    return f"transactions.{extension}.gz" if gzip else f"transactions.{extension}"
+
+
+def content_type(file_format, gzip=False):
+    return 'application/gzip' if gzip else FORMATS[file_format][0]
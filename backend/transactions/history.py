@@ -0,0 +1,33 @@
+"""
+Transaction history pages of an account.
+
+Both sides of the account's history are read separately, each served by its
+own (account, created_at) index, and merged into keyset pages. Older pages
+continue into the archive once they reach past the live rows.
+"""
+from core.pagination import paginate
+
+from . import archive
+from .models import ArchivedTransaction, Transaction
+from .serializers import TransactionRowSerializer
+
+
+def account_sides(model, account_id):
+    return [
+        TransactionRowSerializer.rows(model.objects.filter(source_account_id=account_id)),
+        TransactionRowSerializer.rows(model.objects.filter(destination_account_id=account_id)),
+    ]
+
+
+def page(account_id, cursor=None, page_size=50):
+    """One serialized page of an account's transactions, newest first."""
+    result = paginate(
+        account_sides(Transaction, account_id), cursor=cursor, page_size=page_size,
+        archive=account_sides(ArchivedTransaction, account_id), archived_until=archive.archived_until
+    )
+    return {
+        'next': result['next'],
+        'previous': result['previous'],
+        'page_size': page_size,
+        'results': TransactionRowSerializer.serialize(result['results']),
+    }
@@ -0,0 +1,226 @@
+"""
+Idempotency store for the engine's write endpoints.
+
+A request's idempotency key is hashed together with the endpoint scope and
+reserved with a single INSERT before the view runs. The finished response is
+stored on the record and in the cache, so a replay is answered from the cache
+without touching the database. A duplicate that arrives while the first
+request is still running waits for its result, and gets a 409 if it does not
+finish in time, instead of failing on the transactions unique constraint.
+
+The record also keeps a hash of the request body. A request that reuses a
+key with a different body gets a 422 instead of the first request's result.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+RELEASED = object()
+
+
+def key_hash(scope, key):
+    return hashlib.sha256(f'{scope}:{key}'.encode()).hexdigest()
+
+
+def request_hash(request):
+    """SHA-256 of the request body, to tell a retry from another request reusing its key."""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _cache_key(digest):
+    return f'idempotency_{digest}'
+
+
+def _replay(stored, request, body_hash):
+    """
+    Response for a stored result, a 409 when the key belongs to someone else,
+    or a 422 when it was used for a different request.
+    """
+    if stored['user_id'] != request.user.id and not request.user.is_staff:
+        return Response(
+            {'error': 'This idempotency key has already been used'},
+            status=status.HTTP_409_CONFLICT
+        )
+    # Records stored before request hashes were kept have none to compare
+    if stored.get('request_hash') and stored['request_hash'] != body_hash:
+        return Response(
+            {'error': 'This idempotency key has already been used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    replay_status = stored['status']
+    if replay_status == status.HTTP_201_CREATED:
+        replay_status = status.HTTP_200_OK
+    return Response(stored['body'], status=replay_status)
+
+
+def _stored(record):
+    return {
+        'user_id': record.user_id,
+        'request_hash': record.request_hash,
+        'status': record.response_status,
+        'body': record.response_body,
+    }
+
+
+def _reserve(digest, user_id, body_hash):
+    """
+    Try to reserve a key. Returns None when the reservation was taken, or the
+    existing record when someone else holds (or finished) it.
+    """
+    now = timezone.now()
+    record = IdempotencyRecord(
+        key_hash=digest,
+        user_id=user_id,
+        request_hash=body_hash,
+        locked_until=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT),
+        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_TTL),
+    )
+    try:
+        with transaction.atomic():
+            record.save(force_insert=True)
+        return None
+    except IntegrityError:
+        pass
+
+    # Expired keys and abandoned reservations can be taken over
+    with transaction.atomic():
+        existing = IdempotencyRecord.objects.select_for_update().filter(key_hash=digest).first()
+        if existing is None:
+            record.save(force_insert=True)
+            return None
+        expired = existing.expires_at <= now
+        abandoned = existing.status == 'IN_PROGRESS' and existing.locked_until <= now
+        if expired or abandoned:
+            existing.user_id = user_id
+            existing.request_hash = body_hash
+            existing.status = 'IN_PROGRESS'
+            existing.response_status = None
+            existing.response_body = None
+            existing.locked_until = record.locked_until
+            existing.expires_at = record.expires_at
+            existing.save()
+            return None
+        return existing
+
+
+def _wait_for(digest, deadline):
+    """
+    Wait for a reservation held by another request to finish.
+
+    Returns the stored result, RELEASED when the other request gave the key
+    back, or None when the deadline passed.
+    """
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        stored = cache.get(_cache_key(digest))
+        if stored is not None:
+            return stored
+        record = IdempotencyRecord.objects.filter(key_hash=digest).first()
+        if record is None:
+            return RELEASED
+        if record.status == 'COMPLETED':
+            return _stored(record)
+    return None
+
+
+def _complete(digest, user_id, body_hash, response):
+    # Store the JSON form of the body so cached and database replays are identical
+    body = json.loads(json.dumps(response.data, cls=DjangoJSONEncoder))
+    IdempotencyRecord.objects.filter(key_hash=digest).update(
+        status='COMPLETED',
+        response_status=response.status_code,
+        response_body=body,
+    )
+    stored = {'user_id': user_id, 'request_hash': body_hash, 'status': response.status_code, 'body': body}
+    cache.set(_cache_key(digest), stored, settings.IDEMPOTENCY_TTL)
+
+
+def _release(digest):
+    IdempotencyRecord.objects.filter(key_hash=digest, status='IN_PROGRESS').delete()
+
+
+def idempotent(scope, should_store=None):
+    """
+    Decorator for write views that take an `idempotency_key` in the request body.
+
+    `should_store(response)` decides whether a response is final and must be
+    replayed for the same key. By default successful (2xx) responses are
+    stored; anything else releases the key so the client can retry.
+    """
+    if should_store is None:
+        def should_store(response):
+            return 200 <= response.status_code < 300
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            key = request.data.get('idempotency_key') if hasattr(request.data, 'get') else None
+            if not isinstance(key, str) or not key:
+                return view_func(request, *args, **kwargs)
+
+            digest = key_hash(scope, key)
+            body_hash = request_hash(request)
+            stored = cache.get(_cache_key(digest))
+            if stored is not None:
+                logger.info(f"Idempotent request served from cache for key: {key}")
+                return _replay(stored, request, body_hash)
+
+            deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+            while True:
+                existing = _reserve(digest, request.user.id, body_hash)
+                if existing is None:
+                    break
+                if existing.status == 'COMPLETED':
+                    stored = _stored(existing)
+                    cache.set(_cache_key(digest), stored, settings.IDEMPOTENCY_TTL)
+                    return _replay(stored, request, body_hash)
+                stored = _wait_for(digest, deadline)
+                if stored is None:
+                    return Response(
+                        {'error': 'A request with this idempotency key is already in progress'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                if stored is not RELEASED:
+                    return _replay(stored, request, body_hash)
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                _release(digest)
+                raise
+            if should_store(response):
+                _complete(digest, request.user.id, body_hash, response)
+            else:
+                _release(digest)
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=10000):
+    """Delete expired records in batches. Returns the number deleted."""
+    deleted = 0
+    while True:
+        expired = list(
+            IdempotencyRecord.objects.filter(expires_at__lte=timezone.now())
+            .values_list('key_hash', flat=True)[:batch_size]
+        )
+        if not expired:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(key_hash__in=expired).delete()[0]
@@ -0,0 +1,86 @@
+"""
+Double-entry ledger postings.
+
+The engine calls `post` inside its atomic blocks once balances have been
+updated, so each entry carries the account's running balance. Statements and
+"balance as of" queries then read a single (account, created_at) range.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import LedgerEntry
+
+
+def entry(trans, entry_type, account=None, balance_after=None, amount=None):
+    """Build (without saving) one side of a posting."""
+    return LedgerEntry(
+        transaction=trans,
+        account=account,
+        entry_type=entry_type,
+        amount=trans.amount if amount is None else amount,
+        balance_after=balance_after,
+    )
+
+
+def post(trans, debit_account=None, debit_balance=None, credit_account=None, credit_balance=None):
+    """
+    Write the DEBIT and CREDIT entries of a completed transaction.
+
+    Pass the account balances as they are after the transaction was applied.
+    A missing account stands for the external side of a deposit or withdrawal.
+    """
+    return LedgerEntry.objects.bulk_create([
+        entry(trans, 'DEBIT', debit_account, debit_balance),
+        entry(trans, 'CREDIT', credit_account, credit_balance),
+    ])
+
+
+def balance_as_of(account, at):
+    """
+    Balance of an account at time `at` (exclusive), read from the ledger.
+
+    Uses the last entry with a running balance before `at` and adds any later
+    shard credits that were posted without one.
+    """
+    entries = LedgerEntry.objects.filter(account=account, created_at__lt=at)
+    anchor = entries.filter(balance_after__isnull=False).order_by('-created_at', '-id').first()
+    balance = anchor.balance_after if anchor else Decimal('0.00')
+    unanchored = entries.filter(balance_after__isnull=True, entry_type='CREDIT')
+    if anchor:
+        unanchored = unanchored.filter(created_at__gte=anchor.created_at, id__gt=anchor.id)
+    return balance + (unanchored.aggregate(total=Sum('amount'))['total'] or Decimal('0.00'))
+
+
+def monthly_totals(account_id, months=6):
+    """
+    Credits and debits of an account per calendar month, oldest first: the
+    current month and the `months - 1` before it, including empty ones.
+    """
+    starts = [timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)]
+    while len(starts) < months:
+        starts.append((starts[-1] - timedelta(days=1)).replace(day=1))
+    starts.reverse()
+
+    totals = {}
+    rows = (
+        LedgerEntry.objects.filter(account_id=account_id, created_at__gte=starts[0])
+        .annotate(month=TruncMonth('created_at'))
+        .values('month', 'entry_type')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for row in rows:
+        totals[(row['month'].strftime('%Y-%m'), row['entry_type'])] = Decimal(row['total']).quantize(Decimal('0.01'))
+
+    result = []
+    for start in starts:
+        month = start.strftime('%Y-%m')
+        result.append({
+            'month': month,
+            'credits': str(totals.get((month, 'CREDIT'), Decimal('0.00'))),
+            'debits': str(totals.get((month, 'DEBIT'), Decimal('0.00'))),
+        })
+    return result
@@ -0,0 +1,46 @@
+"""
+Django management command to move old settled transactions to the archive table.
+
+Usage:
+    python manage.py archive_transactions
+    python manage.py archive_transactions --days 180 --batch-size 5000
+    python manage.py archive_transactions --max-batches 100 --dry-run
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transactions import archive
+
+
+class Command(BaseCommand):
+    help = 'Moves settled transactions older than the archive horizon to transactions_archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.TRANSACTION_ARCHIVE_AFTER_DAYS,
+                            help='Archive transactions created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Transactions moved per database transaction')
+        parser.add_argument('--max-batches', type=int,
+                            help='Stop after this many batches (default: until nothing is left)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the transactions that would be archived')
+
+    def handle(self, *args, **options):
+        horizon = timedelta(days=options['days'])
+        if horizon.total_seconds() <= settings.IDEMPOTENCY_TTL:
+            raise CommandError(
+                f'--days must cover more than IDEMPOTENCY_TTL ({settings.IDEMPOTENCY_TTL}s), '
+                'retries of archived transactions would not be detected as duplicates'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        before = timezone.now() - horizon
+
+        if options['dry_run']:
+            count = archive.eligible(before).count()
+            self.stdout.write(f'{count} transactions created before {before.isoformat()} would be archived')
+            return
+
+        moved = archive.archive(before, batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} transactions created before {before.isoformat()}'))
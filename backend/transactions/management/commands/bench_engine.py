@@ -0,0 +1,90 @@
+"""
+Django management command that benchmarks the transaction engine.
+
+Seeds funded benchmark users (reused on later runs), drives a mix of
+deposits, transfers, withdrawals, balance and history reads at the engine and
+prints throughput, latency percentiles, lock wait time and error counts as
+JSON. Requests go through Django's test client in this process, or to a
+running server with --url (which must share this database and SECRET_KEY, as
+tokens are minted locally).
+
+Usage:
+    python manage.py bench_engine
+    python manage.py bench_engine --users 500 --requests 20000 --concurrency 16
+    python manage.py bench_engine --contention hot --hot-accounts 1 --hot-share 0.9
+    python manage.py bench_engine --mix deposit=10,transfer=80,balance=10 --pool process
+    python manage.py bench_engine --url http://localhost:8000/api --output bench.json
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from transactions import bench
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks engine throughput and latency and reports the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='Benchmark users to seed and spread the load over')
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Total operations to run')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Workers issuing operations at once')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run workers as threads or processes')
+        parser.add_argument('--mix', type=str, default=bench.DEFAULT_MIX,
+                            help=f'Relative weights of {", ".join(bench.OPERATIONS)}')
+        parser.add_argument('--contention', choices=bench.CONTENTION, default='uniform',
+                            help='Spread operations evenly or concentrate them on hot accounts')
+        parser.add_argument('--hot-accounts', type=int, default=1,
+                            help='Accounts that take the hot traffic')
+        parser.add_argument('--hot-share', type=float, default=0.9,
+                            help='Share of operations aimed at the hot accounts')
+        parser.add_argument('--url', type=str,
+                            help='Base API URL of a running server instead of the in-process test client')
+        parser.add_argument('--prefix', type=str, default='bench',
+                            help='Username prefix of the benchmark users')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed, for a repeatable operation plan')
+        parser.add_argument('--output', type=str,
+                            help='Write the report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--users must be at least 2, --requests and --concurrency positive')
+        if not 0 <= options['hot_share'] <= 1:
+            raise CommandError('--hot-share must be between 0 and 1')
+        try:
+            mix = bench.parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        accounts = bench.seed(options['users'], prefix=options['prefix'])
+        operations = bench.plan(
+            accounts,
+            options['requests'],
+            mix,
+            contention=options['contention'],
+            hot_accounts=options['hot_accounts'],
+            hot_share=options['hot_share'],
+            seed=options['seed']
+        )
+        samples, elapsed = bench.run(
+            operations,
+            bench.tokens(user_id for user_id, _ in accounts),
+            concurrency=options['concurrency'],
+            pool=options['pool'],
+            url=options['url']
+        )
+
+        config = {name: options[name] for name in (
+            'users', 'requests', 'concurrency', 'pool', 'contention', 'hot_accounts', 'hot_share', 'url', 'seed'
+        )}
+        config['mix'] = mix
+        report = json.dumps(bench.report(samples, elapsed, config), indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(report)
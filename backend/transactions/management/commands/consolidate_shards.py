@@ -0,0 +1,59 @@
+"""
+Django management command to fold hot account shards back into their balance.
+
+Usage:
+    python manage.py consolidate_shards
+    python manage.py consolidate_shards --interval 30
+    python manage.py consolidate_shards --enable 42 --shards 16
+    python manage.py consolidate_shards --disable 42
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from transactions.models import Account
+from transactions.shards import consolidate, enable_hot_mode, disable_hot_mode
+
+
+class Command(BaseCommand):
+    help = 'Consolidates sharded sub-balances of hot accounts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and consolidate every N seconds')
+        parser.add_argument('--enable', type=int, metavar='ACCOUNT_ID',
+                            help='Turn on hot account mode for an account')
+        parser.add_argument('--shards', type=int, default=16,
+                            help='Number of shard rows used with --enable')
+        parser.add_argument('--disable', type=int, metavar='ACCOUNT_ID',
+                            help='Turn off hot account mode for an account')
+
+    def handle(self, *args, **options):
+        try:
+            if options['enable']:
+                if options['shards'] < 1:
+                    raise CommandError('--shards must be at least 1')
+                account = enable_hot_mode(options['enable'], options['shards'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'Account {account.id} is now hot with {account.shard_count} shards'
+                ))
+                return
+            if options['disable']:
+                account = disable_hot_mode(options['disable'])
+                self.stdout.write(self.style.SUCCESS(
+                    f'Account {account.id} is no longer hot, balance {account.currency} {account.balance}'
+                ))
+                return
+        except Account.DoesNotExist:
+            raise CommandError('Account not found')
+
+        while True:
+            self.consolidate_all()
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def consolidate_all(self):
+        consolidated = 0
+        for account_id in Account.objects.filter(is_hot=True).values_list('id', flat=True).iterator():
+            if consolidate(account_id):
+                consolidated += 1
+        self.stdout.write(self.style.SUCCESS(f'Consolidated shards of {consolidated} hot accounts'))
@@ -0,0 +1,60 @@
+"""
+Django management command to export the transaction ledger as CSV or NDJSON.
+
+Usage:
+    python manage.py export_transactions --output ledger.csv
+    python manage.py export_transactions --file-format ndjson --gzip --output ledger.ndjson.gz
+    python manage.py export_transactions --from 2024-01-01 --to 2024-02-01 --type WITHDRAWAL --status COMPLETED
+"""
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from core.utils import parse_datetime_param
+from transactions import export
+
+
+class Command(BaseCommand):
+    help = 'Streams the transaction ledger to a file or stdout with flat memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file-format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--output', type=str, default='-',
+                            help='File to write to, "-" for stdout')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--from', dest='date_from', type=str,
+                            help='Only transactions created at or after this ISO date/datetime')
+        parser.add_argument('--to', dest='date_to', type=str,
+                            help='Only transactions created before this ISO date/datetime')
+        parser.add_argument('--type', type=str, help='Transaction type (DEPOSIT, TRANSFER, WITHDRAWAL)')
+        parser.add_argument('--status', type=str, help='Transaction status (PENDING, COMPLETED, FAILED)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched per round trip from the database cursor')
+
+    def handle(self, *args, **options):
+        try:
+            querysets = export.export_querysets(
+                date_from=parse_datetime_param(options['date_from'], '--from'),
+                date_to=parse_datetime_param(options['date_to'], '--to'),
+                transaction_type=options['type'],
+                status=options['status'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        pieces = export.stream(
+            querysets,
+            file_format=options['file_format'],
+            gzip=options['gzip'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['output'] == '-':
+            for piece in pieces:
+                sys.stdout.buffer.write(piece)
+            sys.stdout.buffer.flush()
+            return
+
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for piece in pieces:
+                output.write(piece)
+                written += len(piece)
+        self.stderr.write(self.style.SUCCESS(f"Exported transactions to {options['output']} ({written} bytes)"))
@@ -0,0 +1,99 @@
+"""
+Django management command that sends queued withdrawal payouts to the gateway.
+
+Run several of these (on one or more hosts) to scale out; claims use SKIP
+LOCKED, so workers never pick up the same payout.
+
+Payouts whose outcome stayed unknown are parked for review. Send them again
+once the provider is reachable with --requeue-parked, or settle one whose
+outcome was confirmed with the provider with --resolve.
+
+Usage:
+    python manage.py process_withdrawals
+    python manage.py process_withdrawals --once
+    python manage.py process_withdrawals --batch-size 100 --concurrency 16
+    python manage.py process_withdrawals --requeue-parked
+    python manage.py process_withdrawals --resolve <withdrawal_id> --outcome completed --reference EXT-123
+    python manage.py process_withdrawals --resolve <withdrawal_id> --outcome failed --reason "Rejected by provider"
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from transactions import payouts
+from transactions.models import WithdrawalOutbox
+
+
+class Command(BaseCommand):
+    help = 'Processes queued withdrawals through the payout gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Payouts claimed per round trip')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Gateway calls in flight at once (default 8, 1 on SQLite)')
+        parser.add_argument('--interval', type=float, default=1,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no payout is due instead of polling')
+        parser.add_argument('--requeue-parked', action='store_true',
+                            help='Send the payouts parked for review again, then exit')
+        parser.add_argument('--resolve', metavar='WITHDRAWAL_ID',
+                            help='Settle a parked payout with --outcome, then exit')
+        parser.add_argument('--outcome', choices=['completed', 'failed'],
+                            help='Confirmed outcome of the payout given to --resolve')
+        parser.add_argument('--reference', default=None,
+                            help='Provider reference of a completed payout')
+        parser.add_argument('--reason', default='Resolved by hand',
+                            help='Failure reason of a failed payout')
+
+    def handle(self, *args, **options):
+        if options['requeue_parked']:
+            count = payouts.requeue_parked()
+            self.stdout.write(self.style.SUCCESS(f"Payouts requeued: {count}"))
+            return
+        if options['resolve']:
+            self.resolve(options)
+            return
+
+        if options['concurrency'] is None:
+            # SQLite only allows a single writer
+            options['concurrency'] = 1 if connection.vendor == 'sqlite' else 8
+        if options['batch_size'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--batch-size and --concurrency must be positive')
+
+        gateway = payouts.get_gateway()
+        totals = {'COMPLETED': 0, 'FAILED': 0, 'RETRY': 0, 'REVIEW': 0}
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            while True:
+                claimed = payouts.claim(batch_size=options['batch_size'])
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                for outcome in pool.map(lambda outbox: self.process(outbox, gateway), claimed):
+                    totals[outcome] += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Payouts completed: {totals['COMPLETED']}, failed: {totals['FAILED']}, retried: {totals['RETRY']}, "
+            f"parked for review: {totals['REVIEW']}"
+        ))
+
+    def resolve(self, options):
+        if options['outcome'] is None:
+            raise CommandError('--resolve needs --outcome completed or failed')
+        success = options['outcome'] == 'completed'
+        result = payouts.PayoutResult(success, options['reference'], None if success else options['reason'])
+        try:
+            outcome = payouts.resolve(options['resolve'], result)
+        except WithdrawalOutbox.DoesNotExist:
+            raise CommandError(f"No payout parked for review for withdrawal {options['resolve']}")
+        self.stdout.write(self.style.SUCCESS(f"Withdrawal {options['resolve']} settled as {outcome}"))
+
+    def process(self, outbox, gateway):
+        try:
+            return payouts.process(outbox, gateway)
+        finally:
+            # Worker threads open their own connections
+            connection.close()
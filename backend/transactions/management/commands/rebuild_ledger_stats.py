@@ -0,0 +1,23 @@
+"""
+Django management command to rebuild the admin dashboard counters from the ledger.
+
+Usage:
+    python manage.py rebuild_ledger_stats
+"""
+from django.core.management.base import BaseCommand
+from transactions import stats as ledger_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the incrementally maintained ledger statistics from scratch'
+
+    def handle(self, *args, **options):
+        before = ledger_stats.read()
+        after = ledger_stats.rebuild()
+        for name in ledger_stats.COUNTERS:
+            drift = after[name] - before[name]
+            line = f'  {name}: {after[name]}'
+            if drift:
+                line += f' (was {before[name]}, drift {drift})'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS('Ledger statistics rebuilt'))
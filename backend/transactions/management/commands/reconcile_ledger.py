@@ -0,0 +1,133 @@
+"""
+Django management command to check account balances against the transaction ledger.
+
+Usage:
+    python manage.py reconcile_ledger
+    python manage.py reconcile_ledger --workers 8 --range-size 100000
+    python manage.py reconcile_ledger --incremental --checkpoint /var/lib/nissmart/reconcile.json
+    python manage.py reconcile_ledger --repair-plan --json
+"""
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from transactions.models import Account
+from transactions.reconciliation import reconcile_range, split_ranges
+
+
+class Command(BaseCommand):
+    help = 'Reconciles account balances against COMPLETED transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Number of worker processes (1 runs in-process)')
+        parser.add_argument('--range-size', type=int, default=50000,
+                            help='Accounts per unit of work; bounds per-worker memory')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows fetched per round trip while streaming')
+        parser.add_argument('--checkpoint', type=str, default='reconcile_checkpoint.json',
+                            help='File the start time of the last successful run is saved to')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only check accounts touched since the saved checkpoint')
+        parser.add_argument('--overlap', type=int, default=300,
+                            help='Seconds to re-scan before the checkpoint to cover in-flight commits')
+        parser.add_argument('--repair-plan', action='store_true',
+                            help='Print the balance adjustments that would fix each drifted account')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['range_size'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers, --range-size and --chunk-size must be positive')
+
+        since = None
+        if options['incremental']:
+            since = self.load_checkpoint(options['checkpoint'])
+            if since is not None:
+                since -= timedelta(seconds=options['overlap'])
+
+        started_at = timezone.now()
+        started = time.monotonic()
+        bounds = Account.objects.aggregate(low=Min('id'), high=Max('id'))
+        ranges = split_ranges(bounds['low'], bounds['high'], options['range_size'])
+        jobs = [(low, high, since, options['chunk_size']) for low, high in ranges]
+
+        if options['workers'] == 1 or len(jobs) <= 1:
+            results = [reconcile_range(*job) for job in jobs]
+        else:
+            # Children must open their own connections instead of sharing the parent's
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(reconcile_range, *zip(*jobs)))
+
+        elapsed = time.monotonic() - started
+        drifted = [item for result in results for item in result['drifted']]
+        transactions_scanned = sum(result['transactions'] for result in results)
+        report = {
+            'mode': 'incremental' if since is not None else 'full',
+            'since': since.isoformat() if since is not None else None,
+            'accounts_checked': sum(result['accounts'] for result in results),
+            'transactions_scanned': transactions_scanned,
+            'ranges': len(ranges),
+            'workers': options['workers'],
+            'elapsed_seconds': round(elapsed, 3),
+            'transactions_per_second': round(transactions_scanned / elapsed) if elapsed else None,
+            'drifted_accounts': len(drifted),
+            'drifted': drifted,
+        }
+        if options['repair_plan']:
+            report['repair_plan'] = [
+                {
+                    'account_id': item['account_id'],
+                    'adjustment': str(Decimal(item['expected']) - Decimal(item['balance'])),
+                    'set_balance_to': item['expected'],
+                }
+                for item in drifted
+            ]
+
+        self.save_checkpoint(options['checkpoint'], started_at)
+        self.print_report(report, options['json'])
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as checkpoint:
+                return datetime.fromisoformat(json.load(checkpoint)['completed_at'])
+        except FileNotFoundError:
+            self.stderr.write(self.style.WARNING(f'No checkpoint at {path}, running a full reconciliation'))
+            return None
+        except (ValueError, KeyError) as e:
+            raise CommandError(f'Invalid checkpoint file {path}: {e}')
+
+    def save_checkpoint(self, path, started_at):
+        with open(path, 'w') as checkpoint:
+            json.dump({'completed_at': started_at.isoformat()}, checkpoint)
+
+    def print_report(self, report, as_json):
+        if as_json:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"Reconciled {report['accounts_checked']} accounts ({report['mode']}) "
+            f"from {report['transactions_scanned']} transactions in {report['elapsed_seconds']}s "
+            f"({report['transactions_per_second'] or 0} tx/s, {report['workers']} workers)"
+        )
+        for item in report['drifted']:
+            self.stdout.write(self.style.ERROR(
+                f"  Account {item['account_id']}: balance {item['balance']}, "
+                f"ledger {item['expected']}, drift {item['drift']}"
+            ))
+        for step in report.get('repair_plan', []):
+            self.stdout.write(
+                f"  REPAIR account {step['account_id']}: adjust by {step['adjustment']} "
+                f"to {step['set_balance_to']}"
+            )
+        if report['drifted_accounts']:
+            self.stdout.write(self.style.ERROR(f"{report['drifted_accounts']} accounts have drifted"))
+        else:
+            self.stdout.write(self.style.SUCCESS('All balances match the ledger'))
@@ -0,0 +1,79 @@
+"""
+Django management command that seeds a large synthetic dataset.
+
+Creates customers with funded accounts and a history of deposits, transfers
+and withdrawals spread over the last --days days, with ledger entries and
+balances that reconcile. Shards of users are generated and written in
+parallel; on PostgreSQL rows are loaded with COPY.
+
+Usage:
+    python manage.py seed_dataset
+    python manage.py seed_dataset --users 1000000 --transactions 20000000 --processes 16
+    python manage.py seed_dataset --users 50000 --transactions 1000000 --days 90 --seed 42
+"""
+import os
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from transactions import dataset
+
+
+class Command(BaseCommand):
+    help = 'Seeds users, accounts and transactions in bulk for performance work'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000,
+                            help='Users (each with an account) to create')
+        parser.add_argument('--transactions', type=int, default=200000,
+                            help='Transactions to create')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Length of the simulated history, ending now')
+        parser.add_argument('--shard-size', type=int, default=10000,
+                            help='Users per shard; transfers stay within a shard')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Shards generated at once (default one per CPU, 1 on SQLite)')
+        parser.add_argument('--batch-size', type=int, default=50000,
+                            help='Rows per COPY or INSERT statement batch')
+        parser.add_argument('--password', type=str, default='password123',
+                            help='Password of every generated user')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed, for a repeatable dataset')
+
+    def handle(self, *args, **options):
+        if options['processes'] is None:
+            # SQLite only allows a single writer
+            options['processes'] = 1 if connection.vendor == 'sqlite' else os.cpu_count() or 1
+        for name in ('users', 'days', 'shard_size', 'processes', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        if options['transactions'] < 0:
+            raise CommandError('--transactions must not be negative')
+
+        shards = dataset.plan_shards(options['users'], options['transactions'], options['shard_size'])
+        # Hashing is deliberately slow, so every user shares one hash
+        password = make_password(options['password'])
+        started = time.monotonic()
+
+        def progress(shard, totals):
+            self.stdout.write(
+                f"Shard {shard.index + 1}/{len(shards)}: {totals['users']} users, "
+                f"{shard.transactions} transactions ({time.monotonic() - started:.1f}s)"
+            )
+
+        totals = dataset.run(
+            shards,
+            options['days'],
+            password,
+            processes=options['processes'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress
+        )
+        elapsed = time.monotonic() - started
+        transactions = totals['DEPOSIT'] + totals['TRANSFER'] + totals['WITHDRAWAL']
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {totals['users']} users and {transactions} transactions "
+            f"({totals['DEPOSIT']} deposits, {totals['TRANSFER']} transfers, {totals['WITHDRAWAL']} withdrawals) "
+            f"in {elapsed:.1f}s, {transactions / elapsed if elapsed else 0:.0f} transactions/s"
+        ))
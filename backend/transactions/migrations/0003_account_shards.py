@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:02
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='is_hot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='AccountShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('index', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=0.0, max_digits=15, validators=[django.core.validators.MinValueValidator(0)])),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='transactions.account')),
+            ],
+            options={
+                'db_table': 'account_shards',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountshard',
+            constraint=models.UniqueConstraint(fields=('account', 'index'), name='unique_account_shard'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountshard',
+            constraint=models.CheckConstraint(check=models.Q(('balance__gte', 0)), name='non_negative_shard_balance'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:04
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_counters(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Account = apps.get_model('transactions', 'Account')
+    AccountShard = apps.get_model('transactions', 'AccountShard')
+    Transaction = apps.get_model('transactions', 'Transaction')
+    LedgerCounter = apps.get_model('transactions', 'LedgerCounter')
+
+    by_type = dict(
+        Transaction.objects.values('transaction_type').annotate(total=Count('id')).values_list('transaction_type', 'total')
+    )
+    stats = {
+        'total_users': User.objects.count(),
+        'total_wallets_value': (Account.objects.aggregate(total=Sum('balance'))['total'] or 0) + (
+            AccountShard.objects.aggregate(total=Sum('balance'))['total'] or 0
+        ),
+        'total_transfers': by_type.get('TRANSFER', 0),
+        'total_withdrawals': by_type.get('WITHDRAWAL', 0),
+        'total_deposits': by_type.get('DEPOSIT', 0),
+        'total_transactions': sum(by_type.values()),
+    }
+    LedgerCounter.objects.bulk_create([
+        LedgerCounter(name=name, slot=slot, value=value if slot == 0 else 0)
+        for name, value in stats.items()
+        for slot in range(8)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0003_account_shards'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ledger_counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='ledgercounter',
+            constraint=models.UniqueConstraint(fields=('name', 'slot'), name='unique_ledger_counter_slot'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
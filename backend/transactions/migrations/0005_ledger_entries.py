@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:06
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_entries(apps, schema_editor):
+    """Replay completed transactions into debit/credit entries with running balances."""
+    Transaction = apps.get_model('transactions', 'Transaction')
+    LedgerEntry = apps.get_model('transactions', 'LedgerEntry')
+    # Entries keep the timestamp of the transaction they belong to
+    LedgerEntry._meta.get_field('created_at').auto_now_add = False
+
+    running = {}
+    batch = []
+
+    def side(trans, entry_type, account_id, sign):
+        balance_after = None
+        if account_id is not None:
+            running[account_id] = running.get(account_id, 0) + sign * trans.amount
+            balance_after = running[account_id]
+        return LedgerEntry(
+            transaction_id=trans.id,
+            account_id=account_id,
+            entry_type=entry_type,
+            amount=trans.amount,
+            balance_after=balance_after,
+            created_at=trans.created_at,
+        )
+
+    completed = Transaction.objects.filter(status='COMPLETED').order_by('created_at', 'id')
+    for trans in completed.iterator(chunk_size=2000):
+        batch.append(side(trans, 'DEBIT', trans.source_account_id, -1))
+        batch.append(side(trans, 'CREDIT', trans.destination_account_id, 1))
+        if len(batch) >= 2000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_ledger_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('entry_type', models.CharField(choices=[('DEBIT', 'Debit'), ('CREDIT', 'Credit')], max_length=6)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='transactions.account')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='transactions.transaction')),
+            ],
+            options={
+                'db_table': 'ledger_entries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['account', 'created_at', 'id'], name='ledger_entr_account_2daba4_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_entries, migrations.RunPython.noop),
+    ]
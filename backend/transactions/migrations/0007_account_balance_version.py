@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_idempotency_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='balance_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
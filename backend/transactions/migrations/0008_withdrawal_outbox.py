@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_account_balance_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WithdrawalOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('withdrawal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='transactions.withdrawal')),
+            ],
+            options={
+                'db_table': 'withdrawal_outbox',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['available_at'], name='withdrawal_outbox_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_withdrawal_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='transaction',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='entries', to='transactions.transaction'),
+        ),
+        migrations.AlterField(
+            model_name='transferrequest',
+            name='transaction',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='transfer_request', to='transactions.transaction'),
+        ),
+        migrations.AlterField(
+            model_name='withdrawal',
+            name='transaction',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='withdrawal', to='transactions.transaction'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('DEPOSIT', 'Deposit'), ('TRANSFER', 'Transfer'), ('WITHDRAWAL', 'Withdrawal')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], max_length=20)),
+                ('idempotency_key', models.CharField(max_length=255, unique=True)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('destination_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='transactions.account')),
+                ('source_account', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='transactions.account')),
+            ],
+            options={
+                'db_table': 'transactions_archive',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['source_account', 'created_at'], name='transaction_source__ae94d9_idx'), models.Index(fields=['destination_account', 'created_at'], name='transaction_destina_2f52ac_idx'), models.Index(fields=['status', 'created_at'], name='transaction_status_abf004_idx'), models.Index(fields=['created_at'], name='transaction_created_d47853_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:47
+
+from django.db import migrations, models
+
+TABLES = ('transactions', 'transactions_archive')
+# transactions.search.METADATA_KEYS when this migration was written
+METADATA_KEYS = ('user_id', 'batch_key', 'external_success')
+
+
+def _metadata_indexes(vendor):
+    """(name, CREATE INDEX statement) of the metadata search indexes for a database vendor."""
+    indexes = []
+    for table in TABLES:
+        if vendor == 'postgresql':
+            # Containment (key=value) goes through GIN, key presence through a partial index per key
+            indexes.append((f'{table}_metadata_gin', f'CREATE INDEX {table}_metadata_gin ON {table} USING gin (metadata jsonb_path_ops)'))
+            for key in METADATA_KEYS:
+                name = f'{table}_meta_{key}_idx'
+                indexes.append((name, f"CREATE INDEX {name} ON {table} (created_at, id) WHERE metadata ? '{key}'"))
+        elif vendor == 'sqlite':
+            # Must match the expression transactions.search.MetadataKey compiles to; values and presence each get one
+            for key in METADATA_KEYS:
+                path = f'JSON_EXTRACT("metadata", \'$."{key}"\')'
+                name = f'{table}_meta_{key}_value_idx'
+                indexes.append((name, f'CREATE INDEX {name} ON {table} ({path}, created_at, id) WHERE {path} IS NOT NULL'))
+                name = f'{table}_meta_{key}_idx'
+                indexes.append((name, f'CREATE INDEX {name} ON {table} (created_at, id) WHERE {path} IS NOT NULL'))
+    return indexes
+
+
+def create_metadata_indexes(apps, schema_editor):
+    for _, statement in _metadata_indexes(schema_editor.connection.vendor):
+        schema_editor.execute(statement)
+
+
+def drop_metadata_indexes(apps, schema_editor):
+    for name, _ in _metadata_indexes(schema_editor.connection.vendor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_transactions_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archivedtransaction',
+            name='transaction_created_d47853_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['transaction_type', 'status', 'created_at'], name='transaction_transac_f6b99c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['amount', 'created_at'], name='transaction_amount_289706_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_created_321fec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'status', 'created_at'], name='transaction_transac_375222_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount', 'created_at'], name='transaction_amount_4235da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_created_eb5c48_idx'),
+        ),
+        migrations.RunPython(create_metadata_indexes, drop_metadata_indexes),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0012_idempotency_request_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='withdrawaloutbox',
+            name='withdrawal_outbox_due_idx',
+        ),
+        migrations.AddField(
+            model_name='withdrawaloutbox',
+            name='needs_review_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawaloutbox',
+            index=models.Index(condition=models.Q(('needs_review_at__isnull', True), ('processed_at__isnull', True)), fields=['available_at'], name='withdrawal_outbox_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawaloutbox',
+            index=models.Index(condition=models.Q(('needs_review_at__isnull', False), ('processed_at__isnull', True)), fields=['needs_review_at'], name='withdrawal_outbox_review_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.db.models import CheckConstraint, Q
+from django.utils import timezone
 import uuid
 
 from core.models import AbstractBaseModel
@@ -10,7 +12,11 @@ class Account(AbstractBaseModel):
     user = models.OneToOneField("users.User", on_delete=models.CASCADE, related_name='account')
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00, validators=[MinValueValidator(0)])
     currency = models.CharField(max_length=3, default='KES')
-
+    # Hot accounts spread incoming credits over `shard_count` AccountShard rows
+    is_hot = models.BooleanField(default=False)
+    shard_count = models.PositiveSmallIntegerField(default=0)
+    # Incremented with every balance change, orders the balances published to the cache
+    balance_version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"Account for {self.user.email} - {self.currency} {self.balance}"
@@ -22,6 +28,22 @@ class Account(AbstractBaseModel):
         ]
 
 
+class AccountShard(AbstractBaseModel):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2, default=0.00, validators=[MinValueValidator(0)])
+
+    def __str__(self):
+        return f"Shard {self.index} of account {self.account_id} - {self.balance}"
+
+    class Meta:
+        db_table = 'account_shards'
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'index'], name='unique_account_shard'),
+            CheckConstraint(check=Q(balance__gte=0), name='non_negative_shard_balance'),
+        ]
+
+
 class Transaction(AbstractBaseModel):
     TRANSACTION_TYPES = [
         ('DEPOSIT', 'Deposit'),
@@ -41,6 +63,9 @@ class Transaction(AbstractBaseModel):
     source_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='source_transactions', null=True, blank=True)
     destination_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='destination_transactions', null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Reservations and replays go through IdempotencyRecord (a hash of scope and key). This unique
+    # index stays as the guard against a second write once a record has expired, and it serves the
+    # admin search by key prefix, which would need an index on the key anyway.
     idempotency_key = models.CharField(max_length=255, unique=True, db_index=True)
     metadata = models.JSONField(default=dict, blank=True)
 
@@ -50,10 +75,51 @@ class Transaction(AbstractBaseModel):
     class Meta:
         db_table = 'transactions'
         ordering = ['-created_at']
+        # Metadata search indexes depend on the database, see migration 0010
         indexes = [
             models.Index(fields=['source_account', 'created_at']),
             models.Index(fields=['destination_account', 'created_at']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['transaction_type', 'status', 'created_at']),
+            models.Index(fields=['amount', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
+        ]
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Settled transaction moved out of the `transactions` table.
+
+    Rows are copied as they were, timestamps included, by
+    `archive_transactions` and are not changed afterwards. See
+    transactions.archive.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    source_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+', null=True, blank=True)
+    destination_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='+', null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.transaction_type} - {self.amount} - {self.status} (archived)"
+
+    class Meta:
+        db_table = 'transactions_archive'
+        ordering = ['-created_at']
+        # Metadata search indexes depend on the database, see migration 0010
+        indexes = [
+            models.Index(fields=['source_account', 'created_at']),
+            models.Index(fields=['destination_account', 'created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['transaction_type', 'status', 'created_at']),
+            models.Index(fields=['amount', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
 
@@ -68,7 +134,10 @@ class TransferRequest(AbstractBaseModel):
     destination_account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='transfer_requests_received')
     amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(0.01)])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
-    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='transfer_request', null=True, blank=True)
+    # Archived transactions leave the request behind, so the reference is not a database constraint
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, db_constraint=False, related_name='transfer_request', null=True, blank=True
+    )
  
 
     def __str__(self):
@@ -90,7 +159,10 @@ class Withdrawal(AbstractBaseModel):
     account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='withdrawals')
     amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(0.01)])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
-    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name='withdrawal', null=True, blank=True)
+    # Archived transactions leave the withdrawal behind, so the reference is not a database constraint
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, db_constraint=False, related_name='withdrawal', null=True, blank=True
+    )
     external_reference = models.CharField(max_length=255, blank=True, null=True)
  
 
@@ -101,3 +173,126 @@ class Withdrawal(AbstractBaseModel):
         db_table = 'withdrawals'
         ordering = ['-created_at']
 
+
+class WithdrawalOutbox(models.Model):
+    """
+    Transactional outbox for payouts.
+
+    A row is written in the same commit that accepts a withdrawal. The
+    process_withdrawals workers claim due rows, send the payout to the gateway
+    and mark the row processed once the withdrawal is settled. A row whose
+    payout outcome stayed unknown after every attempt is parked for review
+    (needs_review_at) and no longer claimed.
+    """
+    withdrawal = models.OneToOneField(Withdrawal, on_delete=models.CASCADE, related_name='outbox')
+    attempts = models.PositiveIntegerField(default=0)
+    # Claimed rows are pushed into the future, so a crashed worker's rows are picked up again
+    available_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    needs_review_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Outbox for withdrawal {self.withdrawal_id} ({self.attempts} attempts)"
+
+    class Meta:
+        db_table = 'withdrawal_outbox'
+        indexes = [
+            models.Index(
+                fields=['available_at'],
+                condition=Q(processed_at__isnull=True, needs_review_at__isnull=True),
+                name='withdrawal_outbox_due_idx'
+            ),
+            models.Index(
+                fields=['needs_review_at'],
+                condition=Q(processed_at__isnull=True, needs_review_at__isnull=False),
+                name='withdrawal_outbox_review_idx'
+            ),
+        ]
+
+
+class LedgerCounter(models.Model):
+    """
+    Incrementally maintained ledger totals for the admin dashboard.
+
+    Each counter is spread over several slots so concurrent writers rarely
+    contend on the same row; the value of a counter is the sum of its slots.
+    """
+    name = models.CharField(max_length=50)
+    slot = models.PositiveSmallIntegerField()
+    value = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}[{self.slot}] = {self.value}"
+
+    class Meta:
+        db_table = 'ledger_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'slot'], name='unique_ledger_counter_slot')
+        ]
+
+
+class LedgerEntry(AbstractBaseModel):
+    """
+    One side of a double-entry posting.
+
+    Every completed transaction writes a DEBIT and a CREDIT entry. Entries on
+    the external side of deposits and withdrawals have no account. The
+    balance_after column is the account's running balance once the entry is
+    applied; it is left empty for credits that land on a hot account shard.
+    """
+    ENTRY_TYPES = [
+        ('DEBIT', 'Debit'),
+        ('CREDIT', 'Credit'),
+    ]
+
+    # Archived transactions leave their entries behind, so the reference is not a database constraint
+    transaction = models.ForeignKey(Transaction, on_delete=models.DO_NOTHING, db_constraint=False, related_name='entries')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='entries', null=True, blank=True)
+    entry_type = models.CharField(max_length=6, choices=ENTRY_TYPES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, validators=[MinValueValidator(0.01)])
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.entry_type} {self.amount} on account {self.account_id}"
+
+    class Meta:
+        db_table = 'ledger_entries'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['account', 'created_at', 'id']),
+            # Accounts touched since a checkpoint, for incremental reconciliation
+            models.Index(fields=['created_at', 'account']),
+        ]
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Reservation and stored response for an idempotency key.
+
+    Keys are stored as a SHA-256 of the endpoint scope and the client key, and
+    expire after settings.IDEMPOTENCY_TTL seconds. request_hash is a SHA-256
+    of the request body the key was first used with.
+    """
+    STATUS_CHOICES = [
+        ('IN_PROGRESS', 'In progress'),
+        ('COMPLETED', 'Completed'),
+    ]
+
+    key_hash = models.CharField(max_length=64, primary_key=True)
+    user_id = models.BigIntegerField()
+    request_hash = models.CharField(max_length=64, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_until = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key_hash[:12]} - {self.status}"
+
+    class Meta:
+        db_table = 'idempotency_records'
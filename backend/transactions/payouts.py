@@ -0,0 +1,181 @@
+"""
+Asynchronous withdrawal payouts.
+
+The withdraw endpoint only reserves the funds: it debits the account, records
+a PENDING transaction and withdrawal and writes a WithdrawalOutbox row, all in
+one commit. The process_withdrawals workers then claim due outbox rows with
+SKIP LOCKED and call the payout gateway without holding any lock. The result
+settles the withdrawal (PROCESSING -> COMPLETED or FAILED), and a failed
+payout refunds the account.
+
+The gateway is pluggable through `settings.PAYOUT_GATEWAY`. A gateway's
+`send(withdrawal)` returns a PayoutResult for a definitive answer and raises
+an exception when the outcome is unknown, in which case the payout is retried
+with the withdrawal id as the provider-side idempotency key.
+
+Only a definitive failure refunds the account. When the outcome is still
+unknown after PAYOUT_MAX_ATTEMPTS, the provider may have paid out, so the
+withdrawal stays PROCESSING and its outbox row is parked for review:
+`requeue_parked` sends parked payouts again (the provider answers a repeated
+withdrawal id with the original outcome), and `resolve` settles one by hand
+once its outcome is known.
+"""
+import logging
+import random
+import time
+from collections import namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import events, ledger
+from . import stats as ledger_stats
+from .caching import invalidate_accounts, publish_balance
+from .models import Account, Withdrawal, WithdrawalOutbox
+from .shards import credit_shard
+
+logger = logging.getLogger(__name__)
+
+PayoutResult = namedtuple('PayoutResult', ['success', 'reference', 'reason'])
+
+
+class GatewayError(Exception):
+    """The gateway could not give a definitive answer; the payout is retried."""
+
+
+class StubGateway:
+    """In-process gateway for development and tests."""
+
+    def __init__(self, success_rate=None, latency=None):
+        self.success_rate = settings.PAYOUT_STUB_SUCCESS_RATE if success_rate is None else success_rate
+        self.latency = settings.PAYOUT_STUB_LATENCY if latency is None else latency
+
+    def send(self, withdrawal):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.success_rate:
+            return PayoutResult(True, f"EXT-{str(withdrawal.id).zfill(8)}", None)
+        return PayoutResult(False, None, 'External system failure')
+
+
+def get_gateway():
+    return import_string(settings.PAYOUT_GATEWAY)()
+
+
+def enqueue(withdrawal):
+    """Queue a withdrawal for payout. Call inside the atomic block that created it."""
+    return WithdrawalOutbox.objects.create(withdrawal=withdrawal)
+
+
+def claim(batch_size=50, lease=None):
+    """
+    Claim up to `batch_size` due payouts and mark their withdrawals PROCESSING.
+
+    Rows locked by other workers are skipped. A claimed row becomes due again
+    after `lease` seconds, so payouts of a crashed worker are not lost.
+    """
+    lease = settings.PAYOUT_LEASE if lease is None else lease
+    with transaction.atomic():
+        now = timezone.now()
+        claimed = list(
+            WithdrawalOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(processed_at__isnull=True, needs_review_at__isnull=True, available_at__lte=now)
+            .order_by('available_at')
+            .values_list('id', 'withdrawal_id')[:batch_size]
+        )
+        if not claimed:
+            return []
+        outbox_ids = [outbox_id for outbox_id, _ in claimed]
+        WithdrawalOutbox.objects.filter(id__in=outbox_ids).update(
+            available_at=now + timedelta(seconds=lease),
+            attempts=F('attempts') + 1
+        )
+        Withdrawal.objects.filter(id__in=[withdrawal_id for _, withdrawal_id in claimed], status='PENDING').update(
+            status='PROCESSING',
+            updated_at=now
+        )
+    return list(WithdrawalOutbox.objects.filter(id__in=outbox_ids).select_related('withdrawal').order_by('available_at'))
+
+
+def process(outbox, gateway, max_attempts=None, retry_delay=None):
+    """
+    Send one claimed payout and settle it. Returns 'COMPLETED', 'FAILED',
+    'RETRY' or 'REVIEW' (the outcome stayed unknown and the row was parked).
+    """
+    max_attempts = settings.PAYOUT_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    retry_delay = settings.PAYOUT_RETRY_DELAY if retry_delay is None else retry_delay
+    try:
+        result = gateway.send(outbox.withdrawal)
+    except Exception as e:
+        # Only while this worker still holds the lease, a later claim bumped the attempts
+        owned = WithdrawalOutbox.objects.filter(id=outbox.id, attempts=outbox.attempts, processed_at__isnull=True)
+        if outbox.attempts < max_attempts:
+            logger.warning(f"Payout for withdrawal {outbox.withdrawal_id} failed (attempt {outbox.attempts}), retrying: {e}")
+            owned.update(
+                available_at=timezone.now() + timedelta(seconds=retry_delay * 2 ** (outbox.attempts - 1)),
+                last_error=str(e)
+            )
+            return 'RETRY'
+        logger.error(f"Payout for withdrawal {outbox.withdrawal_id} has no outcome after {outbox.attempts} attempts, parked for review: {e}")
+        owned.update(needs_review_at=timezone.now(), last_error=str(e))
+        return 'REVIEW'
+    return settle(outbox, result)
+
+
+def requeue_parked():
+    """Make every payout parked for review due again, with a fresh attempt budget. Returns how many."""
+    return WithdrawalOutbox.objects.filter(processed_at__isnull=True, needs_review_at__isnull=False).update(
+        needs_review_at=None, attempts=0, available_at=timezone.now()
+    )
+
+
+def resolve(withdrawal_id, result):
+    """Settle a parked payout whose outcome was confirmed with the provider."""
+    outbox = WithdrawalOutbox.objects.get(withdrawal_id=withdrawal_id, processed_at__isnull=True, needs_review_at__isnull=False)
+    return settle(outbox, result)
+
+
+def settle(outbox, result):
+    """Complete or fail (and refund) a withdrawal with the gateway's result."""
+    with transaction.atomic():
+        withdrawal = Withdrawal.objects.select_for_update().select_related('transaction').get(id=outbox.withdrawal_id)
+        if withdrawal.status in ('COMPLETED', 'FAILED'):
+            # Settled by another worker after a lease expired
+            WithdrawalOutbox.objects.filter(id=outbox.id).update(processed_at=timezone.now())
+            return withdrawal.status
+
+        trans = withdrawal.transaction
+        if result.success:
+            withdrawal.status = 'COMPLETED'
+            withdrawal.external_reference = result.reference
+            trans.status = 'COMPLETED'
+            trans.metadata = {**trans.metadata, 'external_success': True}
+        else:
+            # Refund the reserved funds, hot accounts take the credit on a shard
+            account = Account.objects.get(id=withdrawal.account_id)
+            if account.is_hot:
+                credit_shard(account, withdrawal.amount)
+            else:
+                account = Account.objects.select_for_update().get(id=withdrawal.account_id)
+                account.balance += withdrawal.amount
+                account.balance_version += 1
+                account.save()
+            ledger.post(trans, credit_account=account, credit_balance=None if account.is_hot else account.balance)
+            ledger_stats.bump(total_wallets_value=withdrawal.amount)
+            publish_balance(account)
+
+            withdrawal.status = 'FAILED'
+            trans.status = 'FAILED'
+            trans.metadata = {**trans.metadata, 'external_success': False, 'reason': result.reason}
+
+        withdrawal.save()
+        trans.save()
+        WithdrawalOutbox.objects.filter(id=outbox.id).update(processed_at=timezone.now(), last_error=result.reason or '')
+        invalidate_accounts(withdrawal.account_id)
+        events.transactions_changed(trans.id)
+
+    logger.info(f"Withdrawal {withdrawal.id} settled as {withdrawal.status}")
+    return withdrawal.status
@@ -0,0 +1,143 @@
+"""
+Transaction search for the admin console.
+
+`parse` validates the admin listing's query parameters and `querysets` turns
+them into the querysets `paginate` merges, for the live or the archive table.
+Every filter is backed by an index on both tables:
+
+    type, status            (transaction_type, status, created_at), (status, created_at)
+    user_id, email          one queryset per side, on (source_account, created_at) and
+                            (destination_account, created_at); emails through the users email index
+    min_amount, max_amount  (amount, created_at)
+    from, to                (created_at, id), which also serves the unfiltered listing
+    key                     idempotency key prefix, on the unique idempotency_key index
+    metadata                `key` or `key:value` for METADATA_KEYS, repeatable
+
+Metadata indexes depend on the database (migration 0010): PostgreSQL has a
+GIN index for `key:value` containment and a partial index per key for
+presence; SQLite has a partial expression index per key, which only matches
+the JSON_EXTRACT(...) with the path written out that `MetadataKey` produces.
+"""
+import json
+from decimal import Decimal, InvalidOperation
+from django.db import connection
+from django.db.models import CharField, Func, IntegerField
+from django.db.models.lookups import Exact, IsNull
+
+from core.utils import parse_datetime_param
+
+# Metadata keys that can be searched, each has its own index
+METADATA_KEYS = ('user_id', 'batch_key', 'external_success')
+
+
+class MetadataKey(Func):
+    """A top-level key of `metadata` on SQLite, with the JSON path inlined rather than a parameter."""
+    function = 'JSON_EXTRACT'
+    template = '%(function)s(%(expressions)s, \'$."%(key)s"\')'
+
+    def __init__(self, key, **extra):
+        if key not in METADATA_KEYS:
+            raise ValueError(f"metadata key must be one of {', '.join(METADATA_KEYS)}")
+        super().__init__('metadata', key=key, **extra)
+
+
+def _amount(value, name):
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a decimal amount')
+    if not amount.is_finite():
+        raise ValueError(f'{name} must be a decimal amount')
+    return amount
+
+
+def _metadata(value):
+    """(key, value) of a `key` or `key:value` filter; the value is JSON if it parses as JSON."""
+    key, _, raw = value.partition(':')
+    if key not in METADATA_KEYS:
+        raise ValueError(f"metadata key must be one of {', '.join(METADATA_KEYS)}")
+    if not raw:
+        return key, None
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        parsed = raw
+    if not isinstance(parsed, (str, int, bool)):
+        raise ValueError('metadata values must be strings, integers or booleans')
+    return key, parsed
+
+
+def parse(params):
+    """Validated search filters from query parameters. Raises ValueError for bad values."""
+    filters = {
+        'type': params.get('type'),
+        'status': params.get('status'),
+        'user_id': params.get('user_id'),
+        'email': params.get('email'),
+        'key': params.get('key'),
+        'min_amount': _amount(params['min_amount'], 'min_amount') if params.get('min_amount') else None,
+        'max_amount': _amount(params['max_amount'], 'max_amount') if params.get('max_amount') else None,
+        'from': parse_datetime_param(params.get('from'), 'from'),
+        'to': parse_datetime_param(params.get('to'), 'to'),
+        'metadata': [_metadata(value) for value in params.getlist('metadata')],
+    }
+    if filters['user_id'] is not None and not filters['user_id'].isdigit():
+        raise ValueError('user_id must be an integer')
+    return filters
+
+
+def _key_prefix(queryset, prefix):
+    if connection.vendor == 'sqlite':
+        # LIKE is case-insensitive on SQLite and cannot use the index, a range on the binary order can
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return queryset.filter(idempotency_key__gte=prefix, idempotency_key__lt=upper)
+    # PostgreSQL serves LIKE 'prefix%' from the varchar_pattern_ops index Django adds next to the unique one
+    return queryset.filter(idempotency_key__startswith=prefix)
+
+
+def _metadata_filter(queryset, key, value):
+    if connection.vendor == 'postgresql':
+        if value is None:
+            return queryset.filter(metadata__has_key=key)
+        return queryset.filter(metadata__contains={key: value})
+    if value is None:
+        return queryset.filter(IsNull(MetadataKey(key), False))
+    # JSON_EXTRACT returns SQL values: integers, text, and 1/0 for booleans. Booleans are compared as
+    # integers, a boolean expression compiles to a bare WHERE JSON_EXTRACT(...) the value index cannot serve
+    if isinstance(value, (bool, int)):
+        return queryset.filter(Exact(MetadataKey(key, output_field=IntegerField()), int(value)))
+    return queryset.filter(Exact(MetadataKey(key, output_field=CharField()), value))
+
+
+def querysets(model, filters):
+    """Disjoint querysets of `model` (Transaction or ArchivedTransaction) matching the filters."""
+    queryset = model.objects.all()
+    if filters['type']:
+        queryset = queryset.filter(transaction_type=filters['type'])
+    if filters['status']:
+        queryset = queryset.filter(status=filters['status'])
+    if filters['min_amount'] is not None:
+        queryset = queryset.filter(amount__gte=filters['min_amount'])
+    if filters['max_amount'] is not None:
+        queryset = queryset.filter(amount__lte=filters['max_amount'])
+    if filters['from']:
+        queryset = queryset.filter(created_at__gte=filters['from'])
+    if filters['to']:
+        queryset = queryset.filter(created_at__lt=filters['to'])
+    if filters['key']:
+        queryset = _key_prefix(queryset, filters['key'])
+    for key, value in filters['metadata']:
+        queryset = _metadata_filter(queryset, key, value)
+
+    # Account filters split the search by side, each side is served by its own (account, created_at) index
+    sides = {}
+    if filters['user_id']:
+        sides['user_id'] = filters['user_id']
+    if filters['email']:
+        sides['user__email'] = filters['email']
+    if not sides:
+        return [queryset]
+    return [
+        queryset.filter(**{f'source_account__{lookup}': value for lookup, value in sides.items()}),
+        queryset.filter(**{f'destination_account__{lookup}': value for lookup, value in sides.items()}),
+    ]
@@ -0,0 +1,133 @@
+"""
+Sharded sub-balances for hot receiving accounts.
+
+A hot account keeps part of its balance in AccountShard rows. Credits go to a
+random shard with a single UPDATE, so concurrent incoming transfers no longer
+serialize on the account row. Debits lock the account, fold every shard back
+into `Account.balance` and then check funds, so the non-negative balance
+guarantee still holds at the account level.
+"""
+import random
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import publish_balance
+from .models import Account, AccountShard
+
+
+def credit_shard(account, amount):
+    """Credit a hot account without taking a lock on the account row."""
+    index = random.randrange(account.shard_count)
+    updated = AccountShard.objects.filter(account_id=account.id, index=index).update(
+        balance=F('balance') + amount,
+        updated_at=timezone.now()
+    )
+    if not updated:
+        # Hot mode was switched off or resized concurrently, credit the account row instead
+        account = Account.objects.select_for_update().get(id=account.id)
+        account.balance += amount
+        account.balance_version += 1
+        account.save(update_fields=['balance', 'balance_version', 'updated_at'])
+        publish_balance(account)
+
+
+def fold_shards(account):
+    """
+    Move every shard balance into `account.balance`.
+
+    The caller must hold a select_for_update lock on the account and is
+    responsible for saving it. Returns the folded amount.
+    """
+    shards = list(AccountShard.objects.select_for_update().filter(account_id=account.id).order_by('index'))
+    folded = sum((shard.balance for shard in shards), Decimal('0.00'))
+    if folded:
+        AccountShard.objects.filter(id__in=[shard.id for shard in shards]).update(
+            balance=Decimal('0.00'),
+            updated_at=timezone.now()
+        )
+        account.balance += folded
+    return folded
+
+
+def lock_for_debit(account_id):
+    """
+    Lock an account for a debit, folding any shard credits into its balance.
+
+    Must be called inside transaction.atomic(). The folded balance is saved
+    straight away so an early return (e.g. insufficient funds) cannot lose it.
+    """
+    account = Account.objects.select_for_update().get(id=account_id)
+    if account.is_hot and fold_shards(account):
+        account.save(update_fields=['balance', 'updated_at'])
+    return account
+
+
+def _balances(account):
+    """(balance, shard total) of a hot account, read together in one query."""
+    sharded = (
+        AccountShard.objects.filter(account_id=OuterRef('pk'))
+        .values('account_id').annotate(total=Sum('balance')).values('total')
+    )
+    return Account.objects.filter(id=account.id).values_list(
+        'balance', Coalesce(Subquery(sharded), Value(Decimal('0.00')), output_field=DecimalField(max_digits=15, decimal_places=2))
+    )
+
+
+def total_balance(account):
+    """Balance of an account including any unconsolidated shard credits."""
+    if not account.is_hot:
+        return account.balance
+    balance, sharded = _balances(account).get()
+    return balance + sharded
+
+
+async def atotal_balance(account):
+    if not account.is_hot:
+        return account.balance
+    balance, sharded = await _balances(account).aget()
+    return balance + sharded
+
+
+def consolidate(account_id):
+    """Fold the shards of a single account back into its balance."""
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(id=account_id)
+        folded = fold_shards(account)
+        if folded:
+            account.save(update_fields=['balance', 'updated_at'])
+    return folded
+
+
+def enable_hot_mode(account_id, shard_count):
+    """Turn on sharded credits for an account."""
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(id=account_id)
+        fold_shards(account)
+        AccountShard.objects.filter(account_id=account.id, index__gte=shard_count).delete()
+        AccountShard.objects.bulk_create(
+            [AccountShard(account=account, index=index) for index in range(shard_count)],
+            ignore_conflicts=True
+        )
+        account.is_hot = True
+        account.shard_count = shard_count
+        account.balance_version += 1
+        account.save(update_fields=['balance', 'is_hot', 'shard_count', 'balance_version', 'updated_at'])
+        publish_balance(account)
+    return account
+
+
+def disable_hot_mode(account_id):
+    """Fold the shards back and return the account to a single balance row."""
+    with transaction.atomic():
+        account = Account.objects.select_for_update().get(id=account_id)
+        fold_shards(account)
+        AccountShard.objects.filter(account_id=account.id).delete()
+        account.is_hot = False
+        account.shard_count = 0
+        account.balance_version += 1
+        account.save(update_fields=['balance', 'is_hot', 'shard_count', 'balance_version', 'updated_at'])
+        publish_balance(account)
+    return account
@@ -0,0 +1,144 @@
+"""
+Incrementally maintained ledger statistics.
+
+The engine bumps these counters inside the same atomic block as the write
+they describe, so `admin_stats` reads exact totals from a handful of rows
+instead of scanning users, accounts and transactions. Users are counted by
+receivers on the user model once their creation or deletion commits, so users
+created anywhere (registration, createsuperuser, the admin) are included;
+bulk inserts, which send no signals, bump the counter themselves.
+"""
+import random
+from decimal import Decimal
+from functools import partial
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Account, AccountShard, ArchivedTransaction, LedgerCounter, Transaction
+
+SLOTS = 8
+
+COUNTERS = [
+    'total_users',
+    'total_wallets_value',
+    'total_transfers',
+    'total_withdrawals',
+    'total_deposits',
+    'total_transactions',
+]
+
+TYPE_COUNTERS = {
+    'TRANSFER': 'total_transfers',
+    'WITHDRAWAL': 'total_withdrawals',
+    'DEPOSIT': 'total_deposits',
+}
+
+
+def bump(**deltas):
+    """
+    Add the given deltas to the named counters.
+
+    Call inside the transaction.atomic() block of the write being counted.
+    """
+    slot = random.randrange(SLOTS)
+    now = timezone.now()
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        updated = LedgerCounter.objects.filter(name=name, slot=slot).update(
+            value=F('value') + delta,
+            updated_at=now
+        )
+        if not updated:
+            LedgerCounter.objects.bulk_create(
+                [LedgerCounter(name=name, slot=slot, value=0)],
+                ignore_conflicts=True
+            )
+            LedgerCounter.objects.filter(name=name, slot=slot).update(
+                value=F('value') + delta,
+                updated_at=now
+            )
+
+
+def user_saved(sender, instance, created, **kwargs):
+    """post_save receiver for the user model."""
+    if created:
+        transaction.on_commit(partial(bump, total_users=1))
+
+
+def user_deleted(sender, instance, **kwargs):
+    """post_delete receiver for the user model."""
+    transaction.on_commit(partial(bump, total_users=-1))
+
+
+def record_transaction(transaction_type, count=1, wallets_delta=Decimal('0.00')):
+    """Count `count` new transactions of a type and the change in total wallet value."""
+    bump(**{
+        'total_transactions': count,
+        TYPE_COUNTERS[transaction_type]: count,
+        'total_wallets_value': wallets_delta,
+    })
+
+
+def _totals():
+    return LedgerCounter.objects.values('name').annotate(total=Sum('value')).values_list('name', 'total')
+
+
+def _stats(totals):
+    stats = {name: totals.get(name) or Decimal('0.00') for name in COUNTERS}
+    for name in COUNTERS:
+        if name != 'total_wallets_value':
+            stats[name] = int(stats[name])
+    return stats
+
+
+def read():
+    """Current value of every counter."""
+    return _stats(dict(_totals()))
+
+
+async def aread():
+    return _stats({name: total async for name, total in _totals()})
+
+
+def compute():
+    """Recompute every counter from the ledger tables."""
+    from users.models import User
+
+    by_type = {}
+    for model in (Transaction, ArchivedTransaction):
+        for transaction_type, total in model.objects.values('transaction_type').annotate(total=Count('id')).values_list('transaction_type', 'total'):
+            by_type[transaction_type] = by_type.get(transaction_type, 0) + total
+    wallets_value = (Account.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')) + (
+        AccountShard.objects.aggregate(total=Sum('balance'))['total'] or Decimal('0.00')
+    )
+    stats = {
+        'total_users': User.objects.count(),
+        'total_wallets_value': wallets_value,
+        'total_transactions': sum(by_type.values()),
+    }
+    for transaction_type, name in TYPE_COUNTERS.items():
+        stats[name] = by_type.get(transaction_type, 0)
+    return stats
+
+
+def rebuild():
+    """
+    Replace the counters with values recomputed from scratch.
+
+    The counter rows are locked first, so writers that bump them wait for the
+    rebuild and are then applied on top of the recomputed totals.
+    """
+    LedgerCounter.objects.bulk_create(
+        [LedgerCounter(name=name, slot=slot, value=0) for name in COUNTERS for slot in range(SLOTS)],
+        ignore_conflicts=True
+    )
+    with transaction.atomic():
+        list(LedgerCounter.objects.select_for_update().order_by('name', 'slot'))
+        stats = compute()
+        now = timezone.now()
+        for name in COUNTERS:
+            LedgerCounter.objects.filter(name=name).exclude(slot=0).update(value=0, updated_at=now)
+            LedgerCounter.objects.filter(name=name, slot=0).update(value=stats[name], updated_at=now)
+    return stats
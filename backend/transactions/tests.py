@@ -0,0 +1,431 @@
+import hashlib
+import itertools
+import json
+import re
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core import tiered_cache
+from users.models import User
+from . import idempotency, ledger, payouts, search, shards
+from .models import (
+    Account, AccountShard, ArchivedTransaction, IdempotencyRecord, LedgerEntry, Transaction, TransferRequest, Withdrawal,
+    WithdrawalOutbox
+)
+from .reconciliation import reconcile_range
+
+
+def _index(model, *fields):
+    """Name of the Meta index of `model` on exactly these fields."""
+    return next(index.name for index in model._meta.indexes if tuple(index.fields) == fields)
+
+
+class SearchIndexTests(TestCase):
+    """Every admin search filter is served by an index on both the live and the archive table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='pw')
+        cls.account = Account.objects.create(user=cls.user, balance=Decimal('0.00'))
+        Transaction.objects.create(
+            transaction_type='DEPOSIT', amount=Decimal('7.00'), destination_account=cls.account, status='COMPLETED',
+            idempotency_key='abc-1', metadata={'user_id': cls.user.id, 'batch_key': 'b1', 'external_success': True}
+        )
+        Transaction.objects.create(
+            transaction_type='DEPOSIT', amount=Decimal('70.00'), destination_account=cls.account, status='COMPLETED',
+            idempotency_key='xyz-1', metadata={'external_success': False}
+        )
+
+    def cases(self, model):
+        """(query string, expected index name part per side queryset) of each supported filter."""
+        table = model._meta.db_table
+        postgresql = connection.vendor == 'postgresql'
+        return [
+            (f'user_id={self.user.id}', ['source_', 'destina']),
+            ('email=searcher@example.com', ['source_', 'destina']),
+            ('metadata=batch_key', [f'{table}_meta_batch_key_idx']),
+            ('metadata=batch_key:b1', [f'{table}_metadata_gin' if postgresql else f'{table}_meta_batch_key_value_idx']),
+            ('metadata=external_success:true', [
+                f'{table}_metadata_gin' if postgresql else f'{table}_meta_external_success_value_idx'
+            ]),
+            (f'metadata=user_id:{self.user.id}', [f'{table}_metadata_gin' if postgresql else f'{table}_meta_user_id_value_idx']),
+            ('min_amount=5&max_amount=10', [_index(model, 'amount', 'created_at')]),
+            ('key=abc', ['idempotency_key']),
+        ]
+
+    def plan(self, queryset):
+        sql, params = queryset.order_by('-created_at', '-pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # The test tables are tiny, make the planner show which index it would use
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'EXPLAIN {sql}', params)
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, plan, table, expected):
+        if connection.vendor == 'postgresql':
+            full_scan, index_use = rf'Seq Scan on {table}\b(?!_)', 'Index'
+        else:
+            full_scan, index_use = rf'\bSCAN {table}\b(?!_)(?! USING)', 'USING'
+        self.assertFalse(any(re.search(full_scan, line) for line in plan), plan)
+        self.assertTrue(any(index_use in line and expected in line for line in plan), (expected, plan))
+
+    def test_filters_use_indexes(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('search indexes are only defined for SQLite and PostgreSQL')
+        for model in (Transaction, ArchivedTransaction):
+            table = model._meta.db_table
+            for query, expected in self.cases(model):
+                with self.subTest(table=table, query=query):
+                    querysets = search.querysets(model, search.parse(QueryDict(query)))
+                    self.assertEqual(len(querysets), len(expected))
+                    for queryset, index in zip(querysets, expected):
+                        self.assertUsesIndex(self.plan(queryset), table, index)
+
+    def test_filters_match(self):
+        def found(query):
+            return sorted(
+                row.idempotency_key
+                for queryset in search.querysets(Transaction, search.parse(QueryDict(query)))
+                for row in queryset
+            )
+
+        self.assertEqual(found(f'user_id={self.user.id}'), ['abc-1', 'xyz-1'])
+        self.assertEqual(found('metadata=batch_key'), ['abc-1'])
+        self.assertEqual(found('metadata=external_success:true'), ['abc-1'])
+        self.assertEqual(found('metadata=external_success:false'), ['xyz-1'])
+        self.assertEqual(found('min_amount=5&max_amount=10'), ['abc-1'])
+        self.assertEqual(found('key=abc'), ['abc-1'])
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class EngineTestCase(TestCase):
+    """Two customers with an account each, the first one funded by a deposit, and a client logged in as the first."""
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.cache.clear()
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        self.account = Account.objects.create(user=self.owner, balance=Decimal('0.00'))
+        self.other_account = Account.objects.create(user=self.other, balance=Decimal('0.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.deposit('funding', amount='100.00').status_code, 201)
+
+    def deposit(self, key, amount='5.00', client=None):
+        body = {'account_id': self.account.id, 'amount': amount, 'idempotency_key': key}
+        return (client or self.client).post('/api/deposit/', body, format='json')
+
+    def assertBalance(self, account, balance):
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal(balance))
+
+
+class IdempotencyTests(EngineTestCase):
+    """Keys are reserved before a write runs, and a key only ever replays the request it was first used with."""
+
+    def hold(self, key, body):
+        """Reserve `key` for the deposit scope as a request that is still running would."""
+        return IdempotencyRecord.objects.create(
+            key_hash=idempotency.key_hash('deposit', key),
+            user_id=self.owner.id,
+            request_hash=hashlib.sha256(json.dumps(body, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest(),
+            locked_until=timezone.now() + timedelta(seconds=30),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def test_same_body_is_replayed(self):
+        first = self.deposit('dep-1')
+        self.assertEqual(first.status_code, 201)
+        replay = self.deposit('dep-1')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(json.loads(replay.content), json.loads(first.content))
+        self.assertEqual(Transaction.objects.filter(idempotency_key='dep-1').count(), 1)
+        self.assertBalance(self.account, '105.00')
+
+    def test_different_body_is_rejected(self):
+        self.assertEqual(self.deposit('dep-1').status_code, 201)
+        response = self.deposit('dep-1', amount='6.00')
+        self.assertEqual(response.status_code, 422)
+        self.assertBalance(self.account, '105.00')
+
+    def test_other_users_key_is_a_conflict(self):
+        self.assertEqual(self.deposit('dep-1').status_code, 201)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        self.assertEqual(self.deposit('dep-1', client=client).status_code, 409)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.2)
+    def test_duplicate_in_flight_gets_409(self):
+        body = {'account_id': self.account.id, 'amount': '5.00', 'idempotency_key': 'dep-1'}
+        self.hold('dep-1', body)
+        response = self.deposit('dep-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Transaction.objects.filter(idempotency_key='dep-1').exists())
+
+    def test_duplicate_in_flight_gets_the_result(self):
+        body = {'account_id': self.account.id, 'amount': '5.00', 'idempotency_key': 'dep-1'}
+        record = self.hold('dep-1', body)
+        stored = {'id': 'first', 'amount': '5.00'}
+
+        def first_request_finishes(seconds):
+            record.status, record.response_status, record.response_body = 'COMPLETED', 201, stored
+            record.save()
+
+        with mock.patch.object(idempotency.time, 'sleep', side_effect=first_request_finishes):
+            response = self.deposit('dep-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), stored)
+        self.assertFalse(Transaction.objects.filter(idempotency_key='dep-1').exists())
+
+    def test_expired_record_falls_back_to_the_written_transaction(self):
+        first = self.deposit('dep-1')
+        IdempotencyRecord.objects.all().delete()
+        cache.clear()
+        # The unique key stops the second write, the transaction is replayed instead of a 500
+        replay = self.deposit('dep-1')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(json.loads(replay.content)['id'], json.loads(first.content)['id'])
+        IdempotencyRecord.objects.all().delete()
+        cache.clear()
+        transfer = self.client.post('/api/transfer/', {
+            'source_account_id': self.account.id, 'destination_account_id': self.other_account.id,
+            'amount': '5.00', 'idempotency_key': 'dep-1',
+        }, format='json')
+        self.assertEqual(transfer.status_code, 409)
+        self.assertBalance(self.account, '105.00')
+
+
+class UnreachableGateway:
+    def send(self, withdrawal):
+        raise payouts.GatewayError('timed out')
+
+
+class PayoutTests(EngineTestCase):
+    """Withdrawals are claimed, sent with StubGateway and settled exactly once."""
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post(
+            '/api/withdraw/', {'account_id': self.account.id, 'amount': '30.00', 'idempotency_key': 'wd-1'}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.withdrawal = Withdrawal.objects.get(account=self.account)
+        self.assertBalance(self.account, '70.00')
+
+    def assertReconciles(self):
+        self.assertEqual(reconcile_range(self.account.id, self.account.id)['drifted'], [])
+
+    def test_success(self):
+        [outbox] = payouts.claim()
+        self.assertEqual(payouts.process(outbox, payouts.StubGateway(success_rate=1, latency=0)), 'COMPLETED')
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'COMPLETED')
+        self.assertTrue(self.withdrawal.external_reference)
+        self.assertEqual(self.withdrawal.transaction.status, 'COMPLETED')
+        self.assertBalance(self.account, '70.00')
+        self.assertIsNotNone(WithdrawalOutbox.objects.get(id=outbox.id).processed_at)
+        self.assertEqual(payouts.claim(), [])
+        self.assertReconciles()
+
+    def test_definitive_failure_refunds(self):
+        [outbox] = payouts.claim()
+        self.assertEqual(payouts.process(outbox, payouts.StubGateway(success_rate=0, latency=0)), 'FAILED')
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'FAILED')
+        self.assertEqual(self.withdrawal.transaction.status, 'FAILED')
+        self.assertBalance(self.account, '100.00')
+        entries = LedgerEntry.objects.filter(account=self.account, transaction=self.withdrawal.transaction).order_by('created_at', 'id')
+        self.assertEqual(
+            [(entry.entry_type, entry.amount, entry.balance_after) for entry in entries],
+            [('DEBIT', Decimal('30.00'), Decimal('70.00')), ('CREDIT', Decimal('30.00'), Decimal('100.00'))]
+        )
+        self.assertReconciles()
+
+    def test_expired_lease_settles_once(self):
+        [stale] = payouts.claim(lease=0)
+        # The lease ran out, another worker claims the payout again
+        [outbox] = payouts.claim()
+        self.assertEqual(outbox.attempts, 2)
+        self.assertEqual(payouts.process(outbox, payouts.StubGateway(success_rate=0, latency=0)), 'FAILED')
+        self.assertEqual(payouts.process(stale, payouts.StubGateway(success_rate=1, latency=0)), 'FAILED')
+        self.assertEqual(payouts.process(stale, payouts.StubGateway(success_rate=0, latency=0)), 'FAILED')
+        self.assertBalance(self.account, '100.00')
+        self.assertEqual(LedgerEntry.objects.filter(account=self.account, transaction=self.withdrawal.transaction).count(), 2)
+        self.assertReconciles()
+
+    def test_stale_worker_does_not_reschedule(self):
+        [stale] = payouts.claim(lease=0)
+        [outbox] = payouts.claim()
+        self.assertEqual(payouts.process(stale, UnreachableGateway(), max_attempts=5), 'RETRY')
+        self.assertEqual(WithdrawalOutbox.objects.get(id=outbox.id).available_at, outbox.available_at)
+
+    def test_unknown_outcome_is_parked(self):
+        [outbox] = payouts.claim()
+        self.assertEqual(payouts.process(outbox, UnreachableGateway(), max_attempts=1), 'REVIEW')
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.status, 'PROCESSING')
+        self.assertBalance(self.account, '70.00')
+        self.assertIsNotNone(WithdrawalOutbox.objects.get(id=outbox.id).needs_review_at)
+        self.assertEqual(payouts.claim(), [])
+
+        self.assertEqual(payouts.requeue_parked(), 1)
+        [outbox] = payouts.claim()
+        self.assertEqual(payouts.process(outbox, payouts.StubGateway(success_rate=1, latency=0)), 'COMPLETED')
+        self.assertBalance(self.account, '70.00')
+        self.assertReconciles()
+
+    def test_parked_payout_is_resolved_by_hand(self):
+        [outbox] = payouts.claim()
+        payouts.process(outbox, UnreachableGateway(), max_attempts=1)
+        result = payouts.PayoutResult(False, None, 'Rejected by provider')
+        self.assertEqual(payouts.resolve(self.withdrawal.id, result), 'FAILED')
+        self.assertBalance(self.account, '100.00')
+        self.assertReconciles()
+
+
+class BatchTransferTests(EngineTestCase):
+    """A batch is written all or nothing, under line keys no other request can use."""
+
+    def setUp(self):
+        super().setUp()
+        self.third = Account.objects.create(
+            user=User.objects.create_user(username='third', email='third@example.com', password='pw'), balance=Decimal('0.00')
+        )
+
+    def batch(self, key, *lines):
+        return self.client.post('/api/transfer/batch/', {
+            'source_account_id': self.account.id,
+            'idempotency_key': key,
+            'transfers': [{'destination_account_id': account.id, 'amount': amount} for account, amount in lines],
+        }, format='json')
+
+    def test_batch_is_written_together(self):
+        response = self.batch('batch-1', (self.other_account, '10.00'), (self.third, '20.00'), (self.other_account, '5.00'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([line['index'] for line in response.data['results']], [0, 1, 2])
+        self.assertEqual(
+            sorted(Transaction.objects.filter(metadata__batch_key='batch-1').values_list('idempotency_key', flat=True)),
+            ['batch-1#0', 'batch-1#1', 'batch-1#2']
+        )
+        self.assertBalance(self.account, '65.00')
+        self.assertBalance(self.other_account, '15.00')
+        self.assertBalance(self.third, '20.00')
+        for account in (self.account, self.other_account, self.third):
+            self.assertEqual(reconcile_range(account.id, account.id)['drifted'], [])
+
+    def test_overdrawing_line_writes_nothing(self):
+        response = self.batch('batch-1', (self.other_account, '60.00'), (self.third, '50.00'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.filter(metadata__batch_key='batch-1').exists())
+        self.assertEqual(TransferRequest.objects.count(), 0)
+        self.assertBalance(self.account, '100.00')
+        self.assertBalance(self.other_account, '0.00')
+        # The key was released, a corrected batch goes through
+        self.assertEqual(self.batch('batch-1', (self.other_account, '60.00')).status_code, 201)
+
+    def test_replay(self):
+        first = self.batch('batch-1', (self.other_account, '10.00'), (self.third, '20.00'))
+        replay = self.batch('batch-1', (self.other_account, '10.00'), (self.third, '20.00'))
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(json.loads(replay.content), json.loads(first.content))
+        self.assertEqual(self.batch('batch-1', (self.third, '10.00'), (self.other_account, '20.00')).status_code, 422)
+        self.assertEqual(Transaction.objects.filter(metadata__batch_key='batch-1').count(), 2)
+        self.assertBalance(self.account, '70.00')
+
+    def test_replay_after_the_record_expired(self):
+        self.batch('batch-1', (self.other_account, '10.00'), (self.third, '20.00'))
+        IdempotencyRecord.objects.all().delete()
+        cache.clear()
+        replay = self.batch('batch-1', (self.other_account, '10.00'), (self.third, '20.00'))
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.data['count'], 2)
+        IdempotencyRecord.objects.all().delete()
+        cache.clear()
+        self.assertEqual(self.batch('batch-1', (self.third, '10.00')).status_code, 422)
+        self.assertBalance(self.account, '70.00')
+
+    def test_line_keys_are_not_client_keys(self):
+        self.assertEqual(self.batch('batch-1', (self.other_account, '10.00')).status_code, 201)
+        transfer = {'source_account_id': self.account.id, 'destination_account_id': self.third.id, 'amount': '1.00'}
+        # The old "<key>:<index>" form is an ordinary key again
+        self.assertEqual(
+            self.client.post('/api/transfer/', {**transfer, 'idempotency_key': 'batch-1:0'}, format='json').status_code, 201
+        )
+        response = self.client.post('/api/transfer/', {**transfer, 'idempotency_key': 'batch-1#0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('idempotency_key', response.data)
+        self.assertEqual(self.batch('batch#2', (self.other_account, '1.00')).status_code, 400)
+        self.assertBalance(self.account, '89.00')
+
+
+class HotAccountTests(EngineTestCase):
+    """Credits to a hot account land on its shards and are folded back into its balance."""
+
+    def setUp(self):
+        super().setUp()
+        shards.enable_hot_mode(self.other_account.id, 4)
+        # Spread the credits over the shards in turn
+        with mock.patch.object(shards, 'random', mock.Mock(randrange=mock.Mock(side_effect=itertools.cycle(range(4))))):
+            for index in range(8):
+                response = self.transfer(f'hot-{index}', '2.50')
+                self.assertEqual(response.status_code, 201)
+
+    def transfer(self, key, amount):
+        return self.client.post('/api/transfer/', {
+            'source_account_id': self.account.id, 'destination_account_id': self.other_account.id,
+            'amount': amount, 'idempotency_key': key,
+        }, format='json')
+
+    def shard_balances(self):
+        return list(AccountShard.objects.filter(account=self.other_account).order_by('index').values_list('balance', flat=True))
+
+    def assertMatchesLedger(self, balance):
+        self.assertBalance(self.other_account, balance)
+        self.assertEqual(self.shard_balances(), [Decimal('0.00')] * 4)
+        self.assertEqual(ledger.balance_as_of(self.other_account, timezone.now() + timedelta(seconds=1)), Decimal(balance))
+        self.assertEqual(reconcile_range(self.other_account.id, self.other_account.id)['drifted'], [])
+
+    def test_credits_spread_over_shards(self):
+        self.assertEqual(self.shard_balances(), [Decimal('5.00')] * 4)
+        self.assertBalance(self.other_account, '0.00')
+        self.assertBalance(self.account, '80.00')
+        # Shard credits have no running balance, reconciliation counts them all the same
+        self.assertEqual(reconcile_range(self.other_account.id, self.other_account.id)['drifted'], [])
+
+    def test_balance_reports_shard_total(self):
+        # Async views authenticate the JWT themselves
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.other)}')
+        response = client.get(f'/api/balance/{self.other.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(json.loads(response.content)['balance'])), Decimal('20.00'))
+        self.assertEqual(shards.total_balance(Account.objects.get(id=self.other_account.id)), Decimal('20.00'))
+
+    def test_lock_for_debit_folds_shards(self):
+        with transaction.atomic():
+            account = shards.lock_for_debit(self.other_account.id)
+            self.assertEqual(account.balance, Decimal('20.00'))
+        self.assertMatchesLedger('20.00')
+
+    def test_consolidate_shards_folds_shards(self):
+        call_command('consolidate_shards', stdout=StringIO())
+        self.assertMatchesLedger('20.00')
+        # Later credits are folded by the next run
+        self.assertEqual(self.transfer('hot-late', '1.00').status_code, 201)
+        call_command('consolidate_shards', stdout=StringIO())
+        self.assertMatchesLedger('21.00')
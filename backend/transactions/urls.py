@@ -4,10 +4,15 @@ from . import views
 urlpatterns = [
     path('deposit/', views.deposit, name='deposit'),
     path('transfer/', views.transfer, name='transfer'),
+    path('transfer/batch/', views.batch_transfer, name='batch_transfer'),
     path('withdraw/', views.withdraw, name='withdraw'),
     path('balance/<int:user_id>/', views.balance, name='balance'),
     path('transactions/<int:user_id>/', views.transaction_history, name='transaction_history'),
+    path('statement/<int:user_id>/', views.statement, name='statement'),
+    path('dashboard/', views.dashboard, name='dashboard'),
+    path('events/', views.event_stream, name='event_stream'),
     path('admin/stats/', views.admin_stats, name='admin_stats'),
     path('admin/transactions/', views.admin_transactions, name='admin_transactions'),
+    path('admin/transactions/export/', views.admin_export_transactions, name='admin_export_transactions'),
 ]
 
@@ -1,105 +1,266 @@
+import asyncio
 import logging
 from decimal import Decimal
-from django.db import transaction
-from django.db.models import Sum, Q
-from django.core.cache import cache
-from django.utils.decorators import method_decorator
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.views import APIView
-from django_ratelimit.decorators import ratelimit
-from .models import Account, Transaction, TransferRequest, Withdrawal
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from .models import Account, ArchivedTransaction, LedgerEntry, Transaction, TransferRequest, Withdrawal
 from .serializers import (
-    AccountSerializer, TransactionSerializer, DepositSerializer, TransferSerializer,
-    WithdrawalSerializer, BalanceSerializer, AdminStatsSerializer
+    BATCH_LINE_SEPARATOR, UserSerializer, TransactionSerializer, TransactionRowSerializer, DepositSerializer, TransferSerializer,
+    BatchTransferSerializer, WithdrawalSerializer, BalanceSerializer, AdminStatsSerializer, LedgerEntrySerializer
 )
-from core.utils import cache_result
-from core.permissions import IsAccountOwner
+from . import archive, dashboard as user_dashboard, events, export, history, ledger, payouts, search
+from .caching import aaccount_key, acache_balance, aget_cached_balance, invalidate_accounts, publish_balance
+from .idempotency import idempotent
+from . import stats as ledger_stats
+from .shards import atotal_balance, credit_shard, fold_shards, lock_for_debit
+from core.async_api import async_api_view, json_response
+from core.authentication import CachedJWTAuthentication, aload_user
+from core.utils import cached_call, parse_datetime_param
+from core.pagination import paginate, estimate_count, InvalidCursor
 
 logger = logging.getLogger(__name__)
 
+MAX_PAGE_SIZE = 200
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-@ratelimit(key='user', rate='100/h', method='GET')
-def balance(request, user_id):
+
+def _page_size(request):
+    """Requested page size, bounded to MAX_PAGE_SIZE."""
+    try:
+        page_size = int(request.GET.get('page_size', settings.REST_FRAMEWORK['PAGE_SIZE']))
+    except ValueError:
+        raise ValueError('page_size must be an integer')
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def _replay_transaction(request, idempotency_key, transaction_type, **fields):
+    """
+    Response for a transaction already written with this key, if there is one.
+
+    Only a transaction of the same type, requested by the same user (or
+    replayed by staff) with the same `fields`, is replayed; any other use of
+    the key is a conflict (409) or a different request (422).
+    """
+    existing_transaction = Transaction.objects.filter(idempotency_key=idempotency_key).first()
+    if existing_transaction is None:
+        return None
+    owner_id = existing_transaction.metadata.get('user_id')
+    if existing_transaction.transaction_type != transaction_type or (owner_id != request.user.id and not request.user.is_staff):
+        return Response(
+            {'error': 'This idempotency key has already been used'},
+            status=status.HTTP_409_CONFLICT
+        )
+    if any(getattr(existing_transaction, field) != value for field, value in fields.items()):
+        return Response(
+            {'error': 'This idempotency key has already been used for a different request'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    logger.info(f"Idempotent request detected for key: {idempotency_key}")
+    return Response(TransactionSerializer(existing_transaction).data, status=status.HTTP_200_OK)
+
+
+@async_api_view()
+async def balance(request, user_id):
     """Get balance for a user"""
     try:
         # Users can only view their own balance unless they're admin
         if not request.user.is_staff and request.user.id != user_id:
-            return Response(
+            return json_response(
                 {'error': 'You do not have permission to view this balance'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        user = request.user if not request.user.is_staff else request.user.__class__.objects.get(id=user_id)
-        account = Account.objects.get(user=user)
-        
-        # Try cache first
-        cache_key = f'balance_{account.id}'
-        cached_balance = cache.get(cache_key)
-        if cached_balance:
-            return Response(cached_balance)
+        # The engine publishes every committed balance, so this is normally a cache hit
+        if request.user.is_staff:
+            user, cached_balance = await asyncio.gather(
+                get_user_model().objects.aget(id=user_id),
+                aget_cached_balance(user_id)
+            )
+        else:
+            user, cached_balance = await asyncio.gather(aload_user(request.user), aget_cached_balance(user_id))
+        if cached_balance is not None:
+            user_data = await sync_to_async(lambda: UserSerializer(user).data)()
+            return json_response({**cached_balance, 'user': user_data, 'user_id': user.id})
         
+        account = await Account.objects.aget(user_id=user.id)
+        balance = await atotal_balance(account)
         serializer = BalanceSerializer({
             'account_id': account.id,
-            'balance': account.balance,
+            'balance': balance,
             'currency': account.currency,
             'user': user,
             'user_id': user.id
         })
+        data = await sync_to_async(lambda: serializer.data)()
         
-        # Cache for 30 seconds
-        cache.set(cache_key, serializer.data, 30)
-        return Response(serializer.data)
+        # Ignored if a newer balance was published while this one was read
+        await acache_balance(account, balance)
+        return json_response(data)
     except Exception as e:
         logger.error(f"Error fetching balance: {str(e)}")
-        return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+        return json_response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-@ratelimit(key='user', rate='200/h', method='GET')
-def transaction_history(request, user_id):
+@async_api_view()
+async def transaction_history(request, user_id):
     """Get transaction history for a user"""
     try:
         # Users can only view their own transactions unless they're admin
         if not request.user.is_staff and request.user.id != user_id:
-            return Response(
+            return json_response(
                 {'error': 'You do not have permission to view this history'},
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        user = request.user if not request.user.is_staff else request.user.__class__.objects.get(id=user_id)
-        account = Account.objects.get(user=user)
+        # The caller's own account id comes with the authenticated principal
+        account_id = getattr(request.user, 'account_id', None) if request.user.id == user_id else None
+        if account_id is None:
+            account_id = await Account.objects.filter(user_id=user_id).values_list('id', flat=True).aget()
         
-        # Try cache first
-        cache_key = f'transactions_{account.id}_{request.query_params.get("page", 1)}'
-        cached_transactions = cache.get(cache_key)
-        if cached_transactions:
-            return Response(cached_transactions)
+        page_size = _page_size(request)
+        cursor = request.GET.get('cursor')
+
+        # Cached for 60 seconds; after an invalidation only one request rebuilds the page
+        cache_key = await aaccount_key(account_id, f'transactions_{cursor or "first"}_{page_size}')
+        response_data = await sync_to_async(cached_call)(
+            cache_key, partial(history.page, account_id, cursor, page_size), timeout=60, prefix='transactions'
+        )
+        return json_response(response_data)
+    except (InvalidCursor, ValueError) as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error fetching transaction history: {str(e)}")
+        return json_response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+@async_api_view()
+async def dashboard(request):
+    """Get the profile, balance, recent transactions and monthly totals of the current user"""
+    try:
+        page_size = _page_size(request)
+
+        # The account id comes with the authenticated principal
+        account_id = getattr(request.user, 'account_id', None)
+        if account_id is None:
+            account_id = await Account.objects.filter(user_id=request.user.id).values_list('id', flat=True).aget()
+
+        # Cached until the next write to the account or change to the user
+        cache_key = await user_dashboard.acache_key(account_id, request.user.id, page_size)
+        response_data = await sync_to_async(cached_call)(
+            cache_key, partial(user_dashboard.build, account_id, page_size),
+            timeout=user_dashboard.CACHE_TTL, prefix='dashboard'
+        )
+        return json_response(response_data)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error fetching dashboard: {str(e)}")
+        return json_response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+
+
+def _stream_user(request):
+    """
+    Authenticated user of an event stream request, or None.
+
+    Browsers' EventSource cannot set headers, so the JWT access token may also
+    be passed as `?token=`; session authentication works as well.
+    """
+    authentication = CachedJWTAuthentication()
+    try:
+        token = request.GET.get('token')
+        if token:
+            return authentication.get_user(authentication.get_validated_token(token.encode()))
+        authenticated = authentication.authenticate(request)
+        if authenticated:
+            return authenticated[0]
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return request.user if request.user.is_authenticated else None
+
+
+@require_GET
+def event_stream(request):
+    """Stream balance and transaction updates (and activity for admins) as server-sent events"""
+    user = _stream_user(request)
+    if user is None or not user.is_active:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid'}, status=401)
+    
+    channels = [events.user_channel(user.id)]
+    if user.is_staff:
+        channels.append(events.ADMIN_CHANNEL)
+    
+    # Under ASGI the stream is a coroutine on the event loop instead of a blocked thread
+    content = events.astream(channels) if isinstance(request, ASGIRequest) else events.stream(channels)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    logger.info(f"Event stream opened for user {user.id}")
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def statement(request, user_id):
+    """Get the ledger statement (entries with running balances) for a user"""
+    try:
+        # Users can only view their own statement unless they're admin
+        if not request.user.is_staff and request.user.id != user_id:
+            return Response(
+                {'error': 'You do not have permission to view this statement'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        account = Account.objects.get(user_id=user_id)
         
-        # Get all transactions where user's account is involved
-        transactions = Transaction.objects.filter(
-            Q(source_account=account) | Q(destination_account=account)
-        ).order_by('-created_at')
+        page_size = _page_size(request)
+        date_from = parse_datetime_param(request.query_params.get('from'), 'from')
+        date_to = parse_datetime_param(request.query_params.get('to'), 'to')
         
-        serializer = TransactionSerializer(transactions, many=True)
-        response_data = serializer.data
+        # The transaction may have been archived, so its type is looked up in either table
+        entries = LedgerEntry.objects.filter(account=account).annotate(
+            transaction_type=archive.transaction_column('transaction_type')
+        )
+        if date_from:
+            entries = entries.filter(created_at__gte=date_from)
+        if date_to:
+            entries = entries.filter(created_at__lt=date_to)
         
-        # Cache for 60 seconds
-        cache.set(cache_key, response_data, 60)
+        page = paginate(entries, cursor=request.query_params.get('cursor'), page_size=page_size)
+        
+        response_data = {
+            'account_id': account.id,
+            'currency': account.currency,
+            'next': page['next'],
+            'previous': page['previous'],
+            'page_size': page_size,
+            'results': LedgerEntrySerializer(page['results'], many=True).data,
+        }
+        if date_from:
+            response_data['opening_balance'] = str(ledger.balance_as_of(account, date_from))
+        if date_to:
+            response_data['closing_balance'] = str(ledger.balance_as_of(account, date_to))
         return Response(response_data)
+    except (InvalidCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        logger.error(f"Error fetching transaction history: {str(e)}")
+        logger.error(f"Error fetching statement: {str(e)}")
         return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-@ratelimit(key='user', rate='50/h', method='POST')
+@idempotent('deposit')
 def deposit(request):
     """Simulate a deposit"""
     serializer = DepositSerializer(data=request.data)
@@ -113,20 +274,16 @@ def deposit(request):
     try:
         # Get account and verify ownership
         account = Account.objects.get(id=account_id)
-        if not request.user.is_staff and account.user != request.user:
+        if not request.user.is_staff and account.user_id != request.user.id:
             return Response(
                 {'error': 'You do not have permission to deposit to this account'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check for existing transaction with same idempotency key
-        existing_transaction = Transaction.objects.filter(idempotency_key=idempotency_key).first()
-        if existing_transaction:
-            logger.info(f"Idempotent request detected for key: {idempotency_key}")
-            return Response(TransactionSerializer(existing_transaction).data, status=status.HTTP_200_OK)
-
         with transaction.atomic():
-            account = Account.objects.select_for_update().get(id=account_id)
+            # Hot accounts take credits on a shard row, everyone else locks the account
+            if not account.is_hot:
+                account = Account.objects.select_for_update().get(id=account_id)
             
             # Create transaction record
             trans = Transaction.objects.create(
@@ -139,14 +296,21 @@ def deposit(request):
             )
 
             # Update account balance
-            account.balance += amount
-            account.save()
+            if account.is_hot:
+                credit_shard(account, amount)
+            else:
+                account.balance += amount
+                account.balance_version += 1
+                account.save()
+            ledger.post(trans, credit_account=account, credit_balance=None if account.is_hot else account.balance)
 
-            # Invalidate balance cache
-            cache.delete(f'balance_{account.id}')
+            # Publish the new balance once committed
+            publish_balance(account)
             # Invalidate transaction history cache (will be regenerated on next request)
-            from core.utils import invalidate_cache_pattern
-            invalidate_cache_pattern(f'transactions_{account.id}_*')
+            invalidate_accounts(account.id)
+
+            ledger_stats.record_transaction('DEPOSIT', wallets_delta=amount)
+            events.transactions_changed(trans.id)
 
             logger.info(f"Deposit completed: {amount} to account {account_id} by user {request.user.id}")
             return Response(TransactionSerializer(trans).data, status=status.HTTP_201_CREATED)
@@ -154,6 +318,14 @@ def deposit(request):
     except Account.DoesNotExist:
         logger.error(f"Account not found: {account_id}")
         return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+    except IntegrityError as e:
+        replay = _replay_transaction(
+            request, idempotency_key, 'DEPOSIT', amount=amount, destination_account_id=account_id
+        )
+        if replay:
+            return replay
+        logger.error(f"Deposit failed: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
         logger.error(f"Deposit failed: {str(e)}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -161,7 +333,7 @@ def deposit(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-@ratelimit(key='user', rate='30/h', method='POST')
+@idempotent('transfer')
 def transfer(request):
     """Internal transfer between accounts"""
     serializer = TransferSerializer(data=request.data)
@@ -176,22 +348,18 @@ def transfer(request):
     try:
         # Get source account and verify ownership
         source_account = Account.objects.get(id=source_account_id)
-        if not request.user.is_staff and source_account.user != request.user:
+        if not request.user.is_staff and source_account.user_id != request.user.id:
             return Response(
                 {'error': 'You do not have permission to transfer from this account'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check for existing transaction with same idempotency key
-        existing_transaction = Transaction.objects.filter(idempotency_key=idempotency_key).first()
-        if existing_transaction:
-            logger.info(f"Idempotent request detected for key: {idempotency_key}")
-            return Response(TransactionSerializer(existing_transaction).data, status=status.HTTP_200_OK)
-
         with transaction.atomic():
-            # Lock both accounts
-            source_account = Account.objects.select_for_update().get(id=source_account_id)
-            destination_account = Account.objects.select_for_update().get(id=destination_account_id)
+            # Lock both accounts, hot destinations are credited on a shard without a lock
+            source_account = lock_for_debit(source_account_id)
+            destination_account = Account.objects.get(id=destination_account_id)
+            if not destination_account.is_hot:
+                destination_account = Account.objects.select_for_update().get(id=destination_account_id)
 
             # Check sufficient balance
             if source_account.balance < amount:
@@ -214,9 +382,21 @@ def transfer(request):
 
             # Update balances atomically
             source_account.balance -= amount
-            destination_account.balance += amount
+            source_account.balance_version += 1
             source_account.save()
-            destination_account.save()
+            if destination_account.is_hot:
+                credit_shard(destination_account, amount)
+            else:
+                destination_account.balance += amount
+                destination_account.balance_version += 1
+                destination_account.save()
+            ledger.post(
+                trans,
+                debit_account=source_account,
+                debit_balance=source_account.balance,
+                credit_account=destination_account,
+                credit_balance=None if destination_account.is_hot else destination_account.balance
+            )
 
             # Create transfer request record
             TransferRequest.objects.create(
@@ -227,12 +407,12 @@ def transfer(request):
                 transaction=trans
             )
 
-            # Invalidate cache for both accounts
-            cache.delete(f'balance_{source_account.id}')
-            cache.delete(f'balance_{destination_account.id}')
-            from core.utils import invalidate_cache_pattern
-            invalidate_cache_pattern(f'transactions_{source_account.id}_*')
-            invalidate_cache_pattern(f'transactions_{destination_account.id}_*')
+            # Publish both balances once committed and invalidate the rest of their cache
+            publish_balance(source_account, destination_account)
+            invalidate_accounts(source_account.id, destination_account.id)
+
+            ledger_stats.record_transaction('TRANSFER')
+            events.transactions_changed(trans.id)
 
             logger.info(f"Transfer completed: {amount} from {source_account_id} to {destination_account_id} by user {request.user.id}")
             return Response(TransactionSerializer(trans).data, status=status.HTTP_201_CREATED)
@@ -240,16 +420,222 @@ def transfer(request):
     except Account.DoesNotExist:
         logger.error(f"Account not found")
         return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+    except IntegrityError as e:
+        replay = _replay_transaction(
+            request, idempotency_key, 'TRANSFER', amount=amount,
+            source_account_id=source_account_id, destination_account_id=destination_account_id
+        )
+        if replay:
+            return replay
+        logger.error(f"Transfer failed: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
         logger.error(f"Transfer failed: {str(e)}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _batch_item_key(batch_key, index):
+    """Idempotency key of a single line inside a batch transfer."""
+    return f"{batch_key}{BATCH_LINE_SEPARATOR}{index}"
+
+
+def _batch_index(trans):
+    """Index of a batch line within its batch."""
+    return int(trans.idempotency_key.rsplit(BATCH_LINE_SEPARATOR, 1)[1])
+
+
+def _batch_results(transactions):
+    """Per-item results for a batch, in the order the items were submitted."""
+    return [
+        {
+            'index': _batch_index(trans),
+            'transaction_id': str(trans.id),
+            'destination_account_id': trans.destination_account_id,
+            'amount': str(trans.amount),
+            'status': trans.status,
+        }
+        for trans in sorted(transactions, key=_batch_index)
+    ]
+
+
+def _same_batch(transactions, source_account_id, items):
+    """Whether the written lines of a batch are the ones requested."""
+    lines = sorted(transactions, key=_batch_index)
+    return len(lines) == len(items) and all(
+        trans.source_account_id == source_account_id
+        and trans.destination_account_id == item['destination_account_id']
+        and trans.amount == item['amount']
+        for trans, item in zip(lines, items)
+    )
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-@ratelimit(key='user', rate='20/h', method='POST')
+@idempotent('batch_transfer')
+def batch_transfer(request):
+    """Transfer from one source account to many destinations in a single atomic batch"""
+    serializer = BatchTransferSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    source_account_id = serializer.validated_data['source_account_id']
+    items = serializer.validated_data['transfers']
+    batch_key = serializer.validated_data['idempotency_key']
+
+    try:
+        # Get source account and verify ownership
+        source_account = Account.objects.get(id=source_account_id)
+        if not request.user.is_staff and source_account.user_id != request.user.id:
+            return Response(
+                {'error': 'You do not have permission to transfer from this account'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        # The whole batch shares one idempotency key, each line is stored as "<key>#<index>"
+        item_keys = [_batch_item_key(batch_key, index) for index in range(len(items))]
+
+        # Validate every destination up front, before any lock is taken
+        destination_ids = {item['destination_account_id'] for item in items}
+        destinations = Account.objects.filter(id__in=destination_ids).values_list('id', 'user_id', 'is_hot', 'shard_count')
+        found_ids = set()
+        hot_accounts = {}
+        for account_id, owner_id, is_hot, shard_count in destinations:
+            found_ids.add(account_id)
+            if is_hot and account_id != source_account_id:
+                hot_accounts[account_id] = Account(id=account_id, user_id=owner_id, is_hot=True, shard_count=shard_count)
+        missing = {
+            index: 'Destination account not found'
+            for index, item in enumerate(items)
+            if item['destination_account_id'] not in found_ids
+        }
+        if missing:
+            return Response({'transfers': missing}, status=status.HTTP_400_BAD_REQUEST)
+
+        total_amount = sum((item['amount'] for item in items), Decimal('0.00'))
+        credits = {}
+        for item in items:
+            credits[item['destination_account_id']] = credits.get(item['destination_account_id'], Decimal('0.00')) + item['amount']
+
+        with transaction.atomic():
+            # Lock the source and all non-hot destinations in one query, in id order to avoid deadlocks
+            accounts = {
+                account.id: account
+                for account in Account.objects.select_for_update().filter(
+                    id__in=(destination_ids - hot_accounts.keys()) | {source_account_id}
+                ).order_by('id')
+            }
+            source_account = accounts[source_account_id]
+            if source_account.is_hot and fold_shards(source_account):
+                source_account.save(update_fields=['balance', 'updated_at'])
+
+            # Check sufficient balance for the whole batch
+            if source_account.balance < total_amount:
+                logger.warning(f"Insufficient balance for batch transfer: account {source_account_id}")
+                return Response(
+                    {'error': 'Insufficient balance'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            metadata = {'simulated': True, 'user_id': request.user.id, 'batch_key': batch_key}
+            transactions = Transaction.objects.bulk_create([
+                Transaction(
+                    transaction_type='TRANSFER',
+                    amount=item['amount'],
+                    source_account=source_account,
+                    destination_account_id=item['destination_account_id'],
+                    status='COMPLETED',
+                    idempotency_key=item_keys[index],
+                    metadata=metadata,
+                )
+                for index, item in enumerate(items)
+            ], batch_size=1000)
+
+            # Double-entry postings, with each account's running balance after every line
+            running = {account_id: account.balance for account_id, account in accounts.items()}
+            entries = []
+            for trans in transactions:
+                running[source_account_id] -= trans.amount
+                entries.append(ledger.entry(trans, 'DEBIT', source_account, running[source_account_id]))
+                destination_id = trans.destination_account_id
+                if destination_id in hot_accounts:
+                    entries.append(ledger.entry(trans, 'CREDIT', hot_accounts[destination_id]))
+                else:
+                    running[destination_id] += trans.amount
+                    entries.append(ledger.entry(trans, 'CREDIT', accounts[destination_id], running[destination_id]))
+            LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+            # Update balances atomically
+            now = timezone.now()
+            source_account.balance -= total_amount
+            for account_id, credit in credits.items():
+                if account_id in hot_accounts:
+                    credit_shard(hot_accounts[account_id], credit)
+                else:
+                    accounts[account_id].balance += credit
+            for account in accounts.values():
+                account.balance_version += 1
+                account.updated_at = now
+            Account.objects.bulk_update(accounts.values(), ['balance', 'balance_version', 'updated_at'], batch_size=1000)
+
+            # Create transfer request records
+            TransferRequest.objects.bulk_create([
+                TransferRequest(
+                    source_account=source_account,
+                    destination_account_id=trans.destination_account_id,
+                    amount=trans.amount,
+                    status='COMPLETED',
+                    transaction=trans
+                )
+                for trans in transactions
+            ], batch_size=1000)
+
+            # Publish every touched balance once committed and invalidate the rest of their cache
+            publish_balance(*accounts.values(), *hot_accounts.values())
+            invalidate_accounts(*(accounts.keys() | hot_accounts.keys()))
+
+            ledger_stats.record_transaction('TRANSFER', count=len(transactions))
+            events.transactions_changed(*[trans.id for trans in transactions])
+
+            logger.info(f"Batch transfer completed: {total_amount} from {source_account_id} to {len(items)} destinations by user {request.user.id}")
+            return Response({
+                'idempotency_key': batch_key,
+                'source_account_id': source_account_id,
+                'count': len(transactions),
+                'total_amount': str(total_amount),
+                'results': _batch_results(transactions),
+            }, status=status.HTTP_201_CREATED)
+
+    except Account.DoesNotExist:
+        logger.error(f"Account not found: {source_account_id}")
+        return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+    except IntegrityError as e:
+        # Lines of this batch were already written (e.g. the stored response expired)
+        existing_transactions = list(Transaction.objects.filter(idempotency_key__in=item_keys))
+        if existing_transactions and not _same_batch(existing_transactions, source_account_id, items):
+            return Response(
+                {'error': 'This idempotency key has already been used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if existing_transactions:
+            logger.info(f"Idempotent batch request detected for key: {batch_key}")
+            return Response({
+                'idempotency_key': batch_key,
+                'source_account_id': source_account_id,
+                'count': len(existing_transactions),
+                'results': _batch_results(existing_transactions),
+            }, status=status.HTTP_200_OK)
+        logger.error(f"Batch transfer failed: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except Exception as e:
+        logger.error(f"Batch transfer failed: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent('withdraw')
 def withdraw(request):
-    """Simulate a withdrawal"""
+    """Accept a withdrawal; the payout is sent by the process_withdrawals workers"""
     serializer = WithdrawalSerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -261,20 +647,14 @@ def withdraw(request):
     try:
         # Get account and verify ownership
         account = Account.objects.get(id=account_id)
-        if not request.user.is_staff and account.user != request.user:
+        if not request.user.is_staff and account.user_id != request.user.id:
             return Response(
                 {'error': 'You do not have permission to withdraw from this account'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Check for existing transaction with same idempotency key
-        existing_transaction = Transaction.objects.filter(idempotency_key=idempotency_key).first()
-        if existing_transaction:
-            logger.info(f"Idempotent request detected for key: {idempotency_key}")
-            return Response(TransactionSerializer(existing_transaction).data, status=status.HTTP_200_OK)
-
         with transaction.atomic():
-            account = Account.objects.select_for_update().get(id=account_id)
+            account = lock_for_debit(account_id)
 
             # Check sufficient balance
             if account.balance < amount:
@@ -284,156 +664,149 @@ def withdraw(request):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Simulate external system processing (90% success rate)
-            import random
-            external_success = random.random() > 0.1  # 90% success
-
-            if external_success:
-                # Create transaction record
-                trans = Transaction.objects.create(
-                    transaction_type='WITHDRAWAL',
-                    amount=amount,
-                    source_account=account,
-                    status='COMPLETED',
-                    idempotency_key=idempotency_key,
-                    metadata={'simulated': True, 'external_success': True, 'user_id': request.user.id}
-                )
-
-                # Update account balance
-                account.balance -= amount
-                account.save()
+            # Create transaction record, it completes once the payout is confirmed
+            trans = Transaction.objects.create(
+                transaction_type='WITHDRAWAL',
+                amount=amount,
+                source_account=account,
+                status='PENDING',
+                idempotency_key=idempotency_key,
+                metadata={'user_id': request.user.id}
+            )
 
-                # Create withdrawal record
-                withdrawal = Withdrawal.objects.create(
-                    account=account,
-                    amount=amount,
-                    status='COMPLETED',
-                    transaction=trans,
-                    external_reference=f"EXT-{idempotency_key[:8]}"
-                )
+            # Reserve the funds, a failed payout refunds them
+            account.balance -= amount
+            account.balance_version += 1
+            account.save()
+            ledger.post(trans, debit_account=account, debit_balance=account.balance)
 
-                # Invalidate cache
-                cache.delete(f'balance_{account.id}')
-                from core.utils import invalidate_cache_pattern
-                invalidate_cache_pattern(f'transactions_{account.id}_*')
+            # Create withdrawal record and queue the payout in the same commit
+            withdrawal = Withdrawal.objects.create(
+                account=account,
+                amount=amount,
+                status='PENDING',
+                transaction=trans
+            )
+            payouts.enqueue(withdrawal)
 
-                logger.info(f"Withdrawal completed: {amount} from account {account_id} by user {request.user.id}")
-                return Response(TransactionSerializer(trans).data, status=status.HTTP_201_CREATED)
-            else:
-                # Simulate external system failure
-                trans = Transaction.objects.create(
-                    transaction_type='WITHDRAWAL',
-                    amount=amount,
-                    source_account=account,
-                    status='FAILED',
-                    idempotency_key=idempotency_key,
-                    metadata={'simulated': True, 'external_success': False, 'reason': 'External system failure', 'user_id': request.user.id}
-                )
+            # Publish the new balance once committed
+            publish_balance(account)
+            invalidate_accounts(account.id)
 
-                withdrawal = Withdrawal.objects.create(
-                    account=account,
-                    amount=amount,
-                    status='FAILED',
-                    transaction=trans,
-                    external_reference=None
-                )
+            ledger_stats.record_transaction('WITHDRAWAL', wallets_delta=-amount)
+            events.transactions_changed(trans.id)
 
-                logger.warning(f"Withdrawal failed: external system error for account {account_id}")
-                return Response(
-                    {'error': 'Withdrawal failed: external system error', 'transaction': TransactionSerializer(trans).data},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            logger.info(f"Withdrawal accepted: {amount} from account {account_id} by user {request.user.id}")
+            return Response(TransactionSerializer(trans).data, status=status.HTTP_202_ACCEPTED)
 
     except Account.DoesNotExist:
         logger.error(f"Account not found: {account_id}")
         return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+    except IntegrityError as e:
+        replay = _replay_transaction(
+            request, idempotency_key, 'WITHDRAWAL', amount=amount, source_account_id=account_id
+        )
+        if replay:
+            return replay
+        logger.error(f"Withdrawal failed: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
         logger.error(f"Withdrawal failed: {str(e)}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['GET'])
-@permission_classes([IsAdminUser])
-@ratelimit(key='user', rate='200/h', method='GET')
-def admin_stats(request):
+@async_api_view(admin=True)
+async def admin_stats(request):
     """Get admin dashboard statistics"""
     try:
-        # Try cache first
-        cache_key = 'admin_stats'
-        cached_stats = cache.get(cache_key)
-        if cached_stats:
-            return Response(cached_stats)
-        
-        from users.models import User
-        total_users = User.objects.count()
-        total_wallets_value = Account.objects.aggregate(
-            total=Sum('balance')
-        )['total'] or Decimal('0.00')
-        
-        total_transfers = Transaction.objects.filter(transaction_type='TRANSFER').count()
-        total_withdrawals = Transaction.objects.filter(transaction_type='WITHDRAWAL').count()
-        total_deposits = Transaction.objects.filter(transaction_type='DEPOSIT').count()
-        total_transactions = Transaction.objects.count()
-
-        serializer = AdminStatsSerializer({
-            'total_users': total_users,
-            'total_wallets_value': total_wallets_value,
-            'total_transfers': total_transfers,
-            'total_withdrawals': total_withdrawals,
-            'total_deposits': total_deposits,
-            'total_transactions': total_transactions,
-        })
-        
-        # Cache for 5 minutes
-        cache.set(cache_key, serializer.data, 300)
-        return Response(serializer.data)
+        # Counters are maintained by the engine, so this is a single small read
+        serializer = AdminStatsSerializer(await ledger_stats.aread())
+        return json_response(serializer.data)
     except Exception as e:
         logger.error(f"Error fetching admin stats: {str(e)}")
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return json_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
-@ratelimit(key='user', rate='200/h', method='GET')
 def admin_transactions(request):
-    """Get all transactions for admin dashboard"""
+    """Search all transactions for admin dashboard"""
     try:
-        transactions = Transaction.objects.all().order_by('-created_at')
-        
         # Pagination
-        page_size = int(request.query_params.get('page_size', 50))
-        page = int(request.query_params.get('page', 1))
+        page_size = _page_size(request)
+        cursor = request.query_params.get('cursor')
+        count_mode = request.query_params.get('count', 'estimate')
+        if count_mode not in ('exact', 'estimate', 'none'):
+            return Response(
+                {'error': 'count must be one of exact, estimate or none'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Filtering
-        transaction_type = request.query_params.get('type')
-        status_filter = request.query_params.get('status')
-        user_id = request.query_params.get('user_id')
+        # Filtering, every filter is served by an index on the live and archive tables
+        filters = search.parse(request.query_params)
+        querysets = search.querysets(Transaction, filters)
+        archived_querysets = search.querysets(ArchivedTransaction, filters)
         
-        if transaction_type:
-            transactions = transactions.filter(transaction_type=transaction_type)
-        if status_filter:
-            transactions = transactions.filter(status=status_filter)
-        if user_id:
-            try:
-                account = Account.objects.get(user_id=user_id)
-                transactions = transactions.filter(
-                    Q(source_account=account) | Q(destination_account=account)
-                )
-            except Account.DoesNotExist:
-                pass
+        page = paginate(
+            [TransactionRowSerializer.rows(queryset) for queryset in querysets],
+            cursor=cursor, page_size=page_size,
+            archive=[TransactionRowSerializer.rows(queryset) for queryset in archived_querysets],
+            archived_until=archive.archived_until
+        )
         
-        # Pagination
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_transactions = transactions[start:end]
+        if count_mode == 'exact':
+            count = sum(queryset.count() for queryset in querysets + archived_querysets)
+        elif count_mode == 'estimate':
+            count = sum(estimate_count(queryset) for queryset in querysets + archived_querysets)
+        else:
+            count = None
         
-        serializer = TransactionSerializer(paginated_transactions, many=True)
         return Response({
-            'count': transactions.count(),
-            'page': page,
+            'count': count,
+            'count_mode': count_mode,
+            'next': page['next'],
+            'previous': page['previous'],
             'page_size': page_size,
-            'results': serializer.data
+            'results': TransactionRowSerializer.serialize(page['results'])
         })
+    except (InvalidCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         logger.error(f"Error fetching admin transactions: {str(e)}")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_export_transactions(request):
+    """Stream the transaction ledger as CSV or NDJSON for audits"""
+    try:
+        file_format = request.query_params.get('file_format', 'csv')
+        gzip = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+        if file_format not in export.FORMATS:
+            return Response(
+                {'error': f"file_format must be one of {', '.join(export.FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        querysets = export.export_querysets(
+            date_from=parse_datetime_param(request.query_params.get('from'), 'from'),
+            date_to=parse_datetime_param(request.query_params.get('to'), 'to'),
+            transaction_type=request.query_params.get('type'),
+            status=request.query_params.get('status'),
+        )
+        
+        # Under ASGI a synchronous body would be read into memory before the first byte is sent
+        stream = export.astream if isinstance(request._request, ASGIRequest) else export.stream
+        response = StreamingHttpResponse(
+            stream(querysets, file_format=file_format, gzip=gzip),
+            content_type=export.content_type(file_format, gzip)
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export.filename(file_format, gzip)}"'
+        logger.info(f"Transaction export ({file_format}) started by user {request.user.id}")
+        return response
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Error exporting transactions: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
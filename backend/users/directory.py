@@ -0,0 +1,102 @@
+"""
+User directory for picking a transfer recipient.
+
+`search` matches a case-insensitive prefix of the username, email or phone
+number and returns a minimal projection of active users that have an
+account: id, display name, masked email and account id. Each field is
+searched on its own, in the order of its LOWER(field) index (migration
+0003), and capped, so a lookup reads at most `limit` index entries per field
+however many users there are.
+
+The prefix is matched as a range in byte order (SQLite's default, COLLATE
+"C" on PostgreSQL), which the same index serves for the filter and the
+ordering. Short prefixes are what every typeahead asks for first and match
+the most users; their results are cached for CACHE_TTL seconds.
+"""
+from functools import partial
+from django.db import connection
+from django.db.models.functions import Collate, Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+from core.utils import cached_call, make_key
+from .models import User
+
+FIELDS = ('username', 'email', 'phone_number')
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_RESULTS = 10
+MAX_RESULTS = 20
+
+# Prefixes up to this length are cached
+CACHED_PREFIX_LENGTH = 4
+CACHE_TTL = 30
+
+
+def mask_email(email):
+    """'j***@example.com' for 'jane@example.com'."""
+    local, at, domain = (email or '').partition('@')
+    if not at:
+        return ''
+    return f'{local[:1]}***@{domain}'
+
+
+def _entry(row):
+    name = f"{row['first_name']} {row['last_name']}".strip()
+    return {
+        'id': row['id'],
+        'display_name': name or row['username'],
+        'email': mask_email(row['email']),
+        'account_id': row['account__id'],
+    }
+
+
+def _key(field):
+    """LOWER(field) in byte order, the expression the directory indexes are built on."""
+    if connection.vendor == 'postgresql':
+        return Collate(Lower(field), 'C')
+    return Lower(field)
+
+
+def _matches(field, prefix, limit):
+    key = _key(field)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return list(
+        User.objects.filter(is_active=True, account__isnull=False)
+        .filter(GreaterThanOrEqual(key, prefix), LessThan(key, upper))
+        .order_by(key)
+        .values('id', 'username', 'first_name', 'last_name', 'email', 'account__id')[:limit]
+    )
+
+
+def _search(prefix, limit):
+    entries = {}
+    for field in FIELDS:
+        if field == 'phone_number' and not (prefix[0].isdigit() or prefix[0] == '+'):
+            continue
+        for row in _matches(field, prefix, limit):
+            entries.setdefault(row['id'], _entry(row))
+    # Username matches first, then email, then phone
+    return list(entries.values())[:limit]
+
+
+def search(query, limit=DEFAULT_RESULTS, exclude=None):
+    """
+    Directory entries whose username, email or phone number starts with `query`.
+
+    `exclude` is a user id left out of the results (the caller). Raises
+    ValueError for a query shorter than MIN_QUERY_LENGTH.
+    """
+    prefix = query.strip().lower()
+    if len(prefix) < MIN_QUERY_LENGTH:
+        raise ValueError(f'q must be at least {MIN_QUERY_LENGTH} characters')
+    limit = max(1, min(limit, MAX_RESULTS))
+
+    # One more than asked for, in case the caller is among them
+    if len(prefix) <= CACHED_PREFIX_LENGTH:
+        entries = cached_call(
+            make_key('directory', prefix, limit + 1), partial(_search, prefix, limit + 1),
+            timeout=CACHE_TTL, prefix='directory'
+        )
+    else:
+        entries = _search(prefix, limit + 1)
+    return [entry for entry in entries if entry['id'] != exclude][:limit]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:12
+
+from django.db import migrations
+
+# users.directory.FIELDS when this migration was written
+FIELDS = ('username', 'email', 'phone_number')
+
+
+def _directory_indexes(vendor):
+    """(name, CREATE INDEX statement) of the directory prefix indexes for a database vendor."""
+    indexes = []
+    for field in FIELDS:
+        name = f'users_user_{field}_lower_idx'
+        # Must match the expression users.directory._key compiles to
+        if vendor == 'postgresql':
+            indexes.append((name, f'CREATE INDEX {name} ON users_user ((LOWER({field}) COLLATE "C"))'))
+        elif vendor == 'sqlite':
+            indexes.append((name, f'CREATE INDEX {name} ON users_user (LOWER({field}))'))
+    return indexes
+
+
+def create_directory_indexes(apps, schema_editor):
+    for _, statement in _directory_indexes(schema_editor.connection.vendor):
+        schema_editor.execute(statement)
+
+
+def drop_directory_indexes(apps, schema_editor):
+    for name, _ in _directory_indexes(schema_editor.connection.vendor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_email_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_directory_indexes, drop_directory_indexes),
+    ]
@@ -9,3 +9,8 @@ class User(AbstractBaseModel, AbstractUser):
 
     def __str__(self):
         return self.username
+
+    class Meta(AbstractBaseModel.Meta):
+        indexes = [
+            models.Index(fields=['email']),
+        ]
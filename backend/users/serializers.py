@@ -42,12 +42,16 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for user details."""
     is_staff = serializers.SerializerMethodField()
+
     class Meta:
         model = User
-        fields = "__all__"
-        read_only_fields = ('id', 'date_joined', 'role')
+        # Listed explicitly: the password hash, superuser flag, groups and permissions stay out
+        fields = (
+            'id', 'username', 'email', 'first_name', 'last_name', 'phone_number', 'role',
+            'is_staff', 'is_active', 'date_joined', 'last_login', 'created_at', 'updated_at',
+        )
+        read_only_fields = ('id', 'date_joined', 'role', 'is_active', 'last_login', 'created_at', 'updated_at')
 
-    
     def get_is_staff(self, obj):
         return obj.is_staff
 
@@ -3,13 +3,14 @@ URL configuration for users app.
 """
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import RegisterView, LoginView, UserProfileView, UserListView
+from .views import RegisterView, LoginView, UserListView, profile, user_directory
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
-    path('profile/', UserProfileView.as_view(), name='user-profile'),
+    path('profile/', profile, name='user-profile'),
     path('list/', UserListView.as_view(), name='user-list'),
+    path('directory/', user_directory, name='user-directory'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
 ]
 
@@ -1,15 +1,17 @@
 """
 User authentication and management views.
 """
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from rest_framework import status, generics
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django_ratelimit.decorators import ratelimit
-from django.utils.decorators import method_decorator
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
+from core.async_api import async_api_view, json_response
+from core.authentication import aload_user
+from . import directory
 from .models import User
 from .serializers import UserRegistrationSerializer, UserSerializer, LoginSerializer
 from transactions.models import Account
@@ -19,13 +21,13 @@ class RegisterView(APIView):
     """User registration endpoint."""
     permission_classes = [AllowAny]
 
-    @method_decorator(ratelimit(key='ip', rate='5/m', method='POST'))
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            # Create account for the user
-            Account.objects.get_or_create(user=user)
+            with transaction.atomic():
+                user = serializer.save()
+                # Create account for the user
+                Account.objects.get_or_create(user=user)
             
             # Generate tokens
             refresh = RefreshToken.for_user(user)
@@ -44,7 +46,6 @@ class LoginView(APIView):
     """User login endpoint."""
     permission_classes = [AllowAny]
 
-    @method_decorator(ratelimit(key='ip', rate='10/m', method='POST'))
     def post(self, request):
         serializer = LoginSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
@@ -67,16 +68,49 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user may be a cached principal, updates need the model instance
+        return User.objects.get(pk=self.request.user.pk)
+
+
+@async_api_view()
+async def _read_profile(request):
+    user = await aload_user(request.user)
+    return json_response(await sync_to_async(lambda: UserSerializer(user).data)())
+
+
+_update_profile = sync_to_async(UserProfileView.as_view())
+
+
+async def profile(request):
+    """
+    Profile endpoint. Reads are served asynchronously; updates, OPTIONS and
+    anything else go through UserProfileView.
+    """
+    if request.method in ('GET', 'HEAD'):
+        return await _read_profile(request)
+    return await _update_profile(request)
+
+
+# DRF checks CSRF for session-authenticated updates itself
+profile.csrf_exempt = True
 
 
 class UserListView(generics.ListAPIView):
-    """List all users (for admin panel and transfer destination selection)."""
+    """List all users for the admin panel; customers look recipients up in the directory."""
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAdminUser]
+
 
-    def get_queryset(self):
-        # Allow all authenticated users to see all users (needed for transfers)
-        # Admin users see everyone, regular users can see all users too (frontend filters out self)
-        return User.objects.all()
+@async_api_view()
+async def user_directory(request):
+    """Look up transfer recipients by username, email or phone number prefix"""
+    try:
+        limit = int(request.GET.get('limit', directory.DEFAULT_RESULTS))
+    except ValueError:
+        return json_response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        results = await sync_to_async(directory.search)(request.GET.get('q', ''), limit, exclude=request.user.id)
+    except ValueError as e:
+        return json_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return json_response({'results': results})
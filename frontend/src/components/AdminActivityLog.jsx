@@ -12,7 +12,7 @@ const AdminActivityLog = () => {
   const [filters, setFilters] = useState({
     type: '',
     status: '',
-    page: 1,
+    cursor: null,
     page_size: 100,
   });
 
@@ -39,7 +39,7 @@ const AdminActivityLog = () => {
   };
 
   const handleFilterChange = (key, value) => {
-    setFilters({ ...filters, [key]: value, page: 1 });
+    setFilters({ ...filters, [key]: value, cursor: null });
   };
 
   const getActivityIcon = (type) => {
@@ -123,7 +123,7 @@ const AdminActivityLog = () => {
               <button
                 className="btn btn-secondary"
                 onClick={() =>
-                  setFilters({ type: '', status: '', page: 1, page_size: 100 })
+                  setFilters({ type: '', status: '', cursor: null, page_size: 100 })
                 }
               >
                 Clear Filters
@@ -14,10 +14,11 @@ const AdminDashboard = () => {
     type: '',
     status: '',
     user_id: '',
-    page: 1,
+    cursor: null,
     page_size: 50,
   });
-  const [pagination, setPagination] = useState({ count: 0, page: 1, page_size: 50 });
+  const [page, setPage] = useState(1);
+  const [pagination, setPagination] = useState({ count: 0, next: null, previous: null, page_size: 50 });
 
   useEffect(() => {
     loadData();
@@ -40,7 +41,8 @@ const AdminDashboard = () => {
       setTransactions(Array.isArray(results) ? results : []);
       setPagination({
         count: transactionsData?.count || 0,
-        page: transactionsData?.page || 1,
+        next: transactionsData?.next || null,
+        previous: transactionsData?.previous || null,
         page_size: transactionsData?.page_size || 50,
       });
     } catch (error) {
@@ -70,7 +72,8 @@ const AdminDashboard = () => {
       setTransactions(Array.isArray(results) ? results : []);
       setPagination({
         count: data?.count || 0,
-        page: data?.page || 1,
+        next: data?.next || null,
+        previous: data?.previous || null,
         page_size: data?.page_size || 50,
       });
     } catch (error) {
@@ -82,11 +85,13 @@ const AdminDashboard = () => {
   };
 
   const handleFilterChange = (key, value) => {
-    setFilters({ ...filters, [key]: value, page: 1 });
+    setPage(1);
+    setFilters({ ...filters, [key]: value, cursor: null });
   };
 
-  const handlePageChange = (newPage) => {
-    setFilters({ ...filters, page: newPage });
+  const handlePageChange = (cursor, delta) => {
+    setPage(page + delta);
+    setFilters({ ...filters, cursor });
   };
 
   // Prepare chart data
@@ -302,18 +307,18 @@ const AdminDashboard = () => {
                 <div className="pagination">
                   <button
                     className="btn btn-primary"
-                    disabled={pagination.page === 1}
-                    onClick={() => handlePageChange(pagination.page - 1)}
+                    disabled={!pagination.previous}
+                    onClick={() => handlePageChange(pagination.previous, -1)}
                   >
                     Previous
                   </button>
                   <span>
-                    Page {pagination.page} of {Math.ceil(pagination.count / pagination.page_size)}
+                    Page {page} of {Math.ceil(pagination.count / pagination.page_size)}
                   </span>
                   <button
                     className="btn btn-primary"
-                    disabled={pagination.page >= Math.ceil(pagination.count / pagination.page_size)}
-                    onClick={() => handlePageChange(pagination.page + 1)}
+                    disabled={!pagination.next}
+                    onClick={() => handlePageChange(pagination.next, 1)}
                   >
                     Next
                   </button>
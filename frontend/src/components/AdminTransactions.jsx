@@ -15,10 +15,11 @@ const AdminTransactions = () => {
     type: '',
     status: '',
     user_id: '',
-    page: 1,
+    cursor: null,
     page_size: 50,
   });
-  const [pagination, setPagination] = useState({ count: 0, page: 1, page_size: 50 });
+  const [page, setPage] = useState(1);
+  const [pagination, setPagination] = useState({ count: 0, next: null, previous: null, page_size: 50 });
 
   useEffect(() => {
     loadUsers();
@@ -47,7 +48,8 @@ const AdminTransactions = () => {
       setTransactions(Array.isArray(results) ? results : []);
       setPagination({
         count: data?.count || 0,
-        page: data?.page || 1,
+        next: data?.next || null,
+        previous: data?.previous || null,
         page_size: data?.page_size || 50,
       });
     } catch (error) {
@@ -59,11 +61,13 @@ const AdminTransactions = () => {
   };
 
   const handleFilterChange = (key, value) => {
-    setFilters({ ...filters, [key]: value, page: 1 });
+    setPage(1);
+    setFilters({ ...filters, [key]: value, cursor: null });
   };
 
-  const handlePageChange = (newPage) => {
-    setFilters({ ...filters, page: newPage });
+  const handlePageChange = (cursor, delta) => {
+    setPage(page + delta);
+    setFilters({ ...filters, cursor });
   };
 
   const filteredTransactions = (Array.isArray(transactions) ? transactions : []).filter(
@@ -172,7 +176,8 @@ const AdminTransactions = () => {
               <button
                 className="btn btn-secondary"
                 onClick={() => {
-                  setFilters({ type: '', status: '', user_id: '', page: 1, page_size: 50 });
+                  setPage(1);
+                  setFilters({ type: '', status: '', user_id: '', cursor: null, page_size: 50 });
                   setSearchTerm('');
                 }}
               >
@@ -252,22 +257,19 @@ const AdminTransactions = () => {
               <div className="pagination">
                 <button
                   className="btn btn-primary"
-                  disabled={pagination.page === 1}
-                  onClick={() => handlePageChange(pagination.page - 1)}
+                  disabled={!pagination.previous}
+                  onClick={() => handlePageChange(pagination.previous, -1)}
                 >
                   Previous
                 </button>
                 <span>
-                  Page {pagination.page} of{' '}
+                  Page {page} of{' '}
                   {Math.ceil(pagination.count / pagination.page_size) || 1}
                 </span>
                 <button
                   className="btn btn-primary"
-                  disabled={
-                    pagination.page >=
-                    Math.ceil(pagination.count / pagination.page_size)
-                  }
-                  onClick={() => handlePageChange(pagination.page + 1)}
+                  disabled={!pagination.next}
+                  onClick={() => handlePageChange(pagination.next, 1)}
                 >
                   Next
                 </button>
@@ -1,13 +1,14 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import {
-  getUsers,
+  searchUsers,
   getBalance,
   deposit,
   transfer,
   withdraw,
-  getTransactionHistory,
+  getDashboard,
   registerUser,
+  subscribeToEvents,
 } from '../services/api';
 import Sidebar from './Sidebar';
 import {
@@ -31,6 +32,7 @@ const UserDashboard = () => {
   const { user } = useAuth();
   const [sidebarOpen, setSidebarOpen] = useState(window.innerWidth >= 769);
   const [users, setUsers] = useState([]);
+  const [recipientQuery, setRecipientQuery] = useState('');
   const [balance, setBalance] = useState(null);
   const [transactions, setTransactions] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -56,31 +58,50 @@ const UserDashboard = () => {
   useEffect(() => {
     if (user) {
       loadUserData();
-      loadUsers();
     }
   }, [user]);
 
-  const loadUsers = async () => {
-    try {
-      const data = await getUsers();
-      const usersList = Array.isArray(data) ? data : [];
-      setUsers(usersList.filter((u) => u && u.id !== user?.id));
-    } catch (error) {
-      console.error('Failed to load users for transfer:', error);
+  // Recipient typeahead, looked up once typing pauses
+  useEffect(() => {
+    const query = recipientQuery.trim();
+    if (query.length < 2) {
       setUsers([]);
+      return undefined;
     }
-  };
+    const timer = setTimeout(async () => {
+      setUsers(await searchUsers(query));
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [recipientQuery]);
+
+  // Live balance and transaction updates instead of refetching
+  useEffect(() => {
+    if (!user) return undefined;
+    return subscribeToEvents({
+      balance: (data) => {
+        if (data.balance === null) {
+          getBalance(user.id).then((balanceData) => balanceData && setBalance(balanceData));
+          return;
+        }
+        setBalance((prev) => (prev ? { ...prev, balance: data.balance } : prev));
+      },
+      transaction: (data) => {
+        setTransactions((prev) =>
+          prev.some((t) => t.id === data.id)
+            ? prev.map((t) => (t.id === data.id ? data : t))
+            : [data, ...prev]
+        );
+      },
+    });
+  }, [user]);
 
   const loadUserData = async () => {
     if (!user) return;
     setLoading(true);
     try {
-      const [balanceData, transactionData] = await Promise.all([
-        getBalance(user.id),
-        getTransactionHistory(user.id),
-      ]);
-      setBalance(balanceData);
-      setTransactions(Array.isArray(transactionData) ? transactionData : []);
+      const data = await getDashboard();
+      setBalance(data.balance);
+      setTransactions(Array.isArray(data.transactions?.results) ? data.transactions.results : []);
     } catch (error) {
       showMessage(
         error.response?.data?.error || 'Failed to load account data',
@@ -146,10 +167,10 @@ const UserDashboard = () => {
       const response = await registerUser(userData);
       const newUser = response.user;
 
-      // Reload users list
-      await loadUsers();
-
       if (isFromTransfer) {
+        // Look the new user up so they can be selected as the recipient
+        setRecipientQuery(newUser.username);
+        setUsers(await searchUsers(newUser.username));
         // Automatically select the newly created user for transfer
         setTransferData({
           ...transferData,
@@ -194,9 +215,8 @@ const UserDashboard = () => {
         return;
       }
 
-      const destBalance = await getBalance(destinationUser.id);
       const sourceAccountId = balance?.account_id;
-      const destAccountId = destBalance?.account_id;
+      const destAccountId = destinationUser.account_id;
 
       if (!sourceAccountId || !destAccountId) {
         showMessage('Account not found. Please ensure both accounts exist.', 'error');
@@ -205,6 +225,7 @@ const UserDashboard = () => {
 
       await transfer(sourceAccountId, destAccountId, transferData.amount);
       setTransferData({ destination_user_id: '', amount: '' });
+      setRecipientQuery('');
       setShowTransferModal(false);
       setShowCreateUserForm(false);
       await loadUserData();
@@ -591,6 +612,12 @@ const UserDashboard = () => {
               <form onSubmit={handleTransfer}>
                 <div className="form-group">
                   <label>To User</label>
+                  <input
+                    type="text"
+                    placeholder="Search by username, email or phone..."
+                    value={recipientQuery}
+                    onChange={(e) => setRecipientQuery(e.target.value)}
+                  />
                   <select
                     value={transferData.destination_user_id}
                     onChange={(e) =>
@@ -605,7 +632,7 @@ const UserDashboard = () => {
                     {(Array.isArray(users) ? users : []).map((user) => (
                       user && (
                         <option key={user.id} value={user.id}>
-                          {user.first_name} {user.last_name} ({user.email})
+                          {user.display_name} ({user.email})
                         </option>
                       )
                     ))}
@@ -29,7 +29,7 @@ export const generateIdempotencyKey = () => {
   return `idemp_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
 };
 
-// User APIs (for admin or transfer destination selection)
+// User APIs (admin user list)
 export const getUsers = async () => {
   try {
     const response = await api.get('/auth/list/');
@@ -52,6 +52,17 @@ export const getUsers = async () => {
   }
 };
 
+// Transfer recipient lookup: id, display_name, masked email and account_id of matching users
+export const searchUsers = async (query, limit = 10) => {
+  try {
+    const response = await api.get('/auth/directory/', { params: { q: query, limit } });
+    return response.data?.results || [];
+  } catch (error) {
+    console.error('Error searching users:', error);
+    return [];
+  }
+};
+
 // Register a new user (for creating users during transfers)
 export const registerUser = async (userData) => {
   try {
@@ -74,6 +85,12 @@ export const getBalance = async (userId) => {
   }
 };
 
+// Dashboard: profile, balance, first page of transactions and monthly totals in one request
+export const getDashboard = async () => {
+  const response = await api.get('/dashboard/');
+  return response.data;
+};
+
 // Transaction APIs
 export const deposit = async (accountId, amount) => {
   const response = await api.post('/deposit/', {
@@ -106,13 +123,34 @@ export const withdraw = async (accountId, amount) => {
 export const getTransactionHistory = async (userId) => {
   try {
     const response = await api.get(`/transactions/${userId}/`);
-    return Array.isArray(response.data) ? response.data : [];
+    const data = response.data;
+
+    // Handle cursor-paginated response ({ results, next, previous })
+    if (data && typeof data === 'object' && Array.isArray(data.results)) {
+      return data.results;
+    }
+
+    return Array.isArray(data) ? data : [];
   } catch (error) {
     console.error('Error fetching transaction history:', error);
     return [];
   }
 };
 
+// Live updates (server-sent events): `balance` and `transaction`, plus `activity` for admins.
+// EventSource cannot send headers, so the access token goes in the query string.
+export const subscribeToEvents = (handlers) => {
+  const token = getToken();
+  if (!token || typeof EventSource === 'undefined') {
+    return () => {};
+  }
+  const source = new EventSource(`${API_URL}/events/?token=${encodeURIComponent(token)}`);
+  Object.entries(handlers).forEach(([event, handler]) => {
+    source.addEventListener(event, (e) => handler(JSON.parse(e.data)));
+  });
+  return () => source.close();
+};
+
 // Admin APIs
 export const getAdminStats = async () => {
   try {
@@ -130,7 +168,7 @@ export const getAdminTransactions = async (filters = {}) => {
     if (filters.type) params.append('type', filters.type);
     if (filters.status) params.append('status', filters.status);
     if (filters.user_id) params.append('user_id', filters.user_id);
-    if (filters.page) params.append('page', filters.page);
+    if (filters.cursor) params.append('cursor', filters.cursor);
     if (filters.page_size) params.append('page_size', filters.page_size);
 
     const response = await api.get(`/admin/transactions/?${params.toString()}`);
@@ -138,7 +176,7 @@ export const getAdminTransactions = async (filters = {}) => {
     
     // Handle both direct array and paginated response
     if (Array.isArray(data)) {
-      return { results: data, count: data.length, page: 1, page_size: data.length };
+      return { results: data, count: data.length, next: null, previous: null, page_size: data.length };
     }
     
     // Handle paginated response
@@ -146,15 +184,16 @@ export const getAdminTransactions = async (filters = {}) => {
       return {
         results: Array.isArray(data.results) ? data.results : [],
         count: data.count || 0,
-        page: data.page || 1,
+        next: data.next || null,
+        previous: data.previous || null,
         page_size: data.page_size || 50,
       };
     }
     
-    return { results: [], count: 0, page: 1, page_size: 50 };
+    return { results: [], count: 0, next: null, previous: null, page_size: 50 };
   } catch (error) {
     console.error('Error fetching admin transactions:', error);
-    return { results: [], count: 0, page: 1, page_size: 50 };
+    return { results: [], count: 0, next: null, previous: null, page_size: 50 };
   }
 };
 